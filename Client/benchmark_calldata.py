@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+
+import eth_wrapper
+from benchmark_common import load_contract, require_eth_tester
+from eth_wrapper import RepositoryContractWrapper, pack_files
+from tests.fakes import LocalChain
+from unixfs_hash import hash_bytes
+from web3 import Web3
+
+# Compares the ';' separated string commit format against the packed format
+# taken by MakeCommitPacked. The size of the calldata and the gas it costs are
+# worked out offline, if a node is given or --local the gas used by both kinds
+# of commit is measured on a freshly deployed repository as well
+
+# Gas charged for each byte of transaction data
+ZERO_BYTE_GAS = 4
+NONZERO_BYTE_GAS = 16
+
+
+def make_files(count):
+    file_paths = [f"./src/module{i // 50}/file{i}.py" for i in range(count)]
+    ipfs_hashes = [hash_bytes(f"contents of file {i}\n".encode()) for i in range(count)]
+    return file_paths, ipfs_hashes
+
+
+def calldata_gas(data):
+    data = bytes.fromhex(data[2:])
+    return sum(ZERO_BYTE_GAS if byte == 0 else NONZERO_BYTE_GAS for byte in data), len(data)
+
+
+def encode_commits(contract, file_paths, ipfs_hashes):
+    string_data = contract.encodeABI(fn_name="MakeCommit", args=[0, 0, "benchmark", ";".join(file_paths), ";".join(ipfs_hashes)])
+    packed_data = contract.encodeABI(fn_name="MakeCommitPacked", args=[0, 0, False, 0, "benchmark", pack_files(file_paths, ipfs_hashes)])
+    return string_data, packed_data
+
+
+def measure_gas(conn_url, private_key, file_paths, ipfs_hashes):
+    """Return the gas used by the same commit in both formats"""
+    repo = RepositoryContractWrapper.deploy_new_repository(conn_url, private_key, "benchmark")
+    functions = repo._repo_contract.functions
+
+    receipt = repo._send_transaction(functions.MakeCommit(0, 0, "benchmark", ";".join(file_paths), ";".join(ipfs_hashes)))
+    string_gas = receipt.gasUsed
+
+    receipt = repo._send_transaction(functions.MakeCommitPacked(0, repo.most_recent_commit(0), False, 0, "benchmark", pack_files(file_paths, ipfs_hashes)))
+    packed_gas = receipt.gasUsed
+
+    return string_gas, packed_gas
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--files", type=int, nargs="+", default=[1, 10, 50, 100], help="The numbers of files to commit")
+parser.add_argument("--url", help="The url of an ethereum node to measure the gas used by real commits on, uses VCS_PRIVATE_KEY")
+parser.add_argument("--local", action="store_true", help="Measure the gas used by real commits on an in-process chain instead, needs eth-tester")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    private_key = os.getenv("VCS_PRIVATE_KEY")
+    if args.local:
+        require_eth_tester()
+        chain = LocalChain(0)
+        chain.install()
+        load_contract()
+        args.url, private_key = "in-process", chain.private_key
+
+    contract = Web3().eth.contract(abi=eth_wrapper.contract_abi)
+
+    print("files  format   calldata bytes  calldata gas  bytes/file  gas used")
+    for count in args.files:
+        file_paths, ipfs_hashes = make_files(count)
+        string_data, packed_data = encode_commits(contract, file_paths, ipfs_hashes)
+
+        gas_used = ("-", "-")
+        if args.url:
+            gas_used = measure_gas(args.url, private_key, file_paths, ipfs_hashes)
+
+        for name, data, used in (("string", string_data, gas_used[0]), ("packed", packed_data, gas_used[1])):
+            gas, size = calldata_gas(data)
+            print(f"{count:>5}  {name:<7}  {size:>14}  {gas:>12}  {size / count:>10.1f}  {used:>8}")
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import threading
+
+import ipfs_cluster
+from benchmark_common import timed
+from tests.fakes import StubPeer
+from transfer import DEFAULT_WORKERS, run_transfers
+from unixfs_hash import hash_bytes
+
+# Starts stub ipfs peers and a stub cluster REST API on local ports and reads
+# the same files through 1 peer, then 2 and so on, reporting how the throughput
+# grows with the number of peers. Each stub answers a limited number of requests
+# at a time after a fixed latency, like a daemon with limited bandwidth
+
+
+def read_all(peers, ipfs_hashes, workers):
+    """Read every file through the given peers, one client for each thread"""
+    local = threading.local()
+
+    def cat(ipfs_hash):
+        if getattr(local, "client", None) is None:
+            local.client = ipfs_cluster.ClusterClient([p.address for p in peers], [])
+        return b"".join(local.client.cat(ipfs_hash, stream=True))
+
+    return run_transfers(cat, ipfs_hashes, workers=workers)
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--peers", type=int, default=3, help="The number of stub ipfs peers")
+parser.add_argument("--files", type=int, default=200, help="The number of files read")
+parser.add_argument("--size", type=int, default=64 * 1024, help="The size of each file in bytes")
+parser.add_argument("--latency", type=float, default=0.02, help="Seconds each peer takes to answer a request")
+parser.add_argument("--capacity", type=int, default=2, help="The number of requests a peer answers at the same time")
+parser.add_argument("--jobs", type=int, default=DEFAULT_WORKERS, help="The number of files read at the same time")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    store = {}
+    for _ in range(args.files):
+        data = os.urandom(args.size)
+        store[hash_bytes(data)] = data
+    ipfs_hashes = list(store)
+
+    peers = [StubPeer(store, args.latency, args.capacity) for _ in range(args.peers)]
+
+    for count in range(1, args.peers + 1):
+        timed(f"{count} peer(s)", args.files, "files", lambda: read_all(peers[:count], ipfs_hashes, args.jobs))
+        print(f"requests per peer {[p.requests for p in peers[:count]]}")
+        for peer in peers:
+            peer.requests = 0
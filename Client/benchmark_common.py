@@ -0,0 +1,66 @@
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from hexbytes import HexBytes
+
+try:
+    import eth_tester
+except ImportError:
+    # Only the in-process chain needs it, the client itself doesn't use it
+    eth_tester = None
+
+import eth_wrapper
+
+# Helpers shared by the benchmark scripts
+
+MEGABYTE = 1024 * 1024
+
+
+def peak_memory_mib():
+    # ru_maxrss is in kilobytes on Linux, files are hashed in worker processes so they are included too
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return round(peak / 1024, 1)
+
+
+def timed(name, amount, unit, function):
+    """Run function and print how long it took, how many units of amount it got
+    through a second and the peak memory used so far. Returns its result"""
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<16} {amount:>10.1f} {unit:<5} {elapsed:>8.2f} s  {amount / elapsed:>10.1f} {unit}/s  peak {peak_memory_mib():>7.1f} MiB")
+    return result
+
+
+CONTRACT_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Contracts", "VCS.sol")
+
+
+def load_contract():
+    """Have the wrapper deploy VCS.sol as it is in the tree when solc is
+    installed, otherwise the build in Contracts/target. Exits if the contract
+    deployed wouldn't match the ABI"""
+    if shutil.which("solc") is not None:
+        with tempfile.TemporaryDirectory() as build_dir:
+            subprocess.run(["solc", "--abi", "--bin", CONTRACT_SOURCE, "-o", build_dir], check=True)
+            with open(os.path.join(build_dir, "Repository.abi"), "r") as infile:
+                eth_wrapper.contract_abi = json.load(infile)
+            with open(os.path.join(build_dir, "Repository.bin"), "r") as infile:
+                eth_wrapper.contract_bin = infile.read()
+    else:
+        print(f"solc not found, deploying {eth_wrapper.CONTRACT_BIN_FILEPATH}")
+
+    missing = eth_wrapper.missing_functions(HexBytes(eth_wrapper.contract_bin))
+    if missing:
+        sys.exit(f"The contract doesn't implement {', '.join(missing)}. Install solc or rebuild it with Contracts/build.sh")
+
+
+def require_eth_tester():
+    """Exit with instructions when eth-tester isn't installed"""
+    if eth_tester is None:
+        sys.exit("This benchmark needs eth-tester, install it with pip install -r requirements-dev.txt")
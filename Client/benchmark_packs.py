@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import shutil
+import tempfile
+
+from benchmark_common import timed
+from file_packs import group_files, read_pack, upload_pack
+from transfer import DEFAULT_WORKERS, ipfs_connection, run_transfers
+from unixfs_hash import hash_files
+
+# Uploads and downloads a tree of tiny files through the local ipfs daemon, once
+# with a request for every file the way they were sent before packing and once in
+# packs the way commit and fetch send them now, reporting the time taken by each.
+# That both ways give back the same contents is checked by tests/test_file_packs.py
+
+
+def generate(directory, count, size):
+    filepaths = []
+    for i in range(count):
+        filepath = os.path.join(directory, f"dir{i // 100}", f"file{i}.txt")
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with open(filepath, "wb") as outfile:
+            outfile.write(os.urandom(size))
+        filepaths.append(filepath)
+    return filepaths
+
+
+def download_files(ipfs_hashes, workers):
+    return run_transfers(lambda h: ipfs_connection().cat(h), ipfs_hashes, workers=workers)
+
+
+def download_packs(packs, workers):
+    def download(pack):
+        data = ipfs_connection().cat(pack)
+        return [data[offset:offset + size] for _, offset, size in read_pack(pack)]
+
+    return [data for files in run_transfers(download, packs, workers=workers) for data in files]
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--files", type=int, default=10000, help="The number of files to commit")
+parser.add_argument("--size", type=int, default=200, help="The size of each file in bytes")
+parser.add_argument("--jobs", type=int, default=DEFAULT_WORKERS, help="The number of files or packs transferred at the same time")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        filepaths = generate(directory, args.files, args.size)
+        ipfs_hashes = hash_files(filepaths)
+
+        timed("upload files", args.files, "files", lambda: run_transfers(lambda f: ipfs_connection().add(f)["Hash"], filepaths, workers=args.jobs))
+        groups = group_files([(f, h, args.size) for f, h in zip(filepaths, ipfs_hashes)])
+        packs = timed("upload packs", args.files, "files", lambda: run_transfers(upload_pack, groups, workers=args.jobs))
+
+        timed("download files", args.files, "files", lambda: download_files(ipfs_hashes, args.jobs))
+        timed("download packs", args.files, "files", lambda: download_packs(packs, args.jobs))
+        print(f"{len(packs)} packs")
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# Runs whole workflows of the client against an in-process chain and ipfs node,
+# so they can be timed without a node, a daemon or a network. A synthetic
+# repository is created and pushed, given a long history, forked into branches
+# that are merged back, logged, cloned and checked out. For each operation the
+# wall time, JSON-RPC requests and calls, gas, ipfs requests and bytes, and peak
+# memory are reported, and written as JSON so that runs on different revisions
+# can be compared with --compare. The contract is compiled from VCS.sol when
+# solc is installed, so the numbers are for the contract as it is in the tree.
+# Needs eth-tester with the py-evm backend, which the client itself doesn't use:
+#
+#     pip install -r requirements-dev.txt
+
+from benchmark_common import MEGABYTE, load_contract, peak_memory_mib, require_eth_tester
+
+require_eth_tester()
+
+BENCHMARK_DIR = tempfile.mkdtemp(prefix="vcs-benchmark-")
+
+# Read when the blob cache is imported, the benchmark must not touch the user's cache
+os.environ["VCS_CACHE_DIR"] = os.path.join(BENCHMARK_DIR, "cache")
+
+import transfer
+import vcs
+from blob_cache import BlobCache
+from tests.fakes import LocalChain, LocalIPFS
+
+class Recorder(object):
+    """Collects the totals for each named operation over every time it runs"""
+    def __init__(self, chain, ipfs):
+        self.chain = chain
+        self.ipfs = ipfs
+        self.operations = {}
+
+
+    def measure(self, name, function, *args):
+        chain_requests, chain_calls, transactions = self.chain.requests, self.chain.calls, len(self.chain.transactions)
+        ipfs_requests, ipfs_bytes = self.ipfs.requests, self.ipfs.transferred_bytes
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = function(*args)
+        elapsed = time.perf_counter() - start
+
+        totals = self.operations.setdefault(name, {
+            "count": 0,
+            "seconds": 0.0,
+            "rpc_requests": 0,
+            "rpc_calls": 0,
+            "transactions": 0,
+            "gas": 0,
+            "ipfs_requests": 0,
+            "ipfs_bytes": 0,
+            "peak_memory_mib": 0,
+        })
+        totals["count"] += 1
+        totals["seconds"] += elapsed
+        totals["rpc_requests"] += self.chain.requests - chain_requests
+        totals["rpc_calls"] += self.chain.calls - chain_calls
+        totals["transactions"] += len(self.chain.transactions) - transactions
+        totals["gas"] += self.chain.gas_used(self.chain.transactions[transactions:])
+        totals["ipfs_requests"] += self.ipfs.requests - ipfs_requests
+        totals["ipfs_bytes"] += self.ipfs.transferred_bytes - ipfs_bytes
+        totals["peak_memory_mib"] = peak_memory_mib()
+
+        return result
+
+
+def write_file(filepath, data):
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    with open(filepath, "wb") as outfile:
+        outfile.write(data)
+
+
+def text(rng, size):
+    return bytes(rng.choices(b"abcdefghijklmnopqrstuvwxyz \n", k=size))
+
+
+def random_bytes(rng, size):
+    return rng.getrandbits(8 * size).to_bytes(size, "little")
+
+
+def generate_tree(rng, args):
+    """Write the text files and binaries of the synthetic repository, returning
+    the text file paths"""
+    filepaths = []
+    for i in range(args.files):
+        # 10 files a directory, 10 directories a level, like a source tree
+        filepath = os.path.join(".", "src", *[f"d{(i // 10 ** level) % 10}" for level in range(3, 0, -1)], f"file{i}.txt")
+        write_file(filepath, text(rng, rng.randint(100, 4000)))
+        filepaths.append(filepath)
+
+    for i in range(args.binaries):
+        write_file(os.path.join(".", "assets", f"binary{i}.bin"), random_bytes(rng, args.binary_size * MEGABYTE))
+
+    return filepaths
+
+
+def modify(rng, filepaths):
+    for filepath in filepaths:
+        with open(filepath, "ab") as outfile:
+            outfile.write(text(rng, rng.randint(10, 200)))
+
+
+def modify_binary(rng, args):
+    # Overwrite a small part in the middle, which content defined chunking keeps to a few chunks
+    filepath = os.path.join(".", "assets", f"binary{rng.randrange(args.binaries)}.bin")
+    with open(filepath, "r+b") as outfile:
+        outfile.seek(rng.randrange(args.binary_size * MEGABYTE))
+        outfile.write(random_bytes(rng, 4096))
+
+
+def run(args):
+    rng = random.Random(args.seed)
+
+    chain = LocalChain(args.rpc_latency)
+    chain.install()
+    ipfs = LocalIPFS(args.ipfs_latency)
+    ipfs.install()
+
+    recorder = Recorder(chain, ipfs)
+    measure = recorder.measure
+    key = chain.private_key
+    threshold = args.chunk_threshold * MEGABYTE if args.chunk_threshold is not None else None
+
+    settings = {"conn_url": "in-process", "jobs": args.jobs}
+
+    # Each command gets a repository of its own, connecting to the contract again as main.py would
+    path = os.path.join(BENCHMARK_DIR, "origin")
+    open_repository = lambda: vcs.Repository(path, key, **settings)
+
+    def push():
+        open_repository().push()
+
+    def commit(message):
+        open_repository().commit(message)
+
+    def branch(name):
+        open_repository().branch(name)
+
+    def checkout(branch_id):
+        open_repository().checkout(branch_id)
+
+    def merge(branch_id):
+        open_repository().merge(branch_id, f"Merge branch {branch_id}")
+
+    def log(limit):
+        open_repository().log(limit)
+
+    def status():
+        open_repository().status()
+
+    origin = measure("init", vcs.Repository.init, path, "benchmark", key, args.tree_manifests, threshold, **settings)
+    os.chdir(path)
+
+    filepaths = generate_tree(rng, args)
+    measure("commit initial", commit, "Initial commit")
+    measure("push initial", push)
+
+    # Branches fork from the first commit so every merge has the whole history between it and the merge base
+    for b in range(args.branches):
+        measure("branch", branch, f"branch{b}")
+
+    # Mainline only changes the first files, each branch has some files of its own at the end
+    mainline_files = filepaths[:len(filepaths) - args.branches * args.changes]
+    for c in range(args.commits):
+        modify(rng, rng.sample(mainline_files, min(args.changes, len(mainline_files))))
+        if args.binaries and c % args.binary_every == 0:
+            modify_binary(rng, args)
+
+        measure("commit", commit, f"Commit {c}")
+        if (c + 1) % args.commits_per_push == 0 or c == args.commits - 1:
+            measure("push", push)
+
+    for b in range(args.branches):
+        start = len(mainline_files) + b * args.changes
+        measure("checkout", checkout, b + 1)
+        modify(rng, filepaths[start:start + args.changes])
+        commit(f"Change branch {b}")
+        push()
+
+        measure("checkout", checkout, 0)
+        measure("merge", merge, b + 1)
+
+    measure("status", status)
+    measure("log 20", log, 20)
+    measure("log all", log, None)
+
+    # A cold clone in a new directory and cache, then switching between branches there. The commands from here on run in the clone
+    path = os.path.join(BENCHMARK_DIR, "clone")
+    settings["blob_cache"] = BlobCache(os.path.join(BENCHMARK_DIR, "clone-cache"))
+
+    measure("clone", vcs.Repository.clone, path, origin.repo_address, key, threshold, **settings)
+    for b in range(args.branches):
+        measure("clone checkout", checkout, b + 1)
+    measure("clone checkout", checkout, 0)
+
+    return recorder.operations
+
+
+def revision():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(operations):
+    print(f"{'operation':<16} {'count':>6} {'seconds':>9} {'rpc reqs':>9} {'rpc calls':>10} {'gas':>13} {'ipfs reqs':>10} {'ipfs MiB':>9} {'peak MiB':>9}")
+    for name, totals in operations.items():
+        print(f"{name:<16} {totals['count']:>6} {totals['seconds']:>9.2f} {totals['rpc_requests']:>9} {totals['rpc_calls']:>10} "
+              f"{totals['gas']:>13} {totals['ipfs_requests']:>10} {totals['ipfs_bytes'] / MEGABYTE:>9.1f} {totals['peak_memory_mib']:>9.1f}")
+
+
+def print_comparison(old, new):
+    """Print how every operation changed since an earlier run"""
+    print(f"\ncompared with {old.get('revision')}")
+    print(f"{'operation':<16} {'seconds':>10} {'rpc calls':>10} {'gas':>10} {'ipfs reqs':>10}")
+    for name, totals in new["operations"].items():
+        if name not in old["operations"]:
+            continue
+        before = old["operations"][name]
+        changes = []
+        for field in ("seconds", "rpc_calls", "gas", "ipfs_requests"):
+            changes.append(f"{(totals[field] - before[field]) / before[field]:>+10.1%}" if before[field] else f"{'-':>10}")
+        print(f"{name:<16} " + " ".join(changes))
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--files", type=int, default=10000, help="The number of text files in the repository")
+parser.add_argument("--commits", type=int, default=1000, help="The number of commits made on mainline after the first")
+parser.add_argument("--changes", type=int, default=10, help="The number of files changed by each commit")
+parser.add_argument("--commits-per-push", type=int, default=10, help="The number of commits queued up before each push")
+parser.add_argument("--branches", type=int, default=5, help="The number of branches forked from the first commit and merged back")
+parser.add_argument("--binaries", type=int, default=4, help="The number of binary files in the repository")
+parser.add_argument("--binary-size", type=int, default=32, help="The size of each binary file in MiB")
+parser.add_argument("--binary-every", type=int, default=10, help="Change a binary file every this many commits")
+parser.add_argument("--chunk-threshold", type=int, default=None, help="Store files larger than this many MiB in content defined chunks")
+parser.add_argument("--tree-manifests", action="store_true", help="Store commits as tree manifests")
+parser.add_argument("--rpc-latency", type=float, default=0.0, help="Seconds each JSON-RPC request takes to reach the chain")
+parser.add_argument("--ipfs-latency", type=float, default=0.0, help="Seconds each ipfs request takes to reach the node")
+parser.add_argument("--jobs", type=int, default=transfer.DEFAULT_WORKERS, help="The number of files transferred at the same time")
+parser.add_argument("--seed", type=int, default=0, help="Seed for the generated contents, runs with the same seed use the same repository")
+parser.add_argument("--output", help="Write the results to this JSON file")
+parser.add_argument("--compare", help="A JSON file written by an earlier run to compare the results with")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    try:
+        load_contract()
+        operations = run(args)
+    finally:
+        os.chdir(os.path.dirname(BENCHMARK_DIR))
+        shutil.rmtree(BENCHMARK_DIR, ignore_errors=True)
+
+    results = {
+        "revision": revision(),
+        "python": sys.version.split()[0],
+        "parameters": vars(args),
+        "operations": operations,
+    }
+
+    print_report(operations)
+
+    if args.output is not None:
+        with open(args.output, "w") as outfile:
+            json.dump(results, outfile, indent=4)
+
+    if args.compare is not None:
+        with open(args.compare, "r") as infile:
+            print_comparison(json.load(infile), results)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+import argparse
+import ipfshttpclient
+import os
+import tempfile
+
+from benchmark_common import MEGABYTE, timed
+from blob_cache import BlobCache
+from transfer import TRANSFER_BUFFER_SIZE
+from unixfs_hash import hash_file
+
+# Uploads a generated file to the local ipfs daemon and downloads it again the
+# same way fetch does, reporting the throughput of each step and the peak memory
+# used by the process. The file is written and read in pieces of the transfer
+# buffer size, so a file larger than the available memory can be used to show
+# that the memory used does not grow with the size of the file. That the file
+# comes back unchanged is checked by tests/test_blob_cache.py
+
+
+def generate(filepath, size, buffer_size):
+    with open(filepath, "wb") as outfile:
+        remaining = size
+        while remaining > 0:
+            outfile.write(os.urandom(min(buffer_size, remaining)))
+            remaining -= buffer_size
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--size", type=int, default=1024, help="The size of the file to transfer in MiB")
+parser.add_argument("--buffer", type=int, default=TRANSFER_BUFFER_SIZE, help="The transfer buffer size in bytes")
+parser.add_argument("--directory", default=tempfile.gettempdir(), help="Where to write the generated and downloaded files")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    size = args.size * MEGABYTE
+
+    source = os.path.join(args.directory, "vcs-benchmark-source")
+    target = os.path.join(args.directory, "vcs-benchmark-target")
+
+    try:
+        timed("generate", args.size, "MiB", lambda: generate(source, size, args.buffer))
+
+        ipfs = ipfshttpclient.connect(chunk_size=args.buffer)
+        ipfshash = timed("upload", args.size, "MiB", lambda: ipfs.add(source)["Hash"])
+
+        # An empty cache so the download comes from ipfs
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = BlobCache(cache_dir, max_bytes=0)
+            timed("download", args.size, "MiB", lambda: cache.cat_to_file(ipfs, ipfshash, target, args.buffer))
+
+        timed("hash", args.size, "MiB", lambda: hash_file(target))
+    finally:
+        for filepath in (source, target):
+            if os.path.exists(filepath):
+                os.remove(filepath)
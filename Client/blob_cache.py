@@ -0,0 +1,198 @@
+import os
+import secrets
+import shutil
+import tempfile
+import threading
+
+from transfer import TRANSFER_BUFFER_SIZE
+
+# The cache is shared between every repository on the machine, the location and
+# size budget (in bytes) can be changed with the following environment variables
+DEFAULT_CACHE_DIR = os.path.join(os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "vcs", "blobs")
+DEFAULT_CACHE_SIZE = 2 * 1024 * 1024 * 1024
+
+CACHE_DIR = os.getenv("VCS_CACHE_DIR") or DEFAULT_CACHE_DIR
+CACHE_SIZE = int(os.getenv("VCS_CACHE_SIZE") or DEFAULT_CACHE_SIZE)
+
+# When the cache grows past its budget, entries are evicted until it is back under this fraction of it
+EVICTION_TARGET = 0.9
+
+
+class BlobCache(object):
+    """On disk store of file contents keyed by their ipfs hash. Since an ipfs
+    hash is derived from the contents, entries never need to be invalidated and
+    the least recently used ones are evicted once max_bytes is exceeded"""
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+        # Worked out from the directory the first time something is added
+        self._total_bytes = None
+
+        # put() can be called from several download threads at once
+        self._lock = threading.Lock()
+
+
+    def _blob_path(self, ipfshash):
+        # Spread the blobs across subdirectories the same way the ipfs flatfs datastore does
+        return os.path.join(self.directory, ipfshash[-2:], ipfshash)
+
+
+    def _scan(self):
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+
+        for root, dirs, files in os.walk(self.directory):
+            for name in files:
+                if name.startswith(".tmp-"):
+                    # Still being written by put()
+                    continue
+
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    # Evicted by another process while we were looking
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+
+    def _evict(self):
+        entries = sorted(self._scan())
+        self._total_bytes = sum(entry[1] for entry in entries)
+
+        target = self.max_bytes * EVICTION_TARGET
+        for _, size, path in entries:
+            if self._total_bytes <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._total_bytes -= size
+
+
+    def path(self, ipfshash):
+        """Return the path of the cached contents for the hash or None if it is not cached"""
+        path = self._blob_path(ipfshash)
+        return path if os.path.exists(path) else None
+
+
+    def get(self, ipfshash):
+        """Return the cached contents for the hash or None if it is not cached"""
+        path = self._blob_path(ipfshash)
+        try:
+            with open(path, "rb") as infile:
+                data = infile.read()
+        except FileNotFoundError:
+            return None
+
+        # The modification time doubles as the last time the entry was used
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+        return data
+
+
+    def put(self, ipfshash, data):
+        if len(data) > self.max_bytes:
+            # Covers the cache being turned off with a budget of 0 as well
+            return
+
+        path = self._blob_path(ipfshash)
+        if os.path.exists(path):
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file first so that other processes never see a partial blob
+        fd, tmppath = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        with os.fdopen(fd, "wb") as outfile:
+            outfile.write(data)
+        os.replace(tmppath, path)
+
+        self._added(len(data))
+
+
+    def put_file(self, ipfshash, filepath, buffer_size=TRANSFER_BUFFER_SIZE):
+        """Add a copy of a file on disk to the cache, without reading all of it into memory"""
+        size = os.path.getsize(filepath)
+        if size > self.max_bytes:
+            return
+
+        path = self._blob_path(ipfshash)
+        if os.path.exists(path):
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        fd, tmppath = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        with os.fdopen(fd, "wb") as outfile, open(filepath, "rb") as infile:
+            shutil.copyfileobj(infile, outfile, buffer_size)
+        os.replace(tmppath, path)
+
+        self._added(size)
+
+
+    def _added(self, size):
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(entry[1] for entry in self._scan())
+            else:
+                self._total_bytes += size
+
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+
+    def cat(self, ipfs, ipfshash):
+        """Read the contents of a file from the cache, falling back to ipfs
+        and caching the result when it is not there"""
+        data = self.get(ipfshash)
+        if data is None:
+            data = ipfs.cat(ipfshash)
+            self.put(ipfshash, data)
+        return data
+
+
+    def cat_to_file(self, ipfs, ipfshash, filepath, buffer_size=TRANSFER_BUFFER_SIZE):
+        """Write the contents of a file to filepath, streaming them from the
+        cache or from ipfs so that at most buffer_size bytes are held in memory.
+        The contents go to a temporary file that is renamed over filepath once
+        complete, so filepath never holds a partial file"""
+        # Not made with mkstemp, the file should get the same permissions as any other file the user creates
+        tmppath = os.path.join(os.path.dirname(filepath), f".tmp-{secrets.token_hex(8)}-{os.path.basename(filepath)}")
+
+        try:
+            with open(tmppath, "xb", buffering=buffer_size) as outfile:
+                try:
+                    infile = open(self._blob_path(ipfshash), "rb")
+                except FileNotFoundError:
+                    infile = None
+
+                if infile is not None:
+                    with infile:
+                        shutil.copyfileobj(infile, outfile, buffer_size)
+                else:
+                    for chunk in ipfs.cat(ipfshash, stream=True):
+                        outfile.write(chunk)
+
+            os.replace(tmppath, filepath)
+        except BaseException:
+            try:
+                os.remove(tmppath)
+            except FileNotFoundError:
+                pass
+            raise
+
+        if infile is not None:
+            try:
+                os.utime(self._blob_path(ipfshash))
+            except FileNotFoundError:
+                pass
+        else:
+            self.put_file(ipfshash, filepath, buffer_size)
@@ -0,0 +1,58 @@
+import io
+
+from ipfshttpclient.exceptions import ErrorResponse
+from transfer import DEFAULT_WORKERS, ipfs_connection, run_transfers
+from unixfs_hash import chunk_file, leaf_block
+
+# Large files can be stored split into content defined chunks. Each chunk is a
+# leaf block of an ordinary unixfs file, and the nodes above the leaves list the
+# chunks in order, so `ipfs cat` on the root reassembles the file the same way it
+# does for a file added normally. An edit only changes the chunks around it, and
+# the blocks of every other chunk are already held by the daemon from the last
+# version, so only the changed chunks and the few nodes listing them are sent
+
+
+def _has_block(cid):
+    try:
+        # Offline so a block the daemon doesn't hold isn't searched for on the network
+        ipfs_connection().block.stat(cid, offline=True)
+        return True
+    except ErrorResponse:
+        return False
+
+
+def _put_block(cid, block):
+    stored = ipfs_connection().block.put(io.BytesIO(block), opts={"format": "v0"})["Key"]
+    if stored != cid:
+        raise ValueError(f"ipfs stored block {cid} as {stored}")
+
+
+def upload_chunked_file(filepath, workers=DEFAULT_WORKERS):
+    """Upload a file as content defined chunks, skipping the chunks ipfs already
+    has. Returns the root CID and the number of bytes of the file that were sent"""
+    root, leaves, parents = chunk_file(filepath)
+
+    present = run_transfers(lambda leaf: _has_block(leaf[2]), leaves, workers=workers)
+    missing = [leaf for leaf, have in zip(leaves, present) if not have]
+
+    def upload_leaf(leaf):
+        offset, length, cid = leaf
+
+        # Read the chunk back rather than holding every chunk of the file in memory
+        with open(filepath, "rb") as infile:
+            infile.seek(offset)
+            block, block_cid = leaf_block(infile.read(length))
+
+        if block_cid != cid:
+            raise ValueError(f"{filepath} changed while it was being uploaded")
+
+        _put_block(cid, block)
+        return length
+
+    sent = sum(run_transfers(upload_leaf, missing, workers=workers))
+    run_transfers(lambda node: _put_block(*node), parents, workers=workers)
+
+    # Blocks put on their own are not pinned, pinning the root keeps every chunk from being garbage collected
+    ipfs_connection().pin.add(root)
+
+    return root, sent
@@ -0,0 +1,158 @@
+import heapq
+import os
+
+from array import array
+
+# Parent links and generation numbers for every commit, kept in flat arrays
+# indexed by commit id and persisted next to .repodata.json. The generation of a
+# commit is 1 more than the largest generation of its parents, so a commit can
+# only be an ancestor of commits with a larger generation than its own
+GRAPH_FILEPATH = "./.repograph"
+
+NO_PARENT = -1
+
+# Flags used while walking down the graph from 2 commits at once
+PARENT1 = 1
+PARENT2 = 2
+STALE = 4
+RESULT = 8
+
+
+class CommitGraph(object):
+    def __init__(self, filepath=GRAPH_FILEPATH):
+        self.filepath = filepath
+
+        self.parent1 = array("q")
+        self.parent2 = array("q")
+        self.generation = array("q")
+
+        if os.path.exists(filepath):
+            with open(filepath, "rb") as infile:
+                data = infile.read()
+
+            # The 3 arrays are stored one after another, each the same length
+            length = len(data) // 3
+            self.parent1.frombytes(data[:length])
+            self.parent2.frombytes(data[length:2 * length])
+            self.generation.frombytes(data[2 * length:])
+
+
+    def __len__(self):
+        return len(self.generation)
+
+
+    def save(self):
+        tmppath = self.filepath + ".tmp"
+        with open(tmppath, "wb") as outfile:
+            outfile.write(self.parent1.tobytes())
+            outfile.write(self.parent2.tobytes())
+            outfile.write(self.generation.tobytes())
+        os.replace(tmppath, self.filepath)
+
+
+    def update(self, mirror):
+        """Add any commits from the metadata mirror that are not in the graph yet"""
+        new_commits = mirror.get_commit_parents(len(self))
+
+        for commit_id, previous, multi_parent, previous2 in new_commits:
+            # The null commit at the start of the repository points back at itself
+            parent1 = previous if commit_id != 0 else NO_PARENT
+            parent2 = previous2 if multi_parent else NO_PARENT
+
+            generation = 1
+            for parent in (parent1, parent2):
+                if parent != NO_PARENT:
+                    generation = max(generation, self.generation[parent] + 1)
+
+            self.parent1.append(parent1)
+            self.parent2.append(parent2)
+            self.generation.append(generation)
+
+        if new_commits:
+            self.save()
+
+
+    def parents(self, commit_id):
+        return [p for p in (self.parent1[commit_id], self.parent2[commit_id]) if p != NO_PARENT]
+
+
+    def _paint_down(self, commit1, commit2):
+        """Walk down from both commits in generation order, marking every commit
+        with which of the 2 it can be reached from. The walk stops once only
+        commits below a common ancestor are left. Returns the flags and the
+        common ancestors that were found, best candidates first"""
+        flags = {}
+        queue = []
+
+        def push(commit_id, new_flags):
+            flags[commit_id] = flags.get(commit_id, 0) | new_flags
+            heapq.heappush(queue, (-self.generation[commit_id], -commit_id, commit_id))
+
+        push(commit1, PARENT1)
+        push(commit2, PARENT2)
+
+        results = []
+        while any(not flags[c] & STALE for _, _, c in queue):
+            _, _, commit_id = heapq.heappop(queue)
+
+            commit_flags = flags[commit_id] & (PARENT1 | PARENT2 | STALE)
+            if commit_flags == PARENT1 | PARENT2:
+                if not flags[commit_id] & RESULT:
+                    flags[commit_id] |= RESULT
+                    results.append(commit_id)
+
+                # Everything below a common ancestor is common as well
+                commit_flags |= STALE
+                flags[commit_id] |= STALE
+
+            for parent in self.parents(commit_id):
+                if flags.get(parent, 0) & commit_flags == commit_flags:
+                    continue
+                push(parent, commit_flags)
+
+        return flags, results
+
+
+    def is_ancestor(self, ancestor, commit_id):
+        """Check whether ancestor can be reached from commit_id by following
+        parent links, a commit counts as its own ancestor"""
+        cutoff = self.generation[ancestor]
+
+        stack = [commit_id]
+        seen = set()
+        while stack:
+            current = stack.pop()
+            if current == ancestor:
+                return True
+            if current in seen or self.generation[current] <= cutoff:
+                continue
+            seen.add(current)
+            stack.extend(self.parents(current))
+
+        return False
+
+
+    def merge_bases(self, commit1, commit2):
+        """Return the lowest common ancestors of 2 commits, the ones that are
+        not an ancestor of any other common ancestor"""
+        if commit1 == commit2:
+            return [commit1]
+
+        _, candidates = self._paint_down(commit1, commit2)
+
+        return [c for c in candidates if not any(other != c and self.is_ancestor(c, other) for other in candidates)]
+
+
+    def merge_base(self, commit1, commit2):
+        """Return the single best common ancestor to use for a 3 way merge"""
+        return max(self.merge_bases(commit1, commit2), key=lambda c: (self.generation[c], c))
+
+
+    def ahead_behind(self, commit1, commit2):
+        """Return how many commits can only be reached from commit1 and how
+        many can only be reached from commit2"""
+        flags, _ = self._paint_down(commit1, commit2)
+
+        ahead = sum(1 for f in flags.values() if f & (PARENT1 | PARENT2) == PARENT1)
+        behind = sum(1 for f in flags.values() if f & (PARENT1 | PARENT2) == PARENT2)
+        return ahead, behind
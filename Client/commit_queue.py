@@ -0,0 +1,72 @@
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+from blob_cache import CACHE_DIR, BlobCache
+
+# Commits are recorded locally and sent to the chain later by push. The queue
+# holds a snapshot of the files of every commit waiting to be pushed, in order,
+# along with the commit the first of them was made on top of. Contents that were
+# new when a commit was recorded are copied into a store outside the working tree
+# so that they can still be uploaded after the files have been changed again
+"""
+{
+    "branch_id": 0,
+    "base_commit_id": 12,
+    "commits": [
+        {"message": "Add hello", "files": {"./hello.txt": "QmT78zSuBmuS4z925WZfrqQ1qHaJ56DQaTfyMUF7F8ff5o"}}
+    ],
+    "blobs": {"QmT78zSuBmuS4z925WZfrqQ1qHaJ56DQaTfyMUF7F8ff5o": 12},
+    "packs": []
+}
+"""
+
+QUEUE_FILEPATH = "./.repoqueue.json"
+
+# Contents waiting to be uploaded are kept next to the blob cache, one store for each working tree of a repository
+QUEUE_BLOB_DIR = os.path.join(os.path.dirname(CACHE_DIR), "queued")
+
+
+def new_queue(branch_id, base_commit_id):
+    return {"branch_id": branch_id, "base_commit_id": base_commit_id, "commits": [], "blobs": {}, "packs": []}
+
+
+def load_queue(root="."):
+    """Return the commit queue of the working tree at root, or None if there
+    are no commits waiting to be pushed"""
+    queue_filepath = os.path.join(root, QUEUE_FILEPATH)
+    if not os.path.exists(queue_filepath):
+        return None
+
+    with open(queue_filepath, "r") as infile:
+        return json.load(infile)
+
+
+def save_queue(queue, root="."):
+    # Written to a temporary file first, push saves its progress after every commit and must never leave half a queue
+    queue_filepath = os.path.join(root, QUEUE_FILEPATH)
+    with open(queue_filepath + ".tmp", "w") as outfile:
+        json.dump(queue, outfile)
+    os.replace(queue_filepath + ".tmp", queue_filepath)
+
+
+def _blob_store_dir(repository_address, root):
+    # Several working trees of the same repository each have a queue of their own
+    tree_key = hashlib.sha1(os.path.abspath(root).encode()).hexdigest()[:16]
+    return os.path.join(QUEUE_BLOB_DIR, repository_address, tree_key)
+
+
+def blob_store(repository_address, root="."):
+    """The store of contents waiting to be uploaded from the working tree at
+    root, nothing is evicted from it"""
+    return BlobCache(_blob_store_dir(repository_address, root), max_bytes=sys.maxsize)
+
+
+def clear_queue(repository_address, root="."):
+    """Remove the queue and its stored contents once every commit has been pushed"""
+    queue_filepath = os.path.join(root, QUEUE_FILEPATH)
+    if os.path.exists(queue_filepath):
+        os.remove(queue_filepath)
+    shutil.rmtree(_blob_store_dir(repository_address, root), ignore_errors=True)
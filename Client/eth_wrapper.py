@@ -1,8 +1,18 @@
 from web3 import Web3, HTTPProvider
+from web3.exceptions import TransactionNotFound
+from web3.logs import DISCARD
+from web3._utils.abi import get_abi_output_types, map_abi_data
+from web3._utils.normalizers import BASE_RETURN_NORMALIZERS
+from hexbytes import HexBytes
+import contextlib
 import pathlib
 import json
+import requests
+import sys
+import time
 from coincurve import PublicKey
 from sha3 import keccak_256
+from unixfs_hash import cid_to_digest, digest_to_cid
 
 CONTRACT_BUILD_DIR = pathlib.Path(__file__).parent.parent.absolute() / "Contracts" / "target"
 
@@ -14,16 +24,131 @@ contract_abi = json.load(open(CONTRACT_ABI_FILEPATH, "r"))
 with open(CONTRACT_BIN_FILEPATH, "r") as infile:
     contract_bin = infile.read()
 
+# The maximum number of calls sent to the node in a single JSON-RPC batch request
+DEFAULT_BATCH_SIZE = 100
+
+# Repositories deployed before the contract had a VERSION constant. They have no
+# per branch indexes and don't support commits spread over several transactions,
+# but every function they do have works the same way so they keep working as before
+LEGACY_CONTRACT_VERSION = 1
+
+# The functions those repositories have, a contract missing any of them is not a repository
+LEGACY_FUNCTIONS = {
+    "AddEditorToBranch(uint256,address)", "ForkNewBranch(string,uint256)", "GetBranchEditors(uint256)",
+    "GetBranchesCount()", "GetCommitsCount()", "GetCommitsCount(uint256)", "GetCommitsFromBranch(uint256)",
+    "GetFilesCount(uint256)", "GetFilesFromCommit(uint256)", "MakeCommit(uint256,uint256,string,string,string)",
+    "MakeCommitMultiParent(uint256,uint256,uint256,string,string,string)", "MostRecentCommitID(uint256)",
+    "RemoveEditorFromBranch(uint256,address)", "SquashMerge(uint256,uint256,string)",
+    "branches(uint256)", "commits(uint256)", "files(uint256)", "name()",
+}
+
+# The first version where forks and squash merges share the files of the commit they copy
+SHARED_FILE_SETS_VERSION = 3
+
+# The first version that takes the files of a commit in the packed format instead of ';' separated strings
+PACKED_FILES_VERSION = 4
+
+# The first version that emits events for new commits, forks and editor changes
+EVENTS_VERSION = 5
+
+# The number of blocks searched by each eth_getLogs request when reading the history
+# backwards, doubled each time a range has no matching events up to the maximum
+LOG_BLOCK_RANGE = 1000
+MAX_LOG_BLOCK_RANGE = 128000
+
+# File paths are prefixed with their length in this many bytes in the packed format
+PACKED_PATH_LENGTH_BYTES = 2
+
+# PUSH1 to PUSH32 are this plus the number of bytes pushed
+PUSH0_OPCODE = 0x5f
+
+# Gas estimates are multiplied by this to leave some headroom in case the state changes before the transaction is mined
+GAS_SAFETY_MARGIN = 1.2
+
+# Commits with more files than this are split across several transactions
+COMMIT_CHUNK_SIZE = 200
+
+# How long to wait for submitted transactions to be mined, and how often to check on them
+RECEIPT_TIMEOUT = 120
+RECEIPT_POLL_INTERVAL = 0.5
+
+
+def pack_files(file_paths, ipfs_hashes):
+    """Encode files in the packed format taken by MakeCommitPacked, each one is
+    the length of its path, the path and the 32 byte digest of its ipfs hash.
+    Returns None if one of the files can't be represented in it"""
+    packed = bytearray()
+    for file_path, ipfs_hash in zip(file_paths, ipfs_hashes):
+        file_path = file_path.encode()
+        digest = cid_to_digest(ipfs_hash)
+
+        if digest is None or len(file_path) >= 1 << (8 * PACKED_PATH_LENGTH_BYTES):
+            return None
+
+        packed += len(file_path).to_bytes(PACKED_PATH_LENGTH_BYTES, "big") + file_path + digest
+
+    return bytes(packed)
+
+
+def missing_functions(code, abi=None):
+    """Return the signatures of the functions in abi, the client's by default,
+    that contract bytecode has no entry for in its dispatcher, which means it
+    was built from a different version of VCS.sol than the ABI"""
+    code = bytes(code)
+    abi = contract_abi if abi is None else abi
+
+    missing = []
+    for entry in abi:
+        if entry["type"] != "function":
+            continue
+
+        signature = f"{entry['name']}({','.join(i['type'] for i in entry['inputs'])})"
+        selector = keccak_256(signature.encode()).digest()[:4].lstrip(b"\0")
+
+        # The dispatcher pushes each selector with the smallest PUSH instruction it fits in
+        if bytes([PUSH0_OPCODE + len(selector)]) + selector not in code:
+            missing.append(signature)
+
+    return missing
+
+
+class ContractBuildError(Exception):
+    """Raised when contract bytecode doesn't implement the ABI the client uses"""
+    pass
+
+
+class TransactionError(Exception):
+    """Raised when one or more submitted transactions failed, were replaced
+    or were not mined in time. receipts holds the receipt of each of them in
+    the order they were submitted, None for those that were not mined"""
+    def __init__(self, message, receipts=()):
+        super().__init__(message)
+        self.receipts = list(receipts)
+
 
 class RepositoryContractWrapper(object):
     """Class that wraps the calls to the solidity smart contract"""
-    def __init__(self, conn_url, private_key):
+    def __init__(self, conn_url, private_key, batch_size=DEFAULT_BATCH_SIZE):
         self.w3 = Web3(HTTPProvider(conn_url))
 
+        self._conn_url = conn_url
+        self._session = requests.Session()
+        self.batch_size = batch_size
+
         self._private_key = private_key
         self._account_address = self.w3.toChecksumAddress(self._private_key_to_address(self._private_key))
         self.repository_address = None
 
+        # Worked out the first time it is needed, see contract_version
+        self._contract_version = None
+
+        # Nonces are handed out locally so that several transactions can be in flight at once
+        self._next_nonce = None
+
+        # Transactions submitted inside pipeline() that have not been confirmed yet
+        self._pipelining = False
+        self._pending = []
+
         # Check that we are actually connected
         assert self.w3.isConnected()
 
@@ -38,19 +163,200 @@ class RepositoryContractWrapper(object):
         return addr.hex()
 
 
-    def _make_transaction(self):
+    @property
+    def account_address(self):
+        """The address of the account transactions are sent from"""
+        return self._account_address
+
+
+    @property
+    def contract_version(self):
+        """The version of the Repository contract this repository was deployed
+        with. Raises ContractBuildError if the deployed code is neither a legacy
+        repository nor has every function of the ABI"""
+        if self._contract_version is None:
+            missing = missing_functions(self.w3.eth.getCode(self.repository_address))
+
+            if not missing:
+                self._contract_version = self._repo_contract.functions.VERSION().call()
+            elif "VERSION()" in missing and not LEGACY_FUNCTIONS.intersection(missing):
+                # Deployed before VERSION was added, these only have the legacy functions
+                self._contract_version = LEGACY_CONTRACT_VERSION
+            else:
+                raise ContractBuildError(f"The contract at {self.repository_address} doesn't match {CONTRACT_ABI_FILEPATH}, it has none of {', '.join(missing)}")
+
+        return self._contract_version
+
+
+    def _take_nonce(self):
+        if self._next_nonce is None:
+            # Include our own transactions that are still waiting in the mempool
+            self._next_nonce = self.w3.eth.getTransactionCount(self._account_address, "pending")
+
+        nonce = self._next_nonce
+        self._next_nonce += 1
+        return nonce
+
+
+    def reset_nonce(self):
+        """Ask the node for the nonce again before the next transaction, for
+        wrappers kept open while the account may be used by other clients"""
+        self._next_nonce = None
+
+
+    def _make_transaction(self, contract_call):
+        # Estimate against the pending state so that transactions queued up in a pipeline are taken into account
+        gas_estimate = contract_call.estimateGas({"from": self._account_address}, "pending")
+
         ret = {
-            "nonce": self.w3.eth.getTransactionCount(account=self._account_address),
-            "gas": 6000000,
-            "gasPrice": self.w3.toWei("50", "gwei")
+            "gas": int(gas_estimate * GAS_SAFETY_MARGIN),
+            "gasPrice": self.w3.eth.gas_price,
+            "nonce": self._take_nonce(),
         }
 
         return ret
 
 
+    def _send_transaction(self, contract_call):
+        """Sign and submit a contract function call or constructor. Outside of
+        pipeline() this waits for the receipt and returns it, inside it the
+        transaction hash is returned straight away"""
+        try:
+            tx = contract_call.buildTransaction(self._make_transaction(contract_call))
+            signed_tx = self.w3.eth.account.signTransaction(tx, self._private_key)
+            tx_hash = self.w3.eth.sendRawTransaction(signed_tx.rawTransaction)
+        except Exception:
+            # The nonce may not have been used, ask the node again next time
+            self._next_nonce = None
+            raise
+
+        self._pending.append((tx_hash, signed_tx.rawTransaction, tx["nonce"]))
+
+        if self._pipelining:
+            return tx_hash
+
+        return self.wait_for_transactions()[0]
+
+
+    def wait_for_transactions(self, timeout=RECEIPT_TIMEOUT):
+        """Wait for every submitted transaction to be mined and return their
+        receipts in the order they were submitted. Transactions that dropped out
+        of the mempool are submitted again"""
+        pending = self._pending
+        self._pending = []
+
+        receipts = [None] * len(pending)
+        errors = [None] * len(pending)
+        deadline = time.time() + timeout
+
+        while True:
+            waiting = False
+            for i, (tx_hash, raw_tx, nonce) in enumerate(pending):
+                if receipts[i] is not None or errors[i] is not None:
+                    continue
+
+                try:
+                    receipts[i] = self.w3.eth.getTransactionReceipt(tx_hash)
+                    if receipts[i].status == 0:
+                        errors[i] = f"transaction {tx_hash.hex()} was reverted"
+                    continue
+                except TransactionNotFound:
+                    pass
+
+                try:
+                    self.w3.eth.getTransaction(tx_hash)
+                except TransactionNotFound:
+                    # Dropped by the node, unless a different transaction has taken its nonce it can be sent again
+                    if self.w3.eth.getTransactionCount(self._account_address, "latest") > nonce:
+                        errors[i] = f"transaction {tx_hash.hex()} was replaced by another transaction with nonce {nonce}"
+                        continue
+                    self.w3.eth.sendRawTransaction(raw_tx)
+
+                waiting = True
+
+            if not waiting:
+                break
+
+            if time.time() > deadline:
+                for i, (tx_hash, _, _) in enumerate(pending):
+                    if receipts[i] is None and errors[i] is None:
+                        errors[i] = f"transaction {tx_hash.hex()} was not mined within {timeout} seconds"
+                break
+
+            time.sleep(RECEIPT_POLL_INTERVAL)
+
+        failures = [error for error in errors if error is not None]
+        if failures:
+            # Nonces after a failed transaction may never be used, start again from what the node knows
+            self._next_nonce = None
+            raise TransactionError("\n".join(failures), receipts)
+
+        return receipts
+
+
+    @contextlib.contextmanager
+    def pipeline(self):
+        """Submit every transaction made inside the with block back to back
+        without waiting for each to be mined, then wait for all of them
+        together when the block ends. The with statement gives a list that
+        their receipts are added to once they have all been mined"""
+        receipts = []
+        self._pipelining = True
+        try:
+            yield receipts
+        finally:
+            self._pipelining = False
+
+        receipts.extend(self.wait_for_transactions())
+
+
+    def _batch_call(self, function_name, args_list):
+        """Call a view function once for each set of arguments in args_list,
+        sending the eth_calls to the node as JSON-RPC batch requests. The
+        results are returned in the same order as args_list"""
+        function_abi = self._repo_contract.get_function_by_name(function_name).abi
+        output_types = get_abi_output_types(function_abi)
+
+        results = []
+        for start in range(0, len(args_list), self.batch_size):
+            batch = args_list[start:start + self.batch_size]
+
+            payload = []
+            for request_id, args in enumerate(batch):
+                call = {
+                    "to": self.repository_address,
+                    "data": self._repo_contract.encodeABI(fn_name=function_name, args=args),
+                }
+                payload.append({"jsonrpc": "2.0", "id": request_id, "method": "eth_call", "params": [call, "latest"]})
+
+            response = self._session.post(self._conn_url, json=payload)
+            response.raise_for_status()
+            responses = response.json()
+
+            if not isinstance(responses, list):
+                # The node rejected the batch as a whole
+                raise ValueError(f"Batch request for {function_name} failed: {responses}")
+
+            # Responses to a batch are allowed to come back in any order
+            for reply in sorted(responses, key=lambda r: r["id"]):
+                if "error" in reply:
+                    raise ValueError(f"Call to {function_name}{tuple(batch[reply['id']])} failed: {reply['error']}")
+
+                output_data = self.w3.codec.decode_abi(output_types, HexBytes(reply["result"]))
+                normalized_data = map_abi_data(BASE_RETURN_NORMALIZERS, output_types, output_data)
+
+                # Match what ContractFunction.call() returns
+                if len(normalized_data) == 1:
+                    results.append(normalized_data[0])
+                else:
+                    results.append(list(normalized_data))
+
+        return results
+
+
     @classmethod
-    def connect_to_repository(cls, conn_url, private_key, repository_address):
-        self = cls(conn_url, private_key)
+    def connect_to_repository(cls, conn_url, private_key, repository_address, batch_size=DEFAULT_BATCH_SIZE):
+        self = cls(conn_url, private_key, batch_size)
 
         self.repository_address = self.w3.toChecksumAddress(repository_address)
 
@@ -60,29 +366,42 @@ class RepositoryContractWrapper(object):
 
 
     @classmethod
-    def deploy_new_repository(cls, conn_url, private_key, repository_name):
-        self = cls(conn_url, private_key)
+    def deploy_new_repository(cls, conn_url, private_key, repository_name, batch_size=DEFAULT_BATCH_SIZE):
+        self = cls(conn_url, private_key, batch_size)
+
+        # Deploying a build of an older VCS.sol would quietly leave the repository without the newer functions
+        missing = missing_functions(HexBytes(contract_bin))
+        if missing:
+            raise ContractBuildError(f"{CONTRACT_BIN_FILEPATH} doesn't match {CONTRACT_ABI_FILEPATH}, it has none of {', '.join(missing)}. Rebuild both with Contracts/build.sh")
 
         # Create a contract object from the bytecode and abi
         self._repo_contract = self.w3.eth.contract(bytecode=contract_bin, abi=contract_abi)
 
-        # Call the contract constructor
-        tx = self._repo_contract.constructor(repository_name).buildTransaction(self._make_transaction())
-        signed_tx = self.w3.eth.account.signTransaction(tx, self._private_key)
-        tx_hash = self.w3.eth.sendRawTransaction(signed_tx.rawTransaction)
-
-
-        # wait for the transaction to be mined
-        tx_receipt = self.w3.eth.waitForTransactionReceipt(tx_hash)
+        # Call the contract constructor and wait for the transaction to be mined
+        tx_receipt = self._send_transaction(self._repo_contract.constructor(repository_name))
 
         # Create a new transaction object with the new deployed contract address
         self._repo_contract = self.w3.eth.contract(address=tx_receipt.contractAddress, abi=contract_abi)
         self.repository_address = tx_receipt.contractAddress
+        self._contract_version = None
 
         return self
 
 
+    def _pack_files(self, file_paths, ipfs_hashes):
+        if self.contract_version < PACKED_FILES_VERSION:
+            return None
+        return pack_files(file_paths, ipfs_hashes)
+
+
     def make_commit(self, file_paths, ipfs_hashes, branch_id, previous_commit, comment=""):
+        files_data = self._pack_files(file_paths, ipfs_hashes)
+
+        if len(file_paths) > COMMIT_CHUNK_SIZE and self.contract_version > LEGACY_CONTRACT_VERSION:
+            return self._make_chunked_commit(file_paths, ipfs_hashes, files_data is not None, branch_id, previous_commit, False, 0, comment)
+
+        if files_data is not None:
+            return self._send_transaction(self._repo_contract.functions.MakeCommitPacked(branch_id, previous_commit, False, 0, comment, files_data))
 
         file_paths = ';'.join(file_paths)
         ipfs_hashes = ';'.join(ipfs_hashes)
@@ -90,42 +409,57 @@ class RepositoryContractWrapper(object):
         MakeCommitFunction = self._repo_contract.get_function_by_name("MakeCommit")
 
         # Make the smart contract Transaction
-        tx = MakeCommitFunction(branch_id, previous_commit, comment, file_paths, ipfs_hashes).buildTransaction(self._make_transaction())
-        signed_tx = self.w3.eth.account.signTransaction(tx, self._private_key)
-        tx_hash = self.w3.eth.sendRawTransaction(signed_tx.rawTransaction)
-
-        tx_receipt = self.w3.eth.waitForTransactionReceipt(tx_hash)
+        return self._send_transaction(MakeCommitFunction(branch_id, previous_commit, comment, file_paths, ipfs_hashes))
 
 
     def make_commit_multiparent(self, file_paths, ipfs_hashes, branch_id, parent1, parent2, comment=""):
+        files_data = self._pack_files(file_paths, ipfs_hashes)
+
+        if len(file_paths) > COMMIT_CHUNK_SIZE and self.contract_version > LEGACY_CONTRACT_VERSION:
+            return self._make_chunked_commit(file_paths, ipfs_hashes, files_data is not None, branch_id, parent1, True, parent2, comment)
+
+        if files_data is not None:
+            return self._send_transaction(self._repo_contract.functions.MakeCommitPacked(branch_id, parent1, True, parent2, comment, files_data))
 
         file_paths = ';'.join(file_paths)
         ipfs_hashes = ';'.join(ipfs_hashes)
 
         # Make the smart contract Transaction
-        tx = self._repo_contract.functions.MakeCommitMultiParent(branch_id, parent1, parent2, comment, file_paths, ipfs_hashes).buildTransaction(self._make_transaction())
-        signed_tx = self.w3.eth.account.signTransaction(tx, self._private_key)
-        tx_hash = self.w3.eth.sendRawTransaction(signed_tx.rawTransaction)
+        return self._send_transaction(self._repo_contract.functions.MakeCommitMultiParent(branch_id, parent1, parent2, comment, file_paths, ipfs_hashes))
 
-        tx_receipt = self.w3.eth.waitForTransactionReceipt(tx_hash)
 
+    def _make_chunked_commit(self, file_paths, ipfs_hashes, packed, branch_id, previous_commit, multi_parent, previous2_commit, comment):
+        """Create a single commit spread across several transactions so that
+        the number of files is not limited by the block gas limit"""
+        functions = self._repo_contract.functions
 
-    def fork_new_branch(self, branch_name, parent):
+        # The commit has to be created first to find out its id
+        receipt = self._send_transaction(functions.BeginCommit(branch_id, previous_commit, multi_parent, previous2_commit, comment))
+        commit_id = self._repo_contract.events.CommitStarted().processReceipt(receipt)[0].args.commitID
 
-        tx = self._repo_contract.functions.ForkNewBranch(branch_name, parent).buildTransaction(self._make_transaction())
-        signed_tx = self.w3.eth.account.signTransaction(tx, self._private_key)
-        tx_hash = self.w3.eth.sendRawTransaction(signed_tx.rawTransaction)
+        # The batches of files don't depend on each other so they can all be in flight at once
+        with self.pipeline():
+            for start in range(0, len(file_paths), COMMIT_CHUNK_SIZE):
+                if packed:
+                    files_data = self._pack_files(file_paths[start:start + COMMIT_CHUNK_SIZE], ipfs_hashes[start:start + COMMIT_CHUNK_SIZE])
+                    self._send_transaction(functions.AddFilesToCommitPacked(commit_id, files_data))
+                    continue
 
-        tx_receipt = self.w3.eth.waitForTransactionReceipt(tx_hash)
+                paths_chunk = ';'.join(file_paths[start:start + COMMIT_CHUNK_SIZE])
+                hashes_chunk = ';'.join(ipfs_hashes[start:start + COMMIT_CHUNK_SIZE])
+                self._send_transaction(functions.AddFilesToCommit(commit_id, paths_chunk, hashes_chunk))
 
+        return self._send_transaction(functions.FinalizeCommit(commit_id))
 
-    def squash_merge(self, parent_branch_id:int, child_branch_id:int, squash_commit_message:str):
 
-        tx = self._repo_contract.functions.SquashMerge(parent_branch_id, child_branch_id, squash_commit_message).buildTransaction(self._make_transaction())
-        signed_tx = self.w3.eth.account.signTransaction(tx, self._private_key)
-        tx_hash = self.w3.eth.sendRawTransaction(signed_tx.rawTransaction)
+    def fork_new_branch(self, branch_name, parent):
+
+        return self._send_transaction(self._repo_contract.functions.ForkNewBranch(branch_name, parent))
+
 
-        tx_receipt = self.w3.eth.waitForTransactionReceipt(tx_hash)
+    def squash_merge(self, parent_branch_id:int, child_branch_id:int, squash_commit_message:str):
+
+        return self._send_transaction(self._repo_contract.functions.SquashMerge(parent_branch_id, child_branch_id, squash_commit_message))
 
     def add_editor_to_branch(self, branch_id, account_address):
         AddEditorToBranch = self._repo_contract.get_function_by_name("AddEditorToBranch")
@@ -133,11 +467,7 @@ class RepositoryContractWrapper(object):
         account_address = self.w3.toChecksumAddress(account_address)
 
         # Make the smart contract Transaction
-        tx = AddEditorToBranch(branch_id, account_address).buildTransaction(self._make_transaction())
-        signed_tx = self.w3.eth.account.signTransaction(tx, self._private_key)
-        tx_hash = self.w3.eth.sendRawTransaction(signed_tx.rawTransaction)
-
-        tx_receipt = self.w3.eth.waitForTransactionReceipt(tx_hash)
+        return self._send_transaction(AddEditorToBranch(branch_id, account_address))
 
     def remove_editor_from_branch(self, branch_id, account_address):
         RemoveEditorFromBranch = self._repo_contract.get_function_by_name("RemoveEditorFromBranch")
@@ -145,11 +475,7 @@ class RepositoryContractWrapper(object):
         account_address = self.w3.toChecksumAddress(account_address)
 
         # Make the smart contract Transaction
-        tx = RemoveEditorFromBranch(branch_id, account_address).buildTransaction(self._make_transaction())
-        signed_tx = self.w3.eth.account.signTransaction(tx, self._private_key)
-        tx_hash = self.w3.eth.sendRawTransaction(signed_tx.rawTransaction)
-
-        tx_receipt = self.w3.eth.waitForTransactionReceipt(tx_hash)
+        return self._send_transaction(RemoveEditorFromBranch(branch_id, account_address))
 
 
     def get_branch(self, id):
@@ -161,7 +487,112 @@ class RepositoryContractWrapper(object):
 
 
     def get_file(self, id):
-        return self._repo_contract.functions.files(id).call()
+        filedata = self._repo_contract.functions.files(id).call()
+
+        if filedata[1] == "":
+            # Added in the packed format, only the digest of the ipfs hash is stored
+            filedata[1] = digest_to_cid(self._repo_contract.functions.fileDigests(id).call())
+
+        return filedata
+
+
+    def get_branches(self, ids):
+        return self._batch_call("branches", [[i] for i in ids])
+
+
+    def get_commits(self, ids):
+        return self._batch_call("commits", [[i] for i in ids])
+
+
+    def get_files(self, ids):
+        files = self._batch_call("files", [[i] for i in ids])
+
+        # Files added in the packed format only store the digest of their ipfs hash
+        packed = [(i, filedata) for i, filedata in zip(ids, files) if filedata[1] == ""]
+        digests = self._batch_call("fileDigests", [[i] for i, _ in packed])
+
+        for (_, filedata), digest in zip(packed, digests):
+            filedata[1] = digest_to_cid(digest)
+
+        return files
+
+
+    def created_commit_ids(self, receipts):
+        """Return the id of the commit each transaction receipt made visible on
+        its branch, read from its CommitCreated event, or None for receipts of
+        transactions that failed or made none. Returns None altogether for
+        contracts that don't emit the events"""
+        if self.contract_version < EVENTS_VERSION:
+            return None
+
+        event = self._repo_contract.events.CommitCreated()
+
+        ids = []
+        for receipt in receipts:
+            logs = event.processReceipt(receipt, errors=DISCARD) if receipt is not None and receipt.status else []
+            ids.append(logs[0].args.commitID if logs else None)
+        return ids
+
+
+    def get_commits_pending(self, ids):
+        if self.contract_version == LEGACY_CONTRACT_VERSION:
+            # Every commit is finalized as soon as it is made
+            return [False for _ in ids]
+        return self._batch_call("pendingCommits", [[i] for i in ids])
+
+
+    def iter_commit_events(self, branch_id=None, author=None, since=None):
+        """Yield (commit_id, commit) for the commits announced by CommitCreated
+        events, newest first, with the commit in the same form as get_commit.
+        The logs are read backwards from the latest block a range of blocks at a
+        time, so the first commits come back without reading the whole history.
+        Commits can be filtered by branch and author, and the search stops at the
+        first commit made before the since timestamp"""
+        event = self._repo_contract.events.CommitCreated
+
+        filters = {}
+        if branch_id is not None:
+            filters["branchID"] = branch_id
+        if author is not None:
+            filters["author"] = self.w3.toChecksumAddress(author)
+
+        first_block = self._repo_contract.functions.deploymentBlock().call()
+        to_block = self.w3.eth.block_number
+        block_range = LOG_BLOCK_RANGE
+
+        while to_block >= first_block:
+            from_block = max(first_block, to_block - block_range + 1)
+            logs = event.getLogs(argument_filters=filters, fromBlock=from_block, toBlock=to_block)
+
+            for log in sorted(logs, key=lambda log: (log.blockNumber, log.logIndex), reverse=True):
+                args = log.args
+                if since is not None and args.creation_time < since:
+                    return
+                yield args.commitID, [args.author, args.branchID, args.comment, args.creation_time, args.previous, args.multi_parent, args.previous2]
+
+            if since is not None and self.w3.eth.get_block(from_block).timestamp < since:
+                return
+
+            if not logs:
+                block_range = min(block_range * 2, MAX_LOG_BLOCK_RANGE)
+            to_block = from_block - 1
+
+
+    def get_branches_editors(self, branch_ids):
+        return self._batch_call("GetBranchEditors", [[i] for i in branch_ids])
+
+
+    def get_files_from_commits(self, commit_ids):
+        return self._batch_call("GetFilesFromCommit", [[i] for i in commit_ids])
+
+
+    def get_file_set_commits(self, commit_ids):
+        """Return the id of the commit each commit's files are stored under, which
+        is the commit itself unless it was made by a fork or squash merge"""
+        if self.contract_version < SHARED_FILE_SETS_VERSION:
+            # Forks and squash merges used to copy every file
+            return list(commit_ids)
+        return self._batch_call("GetFileSetCommit", [[i] for i in commit_ids])
 
 
     def get_branch_count(self):
@@ -196,7 +627,9 @@ class RepositoryContractWrapper(object):
     def get_branch_editors(self, branch_id):
         return self._repo_contract.functions.GetBranchEditors(branch_id).call()
 
-# This is here just for testing
+# Run by Contracts/build.sh to check the files it wrote
 if __name__ == "__main__":
-    print(f"Contract Binary File \'{contract_bin}\'")
-    print(f"Contract Binary File \'{contract_abi}\'")
+    missing = missing_functions(HexBytes(contract_bin))
+    if missing:
+        sys.exit(f"{CONTRACT_BIN_FILEPATH} has none of {', '.join(missing)}")
+    print(f"{CONTRACT_BIN_FILEPATH} implements every function in {CONTRACT_ABI_FILEPATH}")
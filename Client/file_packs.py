@@ -0,0 +1,125 @@
+import io
+
+from transfer import ipfs_connection
+from unixfs_hash import SHA2_256_PREFIX, _varint, cid_to_digest, leaf_block, parent_block, read_file_node
+
+# Small files are uploaded in packs rather than one request and one pin each. A
+# pack is an ordinary unixfs file whose chunks are the small files themselves,
+# each one the same leaf block `ipfs add` would make for it, so every file can
+# still be read by its own hash. The pack is sent as a single CAR file which ipfs
+# imports and pins in one go, and reading the pack returns all of its files one
+# after the other, so fetch can download it once and split it locally using the
+# file sizes listed in the pack's root node.
+#
+# Commits list the packs holding their files as extra entries with paths that can
+# never appear in a working tree. Packs are only used to speed up transfers, a
+# file missing from every pack of a commit is downloaded by its hash as normal
+
+PACK_PATH_PREFIX = "/packs/"
+
+# Files up to this size are packed, they always fit in a single leaf block
+PACK_FILE_SIZE = 64 * 1024
+
+# A pack is closed at this many bytes or files, keeping its root node well inside the block size limit
+PACK_MAX_BYTES = 4 * 1024 * 1024
+PACK_MAX_FILES = 1000
+
+# A pack carried over from an earlier commit, or downloaded whole, needs at least this share of its bytes in use
+PACK_MIN_USED = 0.5
+
+CAR_VERSION = 1
+
+
+def split_packs(files):
+    """Split the [file_path, ipfs_hash, ...] entries of a commit into the files
+    and the hashes of the packs"""
+    packs = [entry[1] for entry in files if entry[0].startswith(PACK_PATH_PREFIX)]
+    return [entry for entry in files if not entry[0].startswith(PACK_PATH_PREFIX)], packs
+
+
+def pack_entries(packs):
+    """Return the file paths and hashes recording a list of packs in a commit"""
+    return [f"{PACK_PATH_PREFIX}{i}" for i in range(len(packs))], list(packs)
+
+
+def group_files(files):
+    """Group (file_path, ipfs_hash, size) tuples into lists of files for each
+    pack, leaving out repeated contents"""
+    groups = [[]]
+    seen = set()
+    size = 0
+    for filepath, ipfs_hash, filesize in files:
+        if ipfs_hash in seen:
+            continue
+        seen.add(ipfs_hash)
+
+        if groups[-1] and (len(groups[-1]) >= PACK_MAX_FILES or size + filesize > PACK_MAX_BYTES):
+            groups.append([])
+            size = 0
+        groups[-1].append((filepath, ipfs_hash))
+        size += filesize
+
+    return [group for group in groups if group]
+
+
+def _cid_bytes(cid):
+    # The binary form of a CIDv0 is its multihash
+    return SHA2_256_PREFIX + cid_to_digest(cid)
+
+
+def _car_header(root):
+    # dag-cbor encoding of {"roots": [root], "version": 1}, CIDs are tag 42 holding a zero byte then the binary CID
+    cid = b"\0" + _cid_bytes(root)
+    header = b"\xa2" + b"\x65roots" + b"\x81\xd8\x2a\x58" + bytes([len(cid)]) + cid + b"\x67version" + bytes([CAR_VERSION])
+    return _varint(len(header)) + header
+
+
+def build_pack(files):
+    """Build a pack from a list of (file_path, ipfs_hash), returning the hash of
+    the pack and the CAR file holding it"""
+    car = io.BytesIO()
+    children = []
+    for filepath, ipfs_hash in files:
+        with open(filepath, "rb") as infile:
+            data = infile.read()
+
+        block, cid = leaf_block(data)
+        if cid != ipfs_hash:
+            raise ValueError(f"{filepath} changed while it was being packed")
+
+        multihash = _cid_bytes(cid)
+        children.append((multihash, len(block), len(data)))
+        car.write(_varint(len(multihash) + len(block)) + multihash + block)
+
+    block, root, _ = parent_block(children)
+    multihash = _cid_bytes(root)
+    car.write(_varint(len(multihash) + len(block)) + multihash + block)
+
+    return root, _car_header(root) + car.getvalue()
+
+
+def upload_pack(files):
+    """Upload a list of (file_path, ipfs_hash) as a single pack, the import pins
+    the pack and with it every file inside it. Returns the hash of the pack"""
+    root, car = build_pack(files)
+    ipfs_connection().dag.imprt(io.BytesIO(car))
+    return root
+
+
+def read_pack(pack):
+    """Return the (ipfs_hash, offset, size) of every file in a pack"""
+    files = []
+    offset = 0
+    for ipfs_hash, size in read_file_node(ipfs_connection().block.get(pack)):
+        files.append((ipfs_hash, offset, size))
+        offset += size
+    return files
+
+
+def pack_size(files):
+    return sum(size for _, _, size in files)
+
+
+def used_size(files, ipfs_hashes):
+    """The number of bytes of a pack taken up by files with the given hashes"""
+    return sum(size for ipfs_hash, _, size in files if ipfs_hash in ipfs_hashes)
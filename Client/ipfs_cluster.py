@@ -0,0 +1,290 @@
+import ipfshttpclient
+import os
+import random
+import requests
+import threading
+import time
+
+from ipfshttpclient.exceptions import CommunicationError, ErrorResponse
+
+# Spreads ipfs requests over several peers, such as the ipfs daemons of the
+# cluster in IPFS-Cluster/, instead of sending them all to the local daemon.
+# Each request goes to the better of 2 peers picked at random, judged by how
+# long their recent requests took and how many they are already handling, so the
+# load follows the peers that answer fastest. A peer that can't be reached or
+# times out is skipped for a while and the request is sent to the next one,
+# streamed downloads carry on from the byte they had got to. Uploaded files are
+# pinned through the cluster REST API so that the cluster keeps the requested
+# number of copies of them:
+#
+#     VCS_IPFS_PEERS=/ip4/127.0.0.1/tcp/5001/http,/ip4/127.0.0.1/tcp/5002/http
+#     VCS_CLUSTER_API=http://127.0.0.1:9094
+#     VCS_REPLICATION=2 (or min:max)
+#
+# Without VCS_IPFS_PEERS the client talks to the local daemon only, as before
+
+IPFS_PEERS = [peer.strip() for peer in (os.getenv("VCS_IPFS_PEERS") or "").split(",") if peer.strip()]
+CLUSTER_APIS = [api.strip().rstrip("/") for api in (os.getenv("VCS_CLUSTER_API") or "").split(",") if api.strip()]
+REPLICATION = os.getenv("VCS_REPLICATION")
+
+# Seconds to wait for a peer to accept a connection and to answer
+CONNECT_TIMEOUT = 2
+READ_TIMEOUT = float(os.getenv("VCS_IPFS_TIMEOUT") or 60)
+
+# How long a peer that failed is left alone before it is tried again
+PEER_RETRY_DELAY = 10
+
+# Weight of the newest request in the running average of a peer's latency
+LATENCY_SMOOTHING = 0.3
+
+# Errors that mean the peer is down or too slow, rather than that the request itself was wrong
+PEER_ERRORS = (CommunicationError, requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError)
+
+
+def configured():
+    return len(IPFS_PEERS) > 0
+
+
+class PeersUnavailable(Exception):
+    """Raised when a request failed on every peer"""
+    def __init__(self, failures):
+        self.failures = failures
+
+        lines = [f"    {peer}: {error!r}" for peer, error in failures]
+        super().__init__("No ipfs peer could handle the request:\n" + "\n".join(lines))
+
+
+class Peer(object):
+    def __init__(self, address):
+        self.address = address
+
+        # Running average in seconds, peers nothing is known about yet are tried first
+        self.latency = 0.0
+        self.active = 0
+        self.down_until = 0.0
+        self.requests = 0
+
+
+    def score(self):
+        return self.latency * (self.active + 1)
+
+
+class PeerSet(object):
+    """The health and latency of a list of peers, shared by every thread"""
+    def __init__(self, addresses):
+        self.peers = [Peer(address) for address in addresses]
+        self._lock = threading.Lock()
+
+
+    def candidates(self):
+        """Return the peers in the order a request should try them. Peers that
+        failed recently come last, in case every other peer fails too"""
+        now = time.monotonic()
+        with self._lock:
+            up = [p for p in self.peers if p.down_until <= now]
+            down = sorted((p for p in self.peers if p.down_until > now), key=lambda p: p.down_until)
+
+            # The better of 2 random choices spreads the load while still avoiding slow peers
+            first = min(random.sample(up, min(2, len(up))), key=Peer.score, default=None)
+            rest = sorted((p for p in up if p is not first), key=Peer.score)
+
+        return ([first] if first is not None else []) + rest + down
+
+
+    def started(self, peer):
+        with self._lock:
+            peer.active += 1
+            peer.requests += 1
+
+
+    def finished(self, peer, elapsed):
+        with self._lock:
+            peer.active -= 1
+            peer.latency += LATENCY_SMOOTHING * (elapsed - peer.latency)
+
+
+    def failed(self, peer, started=True):
+        with self._lock:
+            if started:
+                peer.active -= 1
+            peer.down_until = time.monotonic() + PEER_RETRY_DELAY
+
+
+_peer_sets = {}
+_peer_sets_lock = threading.Lock()
+
+
+def peer_set(addresses):
+    """Return the shared PeerSet of a list of peer addresses"""
+    with _peer_sets_lock:
+        return _peer_sets.setdefault(tuple(addresses), PeerSet(addresses))
+
+
+def _replication_params():
+    if REPLICATION is None:
+        return {}
+
+    minimum, _, maximum = REPLICATION.partition(":")
+    return {"replication-min": int(minimum), "replication-max": int(maximum or minimum)}
+
+
+class _Namespace(object):
+    def __init__(self, client, prefix):
+        self._client = client
+        self._prefix = prefix
+
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self._client._call(f"{self._prefix}.{name}", args, kwargs)
+
+
+class _Pin(_Namespace):
+    def add(self, *cids, **kwargs):
+        if not self._client.cluster_apis:
+            return self._client._call("pin.add", cids, kwargs)
+
+        for cid in cids:
+            self._client.cluster_pin(cid)
+        return {"Pins": list(cids)}
+
+
+class _Dag(_Namespace):
+    def imprt(self, data, **kwargs):
+        result = self._client._call("dag.imprt", (data,), kwargs)
+
+        # The daemon pins the roots of the import itself, the cluster is asked to replicate them
+        for entry in result if isinstance(result, list) else [result]:
+            root = entry.get("Root", {}).get("Cid", {}).get("/")
+            if root is not None and self._client.cluster_apis:
+                self._client.cluster_pin(root)
+        return result
+
+
+class ClusterClient(object):
+    """Stands in for an ipfs client, sending each request to one of several
+    peers. Like an ipfs client, each thread should have its own"""
+    def __init__(self, peers=IPFS_PEERS, cluster_apis=CLUSTER_APIS, chunk_size=None):
+        self.peers = peer_set(peers)
+        self.cluster_apis = cluster_apis
+        self._chunk_size = chunk_size
+
+        self._clients = {}
+        self._session = requests.Session()
+
+        self.block = _Namespace(self, "block")
+        self.dag = _Dag(self, "dag")
+        self.pin = _Pin(self, "pin")
+
+
+    def _client(self, peer):
+        if peer.address not in self._clients:
+            kwargs = {"chunk_size": self._chunk_size} if self._chunk_size is not None else {}
+            self._clients[peer.address] = ipfshttpclient.connect(peer.address, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), **kwargs)
+        return self._clients[peer.address]
+
+
+    def _call_on_peer(self, name, args, kwargs):
+        """Make a request on the first peer able to handle it, returning the
+        result and the peer"""
+        failures = []
+        for peer in self.peers.candidates():
+            # Data being uploaded has to be sent again from the start
+            for arg in args:
+                if hasattr(arg, "seek"):
+                    arg.seek(0)
+
+            try:
+                function = self._client(peer)
+            except PEER_ERRORS as e:
+                self.peers.failed(peer, started=False)
+                failures.append((peer.address, e))
+                continue
+
+            for part in name.split("."):
+                function = getattr(function, part)
+
+            self.peers.started(peer)
+            start = time.monotonic()
+            try:
+                result = function(*args, **kwargs)
+            except ErrorResponse:
+                # The peer is fine, the request was refused
+                self.peers.finished(peer, time.monotonic() - start)
+                raise
+            except PEER_ERRORS as e:
+                self.peers.failed(peer)
+                failures.append((peer.address, e))
+                continue
+
+            self.peers.finished(peer, time.monotonic() - start)
+            return result, peer
+
+        raise PeersUnavailable(failures)
+
+
+    def _call(self, name, args, kwargs):
+        return self._call_on_peer(name, args, kwargs)[0]
+
+
+    def _cat_stream(self, ipfs_hash, offset=0, **kwargs):
+        # A download that breaks off is picked up by another peer from where it stopped
+        received = 0
+        for _ in range(len(self.peers.peers) + 1):
+            chunks, peer = self._call_on_peer("cat", (ipfs_hash,), dict(kwargs, stream=True, offset=offset + received))
+            try:
+                for chunk in chunks:
+                    received += len(chunk)
+                    yield chunk
+                return
+            except ErrorResponse:
+                raise
+            except PEER_ERRORS:
+                self.peers.failed(peer, started=False)
+
+        raise PeersUnavailable([(ipfs_hash, "the download kept breaking off")])
+
+
+    def cat(self, ipfs_hash, stream=False, **kwargs):
+        if stream:
+            return self._cat_stream(ipfs_hash, **kwargs)
+        return self._call("cat", (ipfs_hash,), kwargs)
+
+
+    def add(self, *args, **kwargs):
+        result = self._call("add", args, kwargs)
+        if self.cluster_apis:
+            for entry in result if isinstance(result, list) else [result]:
+                self.cluster_pin(entry["Hash"])
+        return result
+
+
+    def add_bytes(self, data, **kwargs):
+        ipfs_hash = self._call("add_bytes", (data,), kwargs)
+        if self.cluster_apis:
+            self.cluster_pin(ipfs_hash)
+        return ipfs_hash
+
+
+    def cluster_pin(self, cid):
+        """Ask the cluster to pin cid with the configured replication factor"""
+        failures = []
+        for api in self.cluster_apis:
+            try:
+                response = self._session.post(f"{api}/pins/{cid}", params=_replication_params(), timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+                response.raise_for_status()
+                return response.json()
+            except requests.exceptions.RequestException as e:
+                failures.append((api, e))
+
+        raise PeersUnavailable(failures)
+
+
+    def close(self):
+        for client in self._clients.values():
+            client.close()
+        self._clients = {}
+        self._session.close()
+
+
+def connect(chunk_size=None):
+    return ClusterClient(chunk_size=chunk_size)
@@ -1,443 +1,254 @@
 #!/usr/bin/env python3
 
-import ipfshttpclient
-import json
-import sys
 import os
 import argparse
 import datetime
+import itertools
+import profiling
+import tempfile
+import vcs
 
-from eth_wrapper import RepositoryContractWrapper
 from getpass import getpass
-from subprocess import Popen, PIPE
+from transfer import DEFAULT_WORKERS
 
-# Example .repodata.json file
-"""
-{
-    "repo_name": "testing",
-    "repo_address": "0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF"
-    "current_branch_id": 0,
-}
-"""
+# The command line of the client, each subcommand is run by a vcs.Repository
+# for the working tree in the current directory
 
-CONNECTION_ADDRESS = "http://localhost:7545"
+MEGABYTE = 1024 * 1024
 
-current_branch = None
-current_commit = None
+DEFAULT_PROFILE_PATH = os.path.join(tempfile.gettempdir(), "vcs-profile")
 
 
-def fetch(repo: RepositoryContractWrapper, commit_id: int):
-    """Replace the current local files, their contents and the directory
-    structure with the ones specified at the given commit"""
+def list_branches(repository: vcs.Repository):
+    for i, branch in repository.branches():
+        print(f"{i} - {branch[1]} owned by {branch[0]}", file=repository.output)
 
-    for root, dirs, files in os.walk("./"):
-        for name in files:
-            filepath = os.path.join(root, name)
-
-            if filepath == "./.repodata.json":
-                # Don't delete the repodata file - that is going to end badly
-                continue
-
-            os.remove(filepath)
-        for directory in dirs:
-            fulldir = os.path.join(root, directory)
-            os.rmdir(fulldir)
-
-    file_ids = repo.get_files_from_commit(commit_id)
-
-    ipfs = ipfshttpclient.connect()
-
-    for fid in file_ids:
-        filedata = repo.get_file(fid)
-
-        filepath = filedata[0]
-        ipfshash = filedata[1]
-
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        with open(filepath, "wb") as outfile:
-            outfile.write(ipfs.cat(ipfshash))
-
-
-def clone(repo_addr, private_key):
-    repo = RepositoryContractWrapper.connect_to_repository(CONNECTION_ADDRESS, private_key, repo_addr)
-
-    # Get the most recent commit on the branch with id 0 - mainline
-    commit_id = repo.most_recent_commit(0)
-
-    # Update the local files
-    fetch(repo, commit_id)
-
-    # Calculate the current repository data
-    repodata = {
-        "repo_name": repo.get_repository_name(),
-        "repo_address": repo_addr,
-        "current_branch_id": 0,
-        "current_commit_id": commit_id,
-    }
-
-    # Save it to the repodata file
-    with open("./.repodata.json", "w") as repodatafile:
-        json.dump(repodata, repodatafile)
-
-
-
-
-def checkout(repo: RepositoryContractWrapper, branch_id: int):
-    with open("./.repodata.json", "r") as infile:
-        repodata = json.load(infile)
-
-    commit_id = repo.most_recent_commit(branch_id)
-
-    fetch(repo, commit_id)
-
-    repodata["current_branch_id"] = branch_id
-    repodata["current_commit_id"] = commit_id
-
-    with open("./.repodata.json", "w") as outfile:
-        json.dump(repodata, outfile)
-
-
-def make_commit(repo: RepositoryContractWrapper, commit_message: str):
-    ipfs = ipfshttpclient.connect()
-
-    filepaths = []
-    ipfs_hashes = []
-
-    for root, dirs, files in os.walk("./"):
-        for name in files:
-            filepath = os.path.join(root, name)
-
-            if filepath == "./.repodata.json":
-                continue
-
-            print(filepath)
-
-            filepaths.append(filepath)
-            ipfs_hashes.append(ipfs.add(filepath)["Hash"])
-
-    print(f"filepaths = {filepaths}")
-    print(f"ipfs_hashes = {ipfs_hashes}")
-    print(f"current_branch = {current_branch}")
-
-    repo.make_commit(filepaths, ipfs_hashes, current_branch, current_commit, comment=commit_message)
-    commit_id = repo.most_recent_commit(current_branch)
-
-    with open("./.repodata.json", "r") as infile:
-        repodata = json.load(infile)
-
-    repodata["current_commit_id"] = commit_id
-
-    with open("./.repodata.json", "w") as outfile:
-        json.dump(repodata, outfile)
-
-
-def new_branch(repo: RepositoryContractWrapper, branch_name: str):
-    repo.fork_new_branch(branch_name, current_branch)
-
-
-def squash_merge(repo: RepositoryContractWrapper, child_branch, comment):
-    if comment is None:
-        comment = f"Squash Merge From Branch ID {child_branch}"
-    repo.squash_merge(current_branch, child_branch, comment)
-    current_commit = repo.most_recent_commit(current_branch)
-
-
-def get_history(repo: RepositoryContractWrapper, commit_id):
-    commit_list = [commit_id]
-    while True:
-        commit = repo.get_commit(commit_id)
-        commit_list.append(commit[4])
-        if commit[5]:
-            commit_list.append(commit[6])
-        if commit[4] == 0:
-            break
-        commit_id = commit[4]
-    return commit_list
-
-
-def get_all_files_from_commit(repo: RepositoryContractWrapper, commit_id):
-    file_id_list = repo.get_files_from_commit(commit_id)
-    files = []
-    for f in file_id_list:
-        files.append(repo.get_file(f))
-    return files
-
-
-def three_way_merge(repo: RepositoryContractWrapper, child_branch, comment):
-
-    # Get the list of commits on the parent branch
-    parent_head_commit = repo.most_recent_commit(current_branch)
-    parent_head_history = get_history(repo, parent_head_commit)
-
-    # Get the list of commits on the child branch
-    child_head_commit = repo.most_recent_commit(child_branch)
-    child_head_history = get_history(repo, child_head_commit)
-
-    # Find the common ancestor
-    common_ancestor_commit = max(set(parent_head_history) & set(child_head_history))
-
-    # Get the list of file hashes/file paths
-    parent_head_files = get_all_files_from_commit(repo, parent_head_commit)
-    child_head_files = get_all_files_from_commit(repo, child_head_commit)
-    common_ancestor_files = get_all_files_from_commit(repo, common_ancestor_commit)
-
-    # Convert into dictionaries of file_path:ipfs_hash
-    parent_head_files = dict(map(lambda x: x[:2], parent_head_files))
-    child_head_files = dict(map(lambda x: x[:2], child_head_files))
-    common_ancestor_files = dict(map(lambda x: x[:2], common_ancestor_files))
-
-    # list which is going to contain the resulting merge of both commits
-    resulting_files = {}
-
-    merge_conflict = False
-
-    for file in parent_head_files.keys() | child_head_files.keys():
-        parent_hash = parent_head_files.get(file, None)
-        child_hash = child_head_files.get(file, None)
-        ancestor_hash = common_ancestor_files.get(file, None)
-
-        if parent_hash == child_hash:
-            # Both branches are equal here
-            if parent_hash != None:
-                resulting_files[file] = parent_hash
-        elif parent_hash == ancestor_hash and parent_hash != child_hash:
-            # the file has been updated on the child branch but not on the parent branch
-            # we take the updates on the child branch
-            resulting_files[file] = child_hash
-        elif child_hash == ancestor_hash and parent_hash != child_hash:
-            # the file has been updated on the parent branch but not on the child branch
-            # we take the updates on the parent branch
-            resulting_files[file] = parent_hash
-        elif parent_hash != child_hash and parent_hash != ancestor_hash and ancestor_hash != child_hash:
-            # the same file in both parent and child have been updated independantly causing a merge conflict
-
-            ipfs = ipfshttpclient.connect()
-
-            # write the 3 different copies into temp so that the diff3 program can read them
-            with open("/tmp/PARENT", "wb") as outfile:
-                outfile.write(ipfs.cat(parent_hash))
-            with open("/tmp/CHILD", "wb") as outfile:
-                outfile.write(ipfs.cat(child_hash))
-            with open("/tmp/BASE", "wb") as outfile:
-                outfile.write(ipfs.cat(ancestor_hash))
-
-            process = Popen(["diff3", "-m", "/tmp/PARENT", "/tmp/BASE", "/tmp/CHILD"], stdout=PIPE)
-            (output, err) = process.communicate()
-            exit_code = process.wait()
-
-            if exit_code == 0:
-                #diff3 successfully merged the files together
-
-                # upload the merged file to ipfs
-                filehash = ipfs.add_bytes(output)
-
-                # use the merged file hash
-                resulting_files[file] = filehash
-
-                pass
-            elif exit_code == 1:
-                #diff3 could not merge the files together
-                print(f"WARNING: could not resolve conflict in file {file}")
-                merge_conflict=True
-        else:
-            # I've missed something here
-            raise Exception
-
-    # Return early if there has been a merge conflict
-    if merge_conflict == True:
-        print("ERROR: Merge Conflicts Detected. Merge Aborted")
-        return
-
-    # Convert dictionary into 2 lists
-    resulting_files = list(zip(*resulting_files.items()))
-
-    # Create a multi parent commit
-    repo.make_commit_multiparent(resulting_files[0], resulting_files[1], current_branch, parent_head_commit, child_head_commit, comment)
-
-    # Update the directory
-    fetch(repo, repo.most_recent_commit(current_branch))
-
-    print("Merge Completed")
-
-def list_branches(repo: RepositoryContractWrapper):
-    count = repo.get_branch_count()
-
-    for i in range(count):
-        branch = repo.get_branch(i)
-        print(f"{i} - {branch[1]} owned by {branch[0]}" )
-
-
-def list_commits(repo: RepositoryContractWrapper):
-    # Get the total number of commits there have been
-    count = repo.get_commits_count()
-
-    for i in range(count):
-        commit = repo.get_commit(i)
-
-        if commit[1]!=current_branch:
-            continue
 
+def list_commits(repository: vcs.Repository, limit=None, since=None, author=None):
+    """Print the commits made on the current branch, newest first"""
+    for i, commit in itertools.islice(repository.commit_log(since, author), limit):
         comment = commit[2]
         owner = commit[0]
         timestamp = datetime.datetime.fromtimestamp(commit[3])
 
-        print(f"Commit Number {i}:\n{comment}\nCommit Made By {owner} at {timestamp}\nPrevious Commit {commit[4]}\n")
+        print(f"Commit Number {i}:\n{comment}\nCommit Made By {owner} at {timestamp}\nPrevious Commit {commit[4]}\n", file=repository.output, flush=True)
 
 
-def create_repository(new_repository_name, private_key):
-    print(f"DEBUG: create_repository({new_repository_name}, {private_key})")
+def diff_commits(repository: vcs.Repository, old_commit, new_commit):
+    for filepath, old_hash, new_hash in repository.diff(old_commit, new_commit):
+        if old_hash is None:
+            print(f"Added: {filepath}", file=repository.output)
+        elif new_hash is None:
+            print(f"Deleted: {filepath}", file=repository.output)
+        else:
+            print(f"Modified: {filepath}", file=repository.output)
 
-    repo = RepositoryContractWrapper.deploy_new_repository(CONNECTION_ADDRESS, private_key, new_repository_name)
 
-    repodata = {
-        "repo_name": new_repository_name,
-        "repo_address": repo.repository_address,
-        "current_branch_id": 0,
-        "current_commit_id": 0,
-    }
-    with open("./.repodata.json", "w") as repodatafile:
-        json.dump(repodata, repodatafile)
+def show_status(repository: vcs.Repository):
+    modified, added, deleted = repository.status()
 
-    return repo
+    for filepath in modified:
+        print(f"Modified: {filepath}", file=repository.output)
+    for filepath in added:
+        print(f"Added: {filepath}", file=repository.output)
+    for filepath in deleted:
+        print(f"Deleted: {filepath}", file=repository.output)
 
+    if not (modified or added or deleted):
+        print("Nothing to commit, working tree clean", file=repository.output)
 
-def load_repository(private_key):
-    with open("./.repodata.json", "r") as repodatafile:
-        repodata = json.load(repodatafile)
+    if repository.sparse_include or repository.sparse_exclude:
+        print(f"{len(repository.sparse_files())} file(s) left out by the sparse checkout", file=repository.output)
 
-    global current_branch, current_commit
-    current_branch = repodata["current_branch_id"]
-    current_commit = repodata["current_commit_id"]
+    queued = repository.queued_commits()
+    if queued:
+        print(f"{queued} commit(s) waiting to be pushed", file=repository.output)
 
-    repo = RepositoryContractWrapper.connect_to_repository(CONNECTION_ADDRESS, private_key, repodata["repo_address"])
 
-    return repo
+def branch_info(repository: vcs.Repository):
+    branch_data, editors, ahead_behind = repository.branch_info()
 
+    print(f"Branch ID: {repository.current_branch}", file=repository.output)
+    print(f"Branch Name: {branch_data[1]}", file=repository.output)
+    print(f"Branch Owner: {branch_data[0]}", file=repository.output)
+    print(f"Branch Editors: {editors}", file=repository.output)
 
-def branch_info(repo: RepositoryContractWrapper):
-    branch_data = repo.get_branch(current_branch)
-    editors = repo.get_branch_editors(current_branch)
+    if ahead_behind is not None:
+        ahead, behind = ahead_behind
+        print(f"Commits ahead of mainline: {ahead}, behind mainline: {behind}", file=repository.output)
 
-    print(f"Branch ID: {current_branch}")
-    print(f"Branch Name: {branch_data[1]}")
-    print(f"Branch Owner: {branch_data[0]}")
-    print(f"Branch Editors: {editors}")
 
+def add_sparse_arguments(subparser, full=True):
+    subparser.add_argument("--include", action="append", default=[], metavar="PATTERN", help="Only write the files matching this path or pattern to disk, can be given several times and a pattern starting with ! leaves files out again")
+    subparser.add_argument("--exclude", action="append", default=[], metavar="PATTERN", help="Don't write the files matching this path or pattern to disk, can be given several times and a pattern starting with ! puts files back")
+    if full:
+        subparser.add_argument("--full", action="store_true", help="Write every file to disk again, dropping the include and exclude patterns")
 
-def add_editor(repo: RepositoryContractWrapper, address: str):
-    print(f"Adding \"{address}\" to branch")
-    repo.add_editor_to_branch(current_branch, address)
 
+def build_parser(parser_class=argparse.ArgumentParser):
+    """Build the parser of the command line, every subparser is made with parser_class too"""
+    parser = parser_class()
+    parser.add_argument("-j", "--jobs", type=int, default=DEFAULT_WORKERS, help="The number of files to upload or download at the same time")
+    parser.add_argument("--profile", action="store_true", help="Record the time spent in contract calls, JSON-RPC and ipfs requests and print a summary when the command exits")
+    parser.add_argument("--profile-output", default=DEFAULT_PROFILE_PATH, metavar="PATH", help="Write the profile to PATH.json and the Chrome trace to PATH.trace.json")
+    subparsers = parser.add_subparsers(title="subcommand")
 
-def rm_editor(repo: RepositoryContractWrapper, address: str):
-    print(f"Removing \"{address}\" from branch")
-    repo.remove_editor_from_branch(current_branch, address)
+    parser_commit = subparsers.add_parser("commit")
+    parser_commit.set_defaults(subcommand="commit")
+    parser_commit.add_argument("-m", "--message", help="The Commit message to add")
+    parser_commit.add_argument("--push", action="store_true", help="Push the commit straight away instead of leaving it in the local queue")
 
+    parser_push = subparsers.add_parser("push")
+    parser_push.set_defaults(subcommand="push")
 
-parser = argparse.ArgumentParser()
-subparsers = parser.add_subparsers(title="subcommand")
+    parser_log = subparsers.add_parser("log")
+    parser_log.set_defaults(subcommand="log")
+    parser_log.add_argument("-n", "--limit", type=int, help="Only show this many commits")
+    parser_log.add_argument("--since", type=datetime.datetime.fromisoformat, help="Only show commits made after this date and time, e.g. 2021-05-20 or 2021-05-20T14:30")
+    parser_log.add_argument("--author", help="Only show commits made by this account address")
 
-parser_commit = subparsers.add_parser("commit")
-parser_commit.set_defaults(subcommand="commit")
-parser_commit.add_argument("-m", "--message", help="The Commit message to add")
+    parser_branches = subparsers.add_parser("branches")
+    parser_branches.set_defaults(subcommand="branches")
 
-parser_log = subparsers.add_parser("log")
-parser_log.set_defaults(subcommand="log")
+    parser_branch = subparsers.add_parser("branch")
+    parser_branch.set_defaults(subcommand="branch")
+    parser_branch.add_argument("branch_name", help="The name of the branch")
 
-parser_branches = subparsers.add_parser("branches")
-parser_branches.set_defaults(subcommand="branches")
+    parser_checkout = subparsers.add_parser("checkout")
+    parser_checkout.set_defaults(subcommand="checkout")
+    parser_checkout.add_argument("branch_id", help="The id of the branch to switch to")
+    add_sparse_arguments(parser_checkout)
 
-parser_branch = subparsers.add_parser("branch")
-parser_branch.set_defaults(subcommand="branch")
-parser_branch.add_argument("branch_name", help="The name of the branch")
+    parser_merge = subparsers.add_parser("merge")
+    parser_merge.set_defaults(subcommand="merge")
+    parser_merge.add_argument("child_branch_id", help="The id of the branch we are merging from")
+    parser_merge.add_argument("--squash", action="store_true", help="This merge is a squash merge")
+    parser_merge.add_argument("-m", "--message", help="The Commit message to add to the resulting merge commit")
 
-parser_checkout = subparsers.add_parser("checkout")
-parser_checkout.set_defaults(subcommand="checkout")
-parser_checkout.add_argument("branch_id", help="The id of the branch to switch to")
+    parser_init = subparsers.add_parser("init")
+    parser_init.set_defaults(subcommand="init")
+    parser_init.add_argument("repo_name", help="The name of the repository")
+    parser_init.add_argument("--tree-manifests", action="store_true", help="Store commits as trees of directory manifests on ipfs, only the root hash goes on the chain")
+    parser_init.add_argument("--chunk-threshold", type=int, help="Store files of at least this many MiB as content defined chunks, so an edit only uploads the chunks it changed")
 
-parser_merge = subparsers.add_parser("merge")
-parser_merge.set_defaults(subcommand="merge")
-parser_merge.add_argument("child_branch_id", help="The id of the branch we are merging from")
-parser_merge.add_argument("--squash", action="store_true", help="This merge is a squash merge")
-parser_merge.add_argument("-m", "--message", help="The Commit message to add to the resulting merge commit")
+    parser_clone = subparsers.add_parser("clone")
+    parser_clone.set_defaults(subcommand="clone")
+    parser_clone.add_argument("repo_address", help="The address of the repository to clone")
+    parser_clone.add_argument("--chunk-threshold", type=int, help="Store files of at least this many MiB as content defined chunks, use the same value as the rest of the repository")
+    add_sparse_arguments(parser_clone, full=False)
 
-parser_init = subparsers.add_parser("init")
-parser_init.set_defaults(subcommand="init")
-parser_init.add_argument("repo_name", help="The name of the repository")
+    parser_branchinfo = subparsers.add_parser("branchinfo")
+    parser_branchinfo.set_defaults(subcommand="branchinfo")
 
-parser_clone = subparsers.add_parser("clone")
-parser_clone.set_defaults(subcommand="clone")
-parser_clone.add_argument("repo_address", help="The address of the repository to clone")
+    parser_add_editor = subparsers.add_parser("addeditor")
+    parser_add_editor.set_defaults(subcommand="addeditor")
+    parser_add_editor.add_argument("account_address", nargs="+", help="The addresses of the accounts you want to add as editors")
 
-parser_branchinfo = subparsers.add_parser("branchinfo")
-parser_branchinfo.set_defaults(subcommand="branchinfo")
+    parser_rm_editor = subparsers.add_parser("rmeditor")
+    parser_rm_editor.set_defaults(subcommand="rmeditor")
+    parser_rm_editor.add_argument("account_address", nargs="+", help="The addresses of the accounts you want to remove as editors")
+
+    parser_status = subparsers.add_parser("status")
+    parser_status.set_defaults(subcommand="status")
+
+    parser_diff = subparsers.add_parser("diff")
+    parser_diff.set_defaults(subcommand="diff")
+    parser_diff.add_argument("old_commit_id", help="The id of the commit to compare from")
+    parser_diff.add_argument("new_commit_id", help="The id of the commit to compare to")
+
+    parser_fetch = subparsers.add_parser("fetch")
+    parser_fetch.set_defaults(subcommand="fetch")
+    parser_fetch.add_argument("commit_id", help="The id of the commit that you want to fetch")
+    add_sparse_arguments(parser_fetch)
+
+    return parser
 
-parser_add_editor = subparsers.add_parser("addeditor")
-parser_add_editor.set_defaults(subcommand="addeditor")
-parser_add_editor.add_argument("account_address", help="The address of the account you want to add as an editor")
 
-parser_rm_editor = subparsers.add_parser("rmeditor")
-parser_rm_editor.set_defaults(subcommand="rmeditor")
-parser_rm_editor.add_argument("account_address", help="The address of the account you want to remove as an editor")
+def sparse_patterns(args):
+    """The include and exclude patterns given to a checkout or fetch, None if
+    the patterns are to be kept as they are"""
+    if args.include or args.exclude or args.full:
+        return args.include, args.exclude
+    return None, None
+
+
+def main(args, repository: vcs.Repository, parser, ask=getpass):
+    """Run the subcommand parsed from the command line on a repository, ask is
+    called for the private key if the repository doesn't have one and the
+    subcommand needs it"""
+    if getattr(args, "subcommand", None) is None:
+        parser.print_help(repository.output)
+        return
+
+    repository.jobs = args.jobs
 
-parser_branchinfo = subparsers.add_parser("branchinfo")
-parser_branchinfo.set_defaults(subcommand="branchinfo")
+    if args.subcommand == "status":
+        # Status only looks at the local files so there is no need for a private key
+        show_status(repository)
+        return
 
-parser_fetch = subparsers.add_parser("fetch")
-parser_fetch.set_defaults(subcommand="fetch")
-parser_fetch.add_argument("commit_id", help="The id of the commit that you want to fetch")    
+    if args.subcommand == "commit":
+        # Commits are recorded locally, only pushing them needs the chain
+        repository.commit(args.message)
+        if not args.push:
+            return
+
+    if args.subcommand in ("checkout", "fetch", "merge") and repository.has_queued_commits():
+        print("ERROR: There are commits waiting to be pushed, push them before changing the working tree", file=repository.output)
+        return
 
-def main(args):
-    try:
-        args.subcommand
-    except AttributeError as e:
-        print(f"DEBUG: {e}")
-        parser.print_help()
-        exit(0)
+    if repository.private_key is None:
+        repository.private_key = ask("Private Key: ")
 
-    private_key = os.getenv("VCS_PRIVATE_KEY") or getpass("Private Key: ")
+    settings = {"conn_url": repository.conn_url, "jobs": repository.jobs, "blob_cache": repository.blob_cache, "output": repository.output}
 
     if args.subcommand == "init":
-        create_repository(args.repo_name, private_key)
+        threshold = args.chunk_threshold * MEGABYTE if args.chunk_threshold is not None else None
+        vcs.Repository.init(repository.path, args.repo_name, repository.private_key, args.tree_manifests, threshold, **settings)
     elif args.subcommand == "clone":
-        clone(args.repo_address, private_key)
+        threshold = args.chunk_threshold * MEGABYTE if args.chunk_threshold is not None else None
+        vcs.Repository.clone(repository.path, args.repo_address, repository.private_key, threshold, args.include, args.exclude, **settings)
     elif args.subcommand == "branches":
-        repo = load_repository(private_key)
-        list_branches(repo)
+        list_branches(repository)
     elif args.subcommand == "branch":
-        repo = load_repository(private_key)
-        new_branch(repo, args.branch_name)
+        repository.branch(args.branch_name)
     elif args.subcommand == "branchinfo":
-        repo = load_repository(private_key)
-        branch_info(repo)
+        branch_info(repository)
     elif args.subcommand == "addeditor":
-        repo = load_repository(private_key)
-        add_editor(repo, args.account_address)
+        repository.add_editors(args.account_address)
     elif args.subcommand == "rmeditor":
-        repo = load_repository(private_key)
-        rm_editor(repo, args.account_address)
+        repository.remove_editors(args.account_address)
     elif args.subcommand == "checkout":
-        repo = load_repository(private_key)
-        checkout(repo, int(args.branch_id))
-    elif args.subcommand == "commit":
-        repo = load_repository(private_key)
-        make_commit(repo, args.message)
+        repository.checkout(int(args.branch_id), *sparse_patterns(args))
+    elif args.subcommand in ("commit", "push"):
+        repository.push()
     elif args.subcommand == "merge":
-        repo = load_repository(private_key)
-        if args.squash:
-            squash_merge(repo, int(args.child_branch_id), args.message)
-        else:
-            three_way_merge(repo, int(args.child_branch_id), args.message)
+        repository.merge(int(args.child_branch_id), args.message, args.squash)
     elif args.subcommand == "fetch":
-        repo = load_repository(private_key)
-        fetch(repo, int(args.commit_id))
+        repository.fetch(int(args.commit_id), *sparse_patterns(args))
+    elif args.subcommand == "diff":
+        diff_commits(repository, int(args.old_commit_id), int(args.new_commit_id))
     elif args.subcommand == "log":
-        repo = load_repository(private_key)
-        list_commits(repo)
+        since = args.since.timestamp() if args.since is not None else None
+        list_commits(repository, args.limit, since, args.author)
     else:
-        parser.print_help()
+        parser.print_help(repository.output)
 
 
 if __name__ == "__main__":
+    parser = build_parser()
     args = parser.parse_args()
-    main(args)
+
+    repository = vcs.Repository(".", os.getenv("VCS_PRIVATE_KEY") or None)
+
+    if not args.profile:
+        main(args, repository, parser)
+    else:
+        profiling.enable()
+        # The phases are the methods of the repository and the functions it calls marked with profiling.phase
+        profiling.instrument(vcs.Repository)
+        profiling.instrument(vcs)
+        try:
+            main(args, repository, parser)
+        finally:
+            profiling.write(args.profile_output)
@@ -0,0 +1,494 @@
+import os
+import sys
+
+from concurrent.futures import ProcessPoolExecutor
+
+# Line based three way merge producing the same output as `diff3 -m`. Each side
+# is diffed against the common ancestor the way GNU diff does, then changes from
+# the two sides that overlap or touch in the ancestor are grouped into one region.
+# A region changed on only one side takes that side, a region changed on both
+# sides is a conflict, even when both made the same change, and is written out
+# between conflict markers
+
+MARKER_LENGTH = 7
+
+# diff3 runs diff with --horizon-lines=100, this many of the identical lines
+# around the changes can be moved over when the changes are lined up
+HORIZON_LINES = 100
+
+# The smallest number of edit steps after which diff stops looking for the
+# shortest diff and settles for a good enough one, more for large files
+MIN_TOO_EXPENSIVE = 4096
+
+
+def split_lines(data):
+    """Split bytes into lines on b"\n" only, keeping the line endings"""
+    lines = data.split(b"\n")
+    return [line + b"\n" for line in lines[:-1]] + ([lines[-1]] if lines[-1] else [])
+
+
+def _discard_confusing_lines(a, b):
+    """Return a flag for each line of a and b that is left out of the search
+    for matching lines, the same way diff does: lines that don't appear in the
+    other file at all, and runs of lines that appear in it very many times"""
+    counts = [{}, {}]
+    for count, lines in zip(counts, (a, b)):
+        for line in lines:
+            count[line] = count.get(line, 0) + 1
+
+    discards = []
+    for lines, other_counts in ((a, counts[1]), (b, counts[0])):
+        # Roughly 5 times the square root of the number of lines
+        many = 5
+        tem = len(lines) // 64
+        tem >>= 2
+        while tem > 0:
+            many *= 2
+            tem >>= 2
+
+        # 1 for lines that can be left out, 2 for lines that can be left out if they are in the middle of those
+        flags = []
+        for line in lines:
+            matches = other_counts.get(line, 0)
+            flags.append(1 if matches == 0 else 2 if matches > many else 0)
+        discards.append(flags)
+
+    for flags in discards:
+        end = len(flags)
+        i = 0
+        while i < end:
+            if flags[i] == 2:
+                flags[i] = 0
+            elif flags[i] != 0:
+                # The end of this run of lines that can be left out, and how many of them are provisional
+                provisional = 0
+                j = i
+                while j < end and flags[j] != 0:
+                    if flags[j] == 2:
+                        provisional += 1
+                    j += 1
+                while j > i and flags[j - 1] == 2:
+                    j -= 1
+                    flags[j] = 0
+                    provisional -= 1
+                length = j - i
+
+                if provisional * 4 > length:
+                    # Too many provisional lines in the run, keep all of them
+                    for k in range(i, j):
+                        if flags[k] == 2:
+                            flags[k] = 0
+                else:
+                    # Runs of minimum or more provisional lines are kept in, minimum is about the square root of length / 4
+                    minimum = 1
+                    tem = length >> 2
+                    tem >>= 2
+                    while tem > 0:
+                        minimum <<= 1
+                        tem >>= 2
+                    minimum += 1
+
+                    k = consecutive = 0
+                    while k < length:
+                        if flags[i + k] != 2:
+                            consecutive = 0
+                        else:
+                            consecutive += 1
+                            if consecutive == minimum:
+                                # Back up to the start of the run to keep all of it
+                                k -= consecutive
+                            elif consecutive > minimum:
+                                flags[i + k] = 0
+                        k += 1
+
+                    # Keep the provisional lines at either end of the run until 3 lines in a row
+                    # that don't appear in the other file, or one at least 8 lines in
+                    for step, first in ((1, i), (-1, i + length - 1)):
+                        consecutive = 0
+                        for k in range(length):
+                            position = first + step * k
+                            if k >= 8 and flags[position] == 1:
+                                break
+                            if flags[position] == 2:
+                                consecutive = 0
+                                flags[position] = 0
+                            elif flags[position] == 0:
+                                consecutive = 0
+                            else:
+                                consecutive += 1
+                            if consecutive == 3:
+                                break
+
+                    i += length - 1
+            i += 1
+
+    return discards
+
+
+def _diag(xv, yv, xoff, xlim, yoff, ylim, minimal, fd, bd, too_expensive):
+    """Find the middle of the shortest edit script between xv[xoff:xlim] and
+    yv[yoff:ylim] by searching forwards from the start and backwards from the
+    end at the same time. Returns the split point and whether each half still
+    has to be minimal. fd and bd are indexed by diagonal x - y, negative
+    diagonals wrap around to the end of the lists"""
+    dmin, dmax = xoff - ylim, xlim - yoff
+    fmid, bmid = xoff - yoff, xlim - ylim
+    fmin = fmax = fmid
+    bmin = bmax = bmid
+    odd = (fmid - bmid) & 1
+    fd[fmid] = xoff
+    bd[bmid] = xlim
+
+    cost = 0
+    while True:
+        cost += 1
+
+        # Extend the forward search by an edit step on each diagonal
+        if fmin > dmin:
+            fmin -= 1
+            fd[fmin - 1] = -1
+        else:
+            fmin += 1
+        if fmax < dmax:
+            fmax += 1
+            fd[fmax + 1] = -1
+        else:
+            fmax -= 1
+        for d in range(fmax, fmin - 1, -2):
+            low, high = fd[d - 1], fd[d + 1]
+            x = high if low < high else low + 1
+            y = x - d
+            while x < xlim and y < ylim and xv[x] == yv[y]:
+                x += 1
+                y += 1
+            fd[d] = x
+            if odd and bmin <= d <= bmax and bd[d] <= x:
+                return x, y, True, True
+
+        # And the backward search
+        if bmin > dmin:
+            bmin -= 1
+            bd[bmin - 1] = sys.maxsize
+        else:
+            bmin += 1
+        if bmax < dmax:
+            bmax += 1
+            bd[bmax + 1] = sys.maxsize
+        else:
+            bmax -= 1
+        for d in range(bmax, bmin - 1, -2):
+            low, high = bd[d - 1], bd[d + 1]
+            x = low if low < high else high - 1
+            y = x - d
+            while x > xoff and y > yoff and xv[x - 1] == yv[y - 1]:
+                x -= 1
+                y -= 1
+            bd[d] = x
+            if not odd and fmin <= d <= fmax and x <= fd[d]:
+                return x, y, True, True
+
+        if minimal or cost < too_expensive:
+            continue
+
+        # Gone on for too long, split at whichever search got furthest
+        forward_best = -1
+        for d in range(fmax, fmin - 1, -2):
+            x = min(fd[d], xlim)
+            y = x - d
+            if y > ylim:
+                x, y = ylim + d, ylim
+            if x + y > forward_best:
+                forward_best, forward_x = x + y, x
+
+        backward_best = sys.maxsize
+        for d in range(bmax, bmin - 1, -2):
+            x = max(xoff, bd[d])
+            y = x - d
+            if y < yoff:
+                x, y = yoff + d, yoff
+            if x + y < backward_best:
+                backward_best, backward_x = x + y, x
+
+        if (xlim + ylim) - backward_best < forward_best - (xoff + yoff):
+            return forward_x, forward_best - forward_x, True, False
+        return backward_x, backward_best - backward_x, False, True
+
+
+def _compare(xv, yv, x_changed, y_changed):
+    """Set the flags of the lines of xv and yv that are not on the edit script
+    diff finds between them"""
+    size = len(xv) + len(yv) + 3
+    fd = [0] * size
+    bd = [0] * size
+
+    too_expensive = 1
+    diagonals = len(xv) + len(yv) + 3
+    while diagonals:
+        too_expensive <<= 1
+        diagonals >>= 2
+    too_expensive = max(MIN_TOO_EXPENSIVE, too_expensive)
+
+    pending = [(0, len(xv), 0, len(yv), False)]
+    while pending:
+        xoff, xlim, yoff, ylim, minimal = pending.pop()
+
+        # Skip the lines that match at the start and end
+        while xoff < xlim and yoff < ylim and xv[xoff] == yv[yoff]:
+            xoff += 1
+            yoff += 1
+        while xoff < xlim and yoff < ylim and xv[xlim - 1] == yv[ylim - 1]:
+            xlim -= 1
+            ylim -= 1
+
+        if xoff == xlim:
+            for y in range(yoff, ylim):
+                y_changed[y] = True
+        elif yoff == ylim:
+            for x in range(xoff, xlim):
+                x_changed[x] = True
+        else:
+            xmid, ymid, low_minimal, high_minimal = _diag(xv, yv, xoff, xlim, yoff, ylim, minimal, fd, bd, too_expensive)
+            pending.append((xmid, xlim, ymid, ylim, high_minimal))
+            pending.append((xoff, xmid, yoff, ymid, low_minimal))
+
+
+def _shift_boundaries(lines, changed, other_changed):
+    """Slide runs of changed lines over identical neighbouring lines so that
+    they merge with other changes or line up with changes in the other file,
+    the same way diff does. changed has a False entry at each end, so the flag
+    for line i is at changed[i + 1]"""
+    n = len(lines)
+    i = j = 0
+    while True:
+        # Find the start of the next run of changes and the matching point in the other file
+        while i < n and not changed[i + 1]:
+            while other_changed[j + 1]:
+                j += 1
+            j += 1
+            i += 1
+
+        if i == n:
+            break
+
+        start = i
+        i += 1
+        while changed[i + 1]:
+            i += 1
+        while other_changed[j + 1]:
+            j += 1
+
+        while True:
+            run_length = i - start
+
+            # Move the run back while the line before it matches its last line
+            while start and lines[start - 1] == lines[i - 1]:
+                start -= 1
+                changed[start + 1] = True
+                i -= 1
+                changed[i + 1] = False
+                while changed[start]:
+                    start -= 1
+                j -= 1
+                while other_changed[j + 1]:
+                    j -= 1
+
+            # The furthest point where the run ends next to a run of changes in the other file
+            corresponding = i if other_changed[j] else n
+
+            # Move the run forward while its first line matches the line after it
+            while i != n and lines[start] == lines[i]:
+                changed[start + 1] = False
+                start += 1
+                changed[i + 1] = True
+                i += 1
+                while changed[i + 1]:
+                    i += 1
+                j += 1
+                while other_changed[j + 1]:
+                    corresponding = i
+                    j += 1
+
+            if run_length == i - start:
+                break
+
+        # Move the run back to line up with the changes in the other file where possible
+        while corresponding < i:
+            start -= 1
+            changed[start + 1] = True
+            i -= 1
+            changed[i + 1] = False
+            j -= 1
+            while other_changed[j + 1]:
+                j -= 1
+
+
+def _hunks(other, base):
+    """Return the (base_start, base_end, other_start, other_end) ranges of the
+    lines changed between other and base, as `diff other base` would find them"""
+    n, m = len(other), len(base)
+
+    # Lines more than the horizon away from the changes at the start and end are left alone
+    prefix = 0
+    while prefix < min(n, m) and other[prefix] == base[prefix]:
+        prefix += 1
+    skip = max(0, prefix - HORIZON_LINES)
+    suffix = 0
+    while suffix < min(n, m) - skip and other[n - suffix - 1] == base[m - suffix - 1]:
+        suffix += 1
+    tail = max(0, suffix - HORIZON_LINES)
+
+    a, b = other[skip:n - tail], base[skip:m - tail]
+
+    # Lines are compared by number rather than contents from here on
+    numbers = {}
+    a = [numbers.setdefault(line, len(numbers)) for line in a]
+    b = [numbers.setdefault(line, len(numbers)) for line in b]
+
+    a_discards, b_discards = _discard_confusing_lines(a, b)
+    a_kept = [i for i in range(len(a)) if not a_discards[i]]
+    b_kept = [i for i in range(len(b)) if not b_discards[i]]
+
+    a_changed = [False] + [bool(flag) for flag in a_discards] + [False]
+    b_changed = [False] + [bool(flag) for flag in b_discards] + [False]
+
+    x_changed = [False] * len(a_kept)
+    y_changed = [False] * len(b_kept)
+    _compare([a[i] for i in a_kept], [b[i] for i in b_kept], x_changed, y_changed)
+    for x, i in enumerate(a_kept):
+        a_changed[i + 1] = x_changed[x]
+    for y, i in enumerate(b_kept):
+        b_changed[i + 1] = y_changed[y]
+
+    _shift_boundaries(a, a_changed, b_changed)
+    _shift_boundaries(b, b_changed, a_changed)
+
+    hunks = []
+    i = j = 0
+    while i < len(a) or j < len(b):
+        if a_changed[i + 1] or b_changed[j + 1]:
+            other_start, base_start = i, j
+            while a_changed[i + 1]:
+                i += 1
+            while b_changed[j + 1]:
+                j += 1
+            hunks.append((skip + base_start, skip + j, skip + other_start, skip + i))
+        i += 1
+        j += 1
+
+    return hunks
+
+
+def merge_regions(base, parent, child):
+    """Yield ("unchanged", lines), ("parent", lines), ("child", lines) or
+    ("conflict", parent_lines, base_lines, child_lines) for each region of the
+    merge. Like diff3, the changes of both sides that overlap or touch in base
+    make up a single region"""
+    sides = (_hunks(parent, base), _hunks(child, base))
+    files = (parent, child)
+    next_hunk = [0, 0]
+    # How far the lines of each side are from the same lines of base after the changes so far
+    offsets = [0, 0]
+    base_pos = 0
+
+    while next_hunk[0] < len(sides[0]) or next_hunk[1] < len(sides[1]):
+        # Start at the first change on either side and take in every change that overlaps or touches the region
+        start = min(hunks[index][0] for hunks, index in zip(sides, next_hunk) if index < len(hunks))
+        end = start
+        used = ([], [])
+        grown = True
+        while grown:
+            grown = False
+            for side in (0, 1):
+                while next_hunk[side] < len(sides[side]) and sides[side][next_hunk[side]][0] <= end:
+                    hunk = sides[side][next_hunk[side]]
+                    used[side].append(hunk)
+                    next_hunk[side] += 1
+                    end = max(end, hunk[1])
+                    grown = True
+
+        ranges = []
+        for side in (0, 1):
+            if used[side]:
+                first, last = used[side][0], used[side][-1]
+                side_start = first[2] - (first[0] - start)
+                side_end = last[3] + (end - last[1])
+                offsets[side] = side_end - end
+            else:
+                side_start, side_end = start + offsets[side], end + offsets[side]
+            ranges.append(files[side][side_start:side_end])
+
+        if start > base_pos:
+            yield "unchanged", base[base_pos:start]
+
+        if not used[0]:
+            yield "child", ranges[1]
+        elif not used[1]:
+            yield "parent", ranges[0]
+        else:
+            yield "conflict", ranges[0], base[start:end], ranges[1]
+
+        base_pos = end
+
+    if base_pos < len(base):
+        yield "unchanged", base[base_pos:]
+
+
+def _marker(char, label):
+    return (char * MARKER_LENGTH).encode() + (b" " + label.encode() if label else b"") + b"\n"
+
+
+def _terminated(lines):
+    # A conflict marker always has to start on a new line
+    if lines and not lines[-1].endswith(b"\n"):
+        return lines[:-1] + [lines[-1] + b"\n"]
+    return lines
+
+
+def merge3(base, parent, child, labels=("PARENT", "BASE", "CHILD")):
+    """Merge the changes made to base in parent and child, all 3 as bytes.
+    Returns the merged bytes and the number of conflicting regions, which are
+    left in the output between diff3 style markers"""
+    parent_label, base_label, child_label = labels
+
+    out = []
+    conflicts = 0
+    for region in merge_regions(split_lines(base), split_lines(parent), split_lines(child)):
+        if region[0] != "conflict":
+            out.extend(region[1])
+            continue
+
+        _, parent_lines, base_lines, child_lines = region
+        conflicts += 1
+
+        # diff3 only shows one side when both made the same change
+        if parent_lines != child_lines:
+            out.append(_marker("<", parent_label))
+            out.extend(_terminated(parent_lines))
+            out.append(_marker("|", base_label))
+        else:
+            out.append(_marker("<", base_label))
+        out.extend(_terminated(base_lines))
+        out.append(_marker("=", None))
+        out.extend(_terminated(child_lines))
+        out.append(_marker(">", child_label))
+
+    return b"".join(out), conflicts
+
+
+def _merge3_args(args):
+    return merge3(*args)
+
+
+def merge_many(merges, workers=None):
+    """Run merge3 on a list of (base, parent, child) tuples spread across a pool
+    of processes, the results are returned in the same order as merges"""
+    merges = list(merges)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if len(merges) < 2 or workers == 1:
+        return [merge3(*args) for args in merges]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_merge3_args, merges, chunksize=max(1, len(merges) // (workers * 4))))
+
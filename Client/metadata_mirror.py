@@ -0,0 +1,174 @@
+import sqlite3
+
+from eth_wrapper import RepositoryContractWrapper
+
+# Local copy of the branches, commits and files stored in the repository contract.
+# Branches, commits and files can never be changed once they are on the chain,
+# so syncing only has to fetch the ones that were added since the last sync
+MIRROR_FILEPATH = "./.repometa.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS branches (
+    id INTEGER PRIMARY KEY,
+    owner TEXT NOT NULL,
+    name TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS editors (
+    branch_id INTEGER NOT NULL,
+    address TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS commits (
+    id INTEGER PRIMARY KEY,
+    author TEXT NOT NULL,
+    branch_id INTEGER NOT NULL,
+    comment TEXT NOT NULL,
+    creation_time INTEGER NOT NULL,
+    previous INTEGER NOT NULL,
+    multi_parent INTEGER NOT NULL,
+    previous2 INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS pending_commits (
+    id INTEGER PRIMARY KEY
+);
+
+CREATE TABLE IF NOT EXISTS file_sets (
+    commit_id INTEGER PRIMARY KEY,
+    source_commit_id INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    file_path TEXT NOT NULL,
+    ipfs_hash TEXT NOT NULL,
+    commit_id INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS editors_branch ON editors (branch_id);
+CREATE INDEX IF NOT EXISTS commits_branch ON commits (branch_id, id);
+CREATE INDEX IF NOT EXISTS files_commit ON files (commit_id);
+"""
+
+
+class MetadataMirror(object):
+    """Serves repository metadata from a local sqlite database, rows are
+    returned in the same shape as the RepositoryContractWrapper getters"""
+    def __init__(self, repo: RepositoryContractWrapper, filepath=MIRROR_FILEPATH):
+        self.repo = repo
+
+        self._db = sqlite3.connect(filepath)
+        self._db.executescript(SCHEMA)
+
+
+    def _count(self, table):
+        return self._db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+    def sync(self):
+        """Fetch any branches, commits and files that have been added to the
+        chain since the last sync"""
+        with self._db:
+            branch_ids = list(range(self._count("branches"), self.repo.get_branch_count()))
+            branches = self.repo.get_branches(branch_ids)
+            editors = self.repo.get_branches_editors(branch_ids)
+
+            for branch_id, branch, branch_editors in zip(branch_ids, branches, editors):
+                self._db.execute("INSERT INTO branches VALUES (?, ?, ?)", (branch_id, branch[0], branch[1]))
+                self._store_editors(branch_id, branch_editors)
+
+            commit_ids = list(range(self._count("commits"), self.repo.get_commits_count()))
+            commits = self.repo.get_commits(commit_ids)
+
+            for commit_id, commit in zip(commit_ids, commits):
+                self._db.execute("INSERT INTO commits VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (commit_id, *commit))
+
+            # Commits made across several transactions only get their files once they are finalized
+            unfinished_ids = [row[0] for row in self._db.execute("SELECT id FROM pending_commits")] + commit_ids
+            pending = self.repo.get_commits_pending(unfinished_ids)
+
+            self._db.execute("DELETE FROM pending_commits")
+            self._db.executemany("INSERT INTO pending_commits VALUES (?)", [(i,) for i, p in zip(unfinished_ids, pending) if p])
+
+            finalized_ids = [i for i, p in zip(unfinished_ids, pending) if not p]
+
+            # Forks and squash merges share the files of another commit, only commits with their own files need them fetched
+            sources = self.repo.get_file_set_commits(finalized_ids)
+            self._db.executemany("INSERT INTO file_sets VALUES (?, ?)", [(i, s) for i, s in zip(finalized_ids, sources) if i != s])
+            finalized_ids = [i for i, s in zip(finalized_ids, sources) if i == s]
+
+            file_ids = [file_id for ids in self.repo.get_files_from_commits(finalized_ids) for file_id in ids]
+            files = self.repo.get_files(file_ids)
+
+            for file_id, filedata in zip(file_ids, files):
+                self._db.execute("INSERT INTO files VALUES (?, ?, ?, ?)", (file_id, *filedata))
+
+
+    def _store_editors(self, branch_id, editors):
+        self._db.execute("DELETE FROM editors WHERE branch_id = ?", (branch_id,))
+        self._db.executemany("INSERT INTO editors VALUES (?, ?)", [(branch_id, editor) for editor in editors])
+
+
+    def sync_editors(self, branch_id):
+        """Editors are the only metadata that can change, so they are refreshed
+        from the chain on request rather than on every sync"""
+        with self._db:
+            self._store_editors(branch_id, self.repo.get_branch_editors(branch_id))
+
+
+    def get_branch_count(self):
+        return self._count("branches")
+
+
+    def get_branch(self, branch_id):
+        return list(self._db.execute("SELECT owner, name FROM branches WHERE id = ?", (branch_id,)).fetchone())
+
+
+    def get_branches(self):
+        """Return a list of (branch_id, branch) pairs for every branch"""
+        rows = self._db.execute("SELECT id, owner, name FROM branches ORDER BY id")
+        return [(row[0], list(row[1:])) for row in rows]
+
+
+    def get_branch_editors(self, branch_id):
+        rows = self._db.execute("SELECT address FROM editors WHERE branch_id = ? ORDER BY rowid", (branch_id,))
+        return [row[0] for row in rows]
+
+
+    def get_commits_count(self):
+        return self._count("commits")
+
+
+    def _commit_from_row(self, row):
+        commit = list(row)
+        commit[5] = bool(commit[5])
+        return commit
+
+
+    def get_commit(self, commit_id):
+        row = self._db.execute("SELECT author, branch_id, comment, creation_time, previous, multi_parent, previous2 FROM commits WHERE id = ?", (commit_id,)).fetchone()
+        return self._commit_from_row(row)
+
+
+    def get_commits_from_branch(self, branch_id):
+        """Return a list of (commit_id, commit) pairs for every commit made on a branch, oldest first"""
+        rows = self._db.execute("SELECT id, author, branch_id, comment, creation_time, previous, multi_parent, previous2 FROM commits WHERE branch_id = ? AND id NOT IN (SELECT id FROM pending_commits) ORDER BY id", (branch_id,))
+        return [(row[0], self._commit_from_row(row[1:])) for row in rows]
+
+
+    def get_commit_parents(self, first_commit_id):
+        """Return (commit_id, previous, multi_parent, previous2) for every commit from first_commit_id onwards"""
+        rows = self._db.execute("SELECT id, previous, multi_parent, previous2 FROM commits WHERE id >= ? ORDER BY id", (first_commit_id,))
+        return [(row[0], row[1], bool(row[2]), row[3]) for row in rows]
+
+
+    def get_files_from_commit(self, commit_id):
+        """Return the [file_path, ipfs_hash, commit_id] entries of every file in a
+        commit, commit_id is the commit the files were originally added in"""
+        row = self._db.execute("SELECT source_commit_id FROM file_sets WHERE commit_id = ?", (commit_id,)).fetchone()
+        if row is not None:
+            commit_id = row[0]
+
+        rows = self._db.execute("SELECT file_path, ipfs_hash, commit_id FROM files WHERE commit_id = ? ORDER BY id", (commit_id,))
+        return [list(row) for row in rows]
@@ -0,0 +1,265 @@
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+# Records where the time of a command goes. Nothing is wrapped until enable()
+# is called, so a command run without --profile runs exactly the same code as
+# it would without this module. Once enabled every call to the contract wrapper,
+# every JSON-RPC request sent to the node, every ipfs request and the functions
+# marked with phase() are recorded as spans with their duration and the bytes or
+# gas they account for. write() saves them as a JSON report and as a
+# Chrome trace that can be opened in chrome://tracing or https://ui.perfetto.dev
+
+# Methods of the contract wrapper that are recorded besides the public ones
+TRACED_PRIVATE_METHODS = ("_batch_call", "_send_transaction")
+
+# Methods of the wrapper that are not recorded, pipeline() only returns a context manager
+UNTRACED_METHODS = ("pipeline",)
+
+IPFS_NAMESPACES = ("block", "dag", "pin")
+
+_events = None
+_start = None
+
+
+def enabled():
+    return _events is not None
+
+
+def _record(name, category, start, end, fields):
+    # Complete events of the Chrome trace format, times in microseconds since enable()
+    _events.append({
+        "name": name,
+        "cat": category,
+        "ph": "X",
+        "ts": round((start - _start) * 1e6, 1),
+        "dur": round((end - start) * 1e6, 1),
+        "pid": os.getpid(),
+        "tid": threading.get_ident(),
+        "args": fields,
+    })
+
+
+def _call(name, category, function, args, kwargs, measure=None):
+    start = time.perf_counter()
+    try:
+        result = function(*args, **kwargs)
+    except BaseException as e:
+        _record(name, category, start, time.perf_counter(), {"error": type(e).__name__})
+        raise
+
+    end = time.perf_counter()
+    _record(name, category, start, end, measure(args, kwargs, result) if measure is not None else {})
+    return result
+
+
+def traced(name, category, function, measure=None):
+    """Wrap function so that each call to it is recorded as a span. measure is
+    called with the arguments and the result and returns extra fields for the
+    span, such as the bytes transferred"""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        return _call(name, category, function, args, kwargs, measure)
+
+    return wrapper
+
+
+def phase(function):
+    """Mark a function or method as a phase of a command, it is left as it is
+    until instrument() is called on its class or module"""
+    function.profiled_phase = True
+    return function
+
+
+def _is_phase(attribute):
+    return getattr(attribute, "profiled_phase", False) and not hasattr(attribute, "__wrapped__")
+
+
+def instrument(namespace, category="phase"):
+    """Record every call to the functions of a class or module marked with
+    phase(). Calls made from inside a module look the functions up in its
+    globals, so they are recorded too"""
+    for name, attribute in list(vars(namespace).items()):
+        if isinstance(attribute, classmethod) and _is_phase(attribute.__func__):
+            setattr(namespace, name, classmethod(traced(name, category, attribute.__func__)))
+        elif callable(attribute) and _is_phase(attribute):
+            setattr(namespace, name, traced(name, category, attribute))
+
+
+def _gas_used(args, kwargs, receipts):
+    return {"transactions": len(receipts), "gas": sum(receipt.gasUsed for receipt in receipts)}
+
+
+def _batch_calls(args, kwargs, result):
+    return {"calls": len(args[2])}
+
+
+def _posted_calls(args, kwargs, result):
+    return {"calls": len(kwargs["json"])}
+
+
+def _instrument_contract():
+    from eth_wrapper import RepositoryContractWrapper
+    from web3 import HTTPProvider
+
+    for name, attribute in list(vars(RepositoryContractWrapper).items()):
+        if name.startswith("__") or name in UNTRACED_METHODS:
+            continue
+        if name.startswith("_") and name not in TRACED_PRIVATE_METHODS:
+            continue
+
+        if isinstance(attribute, classmethod):
+            setattr(RepositoryContractWrapper, name, classmethod(traced(f"contract.{name}", "contract", attribute.__func__)))
+        elif callable(attribute):
+            measure = {"wait_for_transactions": _gas_used, "_batch_call": _batch_calls}.get(name)
+            setattr(RepositoryContractWrapper, name, traced(f"contract.{name}", "contract", attribute, measure))
+
+    # Every JSON-RPC request web3 sends, named after its method, so receipt polling and gas estimates show up
+    make_request = HTTPProvider.make_request
+    HTTPProvider.make_request = lambda self, method, params: _call(method, "rpc", make_request, (self, method, params), {})
+
+    # Batches of eth_calls are posted by the wrapper itself rather than through web3
+    init = RepositoryContractWrapper.__init__
+
+    @functools.wraps(init)
+    def __init__(self, *args, **kwargs):
+        init(self, *args, **kwargs)
+        self._session.post = traced("eth_call batch", "rpc", self._session.post, _posted_calls)
+
+    RepositoryContractWrapper.__init__ = __init__
+
+
+def _sent_size(args, kwargs, result):
+    data = args[0]
+    if isinstance(data, bytes):
+        return {"bytes": len(data)}
+    if isinstance(data, str) and os.path.isfile(data):
+        return {"bytes": os.path.getsize(data)}
+    if hasattr(data, "getbuffer"):
+        return {"bytes": data.getbuffer().nbytes}
+    return {}
+
+
+def _received_size(args, kwargs, result):
+    return {"bytes": len(result)}
+
+
+def _traced_stream(name, chunks):
+    start = time.perf_counter()
+    size = 0
+    try:
+        for chunk in chunks:
+            size += len(chunk)
+            yield chunk
+    finally:
+        _record(name, "ipfs", start, time.perf_counter(), {"bytes": size})
+
+
+class _TracedNamespace(object):
+    """Records every request made through an ipfs client or one of its
+    namespaces such as client.block"""
+    def __init__(self, target, prefix):
+        self._target = target
+        self._prefix = prefix
+
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if not callable(attribute) or name.startswith("_") or name == "close":
+            return attribute
+
+        name = f"{self._prefix}.{name}"
+        measure = _received_size if name in ("ipfs.cat", "ipfs.block.get") else _sent_size
+        if name == "ipfs.cat":
+            def cat(*args, **kwargs):
+                if kwargs.get("stream"):
+                    return _traced_stream(name, attribute(*args, **kwargs))
+                return _call(name, "ipfs", attribute, args, kwargs, measure)
+            return cat
+
+        return traced(name, "ipfs", attribute, measure)
+
+
+class _TracedIPFS(_TracedNamespace):
+    def __init__(self, client):
+        super().__init__(client, "ipfs")
+
+        for namespace in IPFS_NAMESPACES:
+            setattr(self, namespace, _TracedNamespace(getattr(client, namespace), f"ipfs.{namespace}"))
+
+
+def _instrument_ipfs():
+    import transfer
+
+    connect = transfer.ipfshttpclient.connect
+    transfer.ipfshttpclient.connect = traced("ipfs.connect", "ipfs", lambda *args, **kwargs: _TracedIPFS(connect(*args, **kwargs)))
+
+
+def enable():
+    """Start recording, wrapping the contract wrapper and the ipfs client"""
+    global _events, _start
+    if enabled():
+        return
+
+    _events = []
+    _start = time.perf_counter()
+
+    _instrument_contract()
+    _instrument_ipfs()
+
+
+def summary():
+    """Return the count, total and longest time of each kind of span, along
+    with the bytes and gas they account for, the slowest first"""
+    rows = {}
+    for event in list(_events):
+        row = rows.setdefault((event["cat"], event["name"]), {
+            "category": event["cat"],
+            "name": event["name"],
+            "count": 0,
+            "total_ms": 0.0,
+            "max_ms": 0.0,
+            "bytes": 0,
+            "gas": 0,
+            "errors": 0,
+        })
+        row["count"] += 1
+        row["total_ms"] += event["dur"] / 1000
+        row["max_ms"] = max(row["max_ms"], event["dur"] / 1000)
+        row["bytes"] += event["args"].get("bytes", 0)
+        row["gas"] += event["args"].get("gas", 0)
+        row["errors"] += "error" in event["args"]
+
+    return sorted(rows.values(), key=lambda row: row["total_ms"], reverse=True)
+
+
+def print_summary(rows, outfile=sys.stderr):
+    print(f"{'category':<9} {'name':<36} {'count':>7} {'total ms':>11} {'mean ms':>9} {'max ms':>9} {'bytes':>12} {'gas':>11}", file=outfile)
+    for row in rows:
+        print(f"{row['category']:<9} {row['name']:<36} {row['count']:>7} {row['total_ms']:>11.1f} {row['total_ms'] / row['count']:>9.2f} "
+              f"{row['max_ms']:>9.1f} {row['bytes']:>12} {row['gas']:>11}", file=outfile)
+
+
+def write(path):
+    """Save the report to path.json and the Chrome trace to path.trace.json,
+    then print the summary"""
+    events = list(_events)
+    rows = summary()
+
+    report = {
+        "command": sys.argv,
+        "total_ms": round((time.perf_counter() - _start) * 1000, 1),
+        "summary": rows,
+        "events": events,
+    }
+    with open(f"{path}.json", "w") as outfile:
+        json.dump(report, outfile)
+
+    with open(f"{path}.trace.json", "w") as outfile:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, outfile)
+
+    print_summary(rows)
+    print(f"Profile written to {path}.json and {path}.trace.json", file=sys.stderr)
@@ -0,0 +1,144 @@
+import json
+import os
+
+from unixfs_hash import hash_files
+
+# The index sits next to .repodata.json and records the files of the commit
+# that is currently checked out. Alongside the ipfs hash of each file it keeps
+# the stat information the file had when that hash was recorded, so unchanged
+# files can be recognised without reading them. Files left out of a sparse
+# checkout only have their hash
+"""
+{
+    "./README.md": {
+        "ipfs_hash": "QmT78zSuBmuS4z925WZfrqQ1qHaJ56DQaTfyMUF7F8ff5o",
+        "size": 12,
+        "mtime": 1621543460123456789,
+        "inode": 1835023
+    },
+    "./assets/video.mp4": {
+        "ipfs_hash": "QmYwAPJzv5CZsnA625s3Xf2nemtYgPpHdWEz79ojWnPbdG",
+        "sparse": true
+    }
+}
+"""
+
+INDEX_FILEPATH = "./.repoindex.json"
+
+
+def load_index(root="."):
+    """Return the file_path:entry dictionary of the checked out commit in the
+    working tree at root, an empty dictionary is returned if there is no index yet"""
+    index_filepath = os.path.join(root, INDEX_FILEPATH)
+    if not os.path.exists(index_filepath):
+        return {}
+
+    with open(index_filepath, "r") as infile:
+        index = json.load(infile)
+
+    # Older indexes only stored the ipfs hash, their entries are never treated as unchanged
+    for filepath, entry in index.items():
+        if isinstance(entry, str):
+            index[filepath] = {"ipfs_hash": entry}
+
+    return index
+
+
+def save_index(index, root="."):
+    with open(os.path.join(root, INDEX_FILEPATH), "w") as outfile:
+        json.dump(index, outfile)
+
+
+def make_entry(filepath, ipfs_hash, stat=None, root="."):
+    """Create an index entry for a file, stat should be taken before the
+    file is read so that changes made while it is being read are noticed"""
+    if stat is None:
+        stat = os.stat(os.path.join(root, filepath))
+
+    return {
+        "ipfs_hash": ipfs_hash,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "inode": stat.st_ino,
+    }
+
+
+def make_sparse_entry(ipfs_hash):
+    """Create an index entry for a file of the checked out commit that was
+    left out of a sparse checkout and is not on disk"""
+    return {"ipfs_hash": ipfs_hash, "sparse": True}
+
+
+def is_sparse(entry):
+    return entry.get("sparse", False)
+
+
+def is_unchanged(filepath, entry, root="."):
+    """Check whether a file still has the stat information recorded in its
+    index entry, which means it still has the recorded ipfs hash"""
+    try:
+        stat = os.stat(os.path.join(root, filepath))
+    except FileNotFoundError:
+        return False
+
+    if entry.get("size") != stat.st_size or entry.get("mtime") != stat.st_mtime_ns or entry.get("inode") != stat.st_ino:
+        return False
+
+    # A file modified in the same clock tick as the index was written could have
+    # changed again without its mtime moving, the same "racy" case git has to handle
+    return stat.st_mtime_ns < os.stat(os.path.join(root, INDEX_FILEPATH)).st_mtime_ns
+
+
+def tree_path(root, directory):
+    """Turn a directory inside the working tree at root into the format paths
+    are stored in on the chain, so that joining a file name onto it gives a
+    path such as ./src/main.py"""
+    relative = os.path.relpath(directory, root)
+    return "." if relative == "." else os.path.join(".", relative)
+
+
+def list_working_tree(ignored_files, root="."):
+    """Return the paths of all the files in the working tree at root, in the
+    same format that they are stored on the chain"""
+    filepaths = []
+    for directory, dirs, files in os.walk(root):
+        prefix = tree_path(root, directory)
+        for name in files:
+            filepath = os.path.join(prefix, name)
+
+            if filepath in ignored_files:
+                continue
+
+            filepaths.append(filepath)
+    return filepaths
+
+
+def working_tree_status(ignored_files, chunk_threshold=None, root="."):
+    """Compare the working tree at root against the index, returning the lists
+    of modified, added and deleted files. chunk_threshold has to match the one
+    the files were committed with so that large files hash the same way"""
+    index = load_index(root)
+    filepaths = list_working_tree(ignored_files, root)
+
+    added = [f for f in filepaths if f not in index]
+    # Files left out of a sparse checkout are not on disk but have not been deleted
+    deleted = sorted(f for f in index.keys() - set(filepaths) if not is_sparse(index[f]))
+
+    # Files whose stat information changed are hashed to tell real changes apart from files that were only touched
+    suspects = [f for f in filepaths if f in index and not is_unchanged(f, index[f], root)]
+    stats = [os.stat(os.path.join(root, f)) for f in suspects]
+
+    modified = []
+    refreshed = False
+    for filepath, stat, ipfs_hash in zip(suspects, stats, hash_files([os.path.join(root, f) for f in suspects], chunk_threshold=chunk_threshold)):
+        if ipfs_hash == index[filepath]["ipfs_hash"]:
+            # Record the new stat information so the file does not need hashing again
+            index[filepath] = make_entry(filepath, ipfs_hash, stat, root)
+            refreshed = True
+        else:
+            modified.append(filepath)
+
+    if refreshed:
+        save_index(index, root)
+
+    return modified, added, deleted
@@ -0,0 +1,106 @@
+import functools
+import re
+
+# A sparse checkout only writes the files of a commit that match one of the
+# include patterns, or every file when there are none, and none of the exclude
+# patterns. Patterns are matched against paths from the root of the repository
+# and match a file itself or everything inside a directory:
+#
+#     clone <repo-address> --include src/app --include docs --exclude "*.psd"
+#
+# In a pattern * and ? match any characters as with fnmatch, and a ** path
+# component matches any number of directories including none, so src/**/test
+# matches src/test and src/lib/test. A pattern starting with ! takes back the
+# earlier patterns of the same list for the paths it matches, the last pattern
+# matching a path decides, as in a .gitignore:
+#
+#     checkout 1 --include src --include '!src/generated' --exclude "**/*.psd"
+#
+# The files that are left out are still part of the checked out commit. The
+# index keeps their hashes, so status doesn't report them as deleted and new
+# commits carry them over unchanged
+
+
+def _normalise(pattern):
+    if pattern.startswith("./"):
+        pattern = pattern[2:]
+    return pattern.rstrip("/")
+
+
+def _negated(pattern):
+    """Split a pattern into whether it starts with ! and the pattern itself, \\! is a literal !"""
+    if pattern.startswith("!"):
+        return True, pattern[1:]
+    if pattern.startswith("\\!"):
+        return False, pattern[1:]
+    return False, pattern
+
+
+@functools.lru_cache(maxsize=None)
+def _compile(pattern):
+    """Turn a pattern into a regular expression matching the paths it matches"""
+    pattern = _normalise(pattern)
+
+    parts = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith("**/", i) and (i == 0 or pattern[i - 1] == "/"):
+            # Any number of directories, including none
+            parts.append("(?:.*/)?")
+            i += 3
+            continue
+
+        if char == "*":
+            parts.append(".*")
+        elif char == "?":
+            parts.append(".")
+        elif char == "[":
+            end = i + 1
+            if end < len(pattern) and pattern[end] == "!":
+                end += 1
+            if end < len(pattern) and pattern[end] == "]":
+                end += 1
+            end = pattern.find("]", end)
+            if end == -1:
+                parts.append(re.escape(char))
+            else:
+                stuff = pattern[i + 1:end].replace("\\", "\\\\")
+                if stuff.startswith("!"):
+                    stuff = "^" + stuff[1:]
+                elif stuff.startswith("^"):
+                    stuff = "\\" + stuff
+                parts.append(f"[{stuff}]")
+                i = end
+        else:
+            parts.append(re.escape(char))
+        i += 1
+
+    # A pattern matches a file itself or everything inside a directory
+    return re.compile("".join(parts) + r"(?:/.*)?\Z", re.DOTALL)
+
+
+def matches(filepath, pattern):
+    """Check whether a path in the format stored on the chain, such as
+    ./src/main.py, is matched by a pattern, ignoring any leading !"""
+    path = filepath[2:] if filepath.startswith("./") else filepath
+    return _compile(_negated(pattern)[1]).match(path) is not None
+
+
+def matches_any(filepath, patterns, default=False):
+    """Check whether a list of patterns matches a path. The last pattern that
+    matches it decides, a negated one means it isn't matched. default is the
+    answer when none of them match"""
+    for pattern in reversed(patterns):
+        if matches(filepath, pattern):
+            return not _negated(pattern)[0]
+    return default
+
+
+def is_included(filepath, include, exclude):
+    """Check whether a file is written to disk by a checkout with the given patterns"""
+    # Without any include patterns to pick files, the negated ones take files out of all of them
+    everything = not any(not _negated(pattern)[0] for pattern in include)
+    if not matches_any(filepath, include, everything):
+        return False
+    return not matches_any(filepath, exclude)
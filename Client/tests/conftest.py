@@ -0,0 +1,80 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+
+import pytest
+
+# The client modules import each other by name from the Client directory, as they do when main.py is run
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import eth_wrapper
+import transfer
+from fakes import EthereumTester, LocalChain, LocalIPFS
+from hexbytes import HexBytes
+
+CONTRACT_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Contracts", "VCS.sol")
+
+
+@pytest.fixture
+def ipfs(monkeypatch):
+    """An in-memory ipfs node handed to every thread asking for a connection"""
+    node = LocalIPFS()
+    monkeypatch.setattr(transfer, "_thread_data", threading.local())
+    monkeypatch.setattr(transfer, "_idle_connections", [])
+    monkeypatch.setattr(transfer.ipfshttpclient, "connect", lambda **kwargs: node)
+    monkeypatch.setattr(transfer.ipfs_cluster, "IPFS_PEERS", [])
+    return node
+
+
+@pytest.fixture(scope="session")
+def contract_build(tmp_path_factory):
+    """The ABI and bytecode of the Repository contract, compiled from VCS.sol
+    when solc is installed and otherwise the build in Contracts/target"""
+    if shutil.which("solc") is None:
+        return eth_wrapper.contract_abi, eth_wrapper.contract_bin
+
+    build_dir = tmp_path_factory.mktemp("contract")
+    subprocess.run(["solc", "--abi", "--bin", CONTRACT_SOURCE, "-o", str(build_dir)], check=True)
+    with open(build_dir / "Repository.abi", "r") as infile:
+        abi = json.load(infile)
+    return abi, (build_dir / "Repository.bin").read_text()
+
+
+@pytest.fixture
+def current_build(contract_build):
+    """Skips tests of contract functions the build doesn't have"""
+    missing = eth_wrapper.missing_functions(HexBytes(contract_build[1]), contract_build[0])
+    if missing:
+        pytest.skip(f"The contract build has none of {', '.join(missing)}, install solc or rebuild it with Contracts/build.sh")
+
+
+@pytest.fixture
+def chain(monkeypatch, contract_build):
+    """An eth-tester chain the contract wrapper talks to in-process"""
+    if EthereumTester is None:
+        pytest.skip("The in-process chain needs eth-tester, install it with pip install -r requirements-dev.txt")
+
+    local_chain = LocalChain(0)
+    # install() replaces these, they are put back once the test is done
+    monkeypatch.setattr(eth_wrapper, "HTTPProvider", eth_wrapper.HTTPProvider)
+    monkeypatch.setattr(eth_wrapper, "requests", eth_wrapper.requests)
+    monkeypatch.setattr(eth_wrapper, "contract_abi", contract_build[0])
+    monkeypatch.setattr(eth_wrapper, "contract_bin", contract_build[1])
+    local_chain.install()
+    return local_chain
+
+
+@pytest.fixture
+def contract(chain):
+    """A wrapper connected to a repository freshly deployed on the chain. The
+    build is deployed as it is, a build older than the ABI acts as a repository
+    deployed before the contract had a VERSION"""
+    w3 = chain.w3
+    factory = w3.eth.contract(abi=eth_wrapper.contract_abi, bytecode=eth_wrapper.contract_bin)
+    tx_hash = factory.constructor("test").transact({"from": w3.eth.accounts[0]})
+    address = w3.eth.get_transaction_receipt(tx_hash).contractAddress
+
+    return eth_wrapper.RepositoryContractWrapper.connect_to_repository("http://in-process", chain.private_key, address)
@@ -0,0 +1,450 @@
+import hashlib
+import json
+import threading
+import time
+import types
+import urllib.parse
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ipfshttpclient.exceptions import ErrorResponse
+from web3 import Web3
+from web3.providers.eth_tester import EthereumTesterProvider
+
+try:
+    from eth_tester import EthereumTester, PyEVMBackend
+    from eth_tester.backends.pyevm.main import get_default_account_keys
+except ImportError:
+    # Only the in-process chain needs it, the client itself doesn't use it
+    EthereumTester = None
+
+import eth_wrapper
+import transfer
+from unixfs_hash import digest_to_cid, hash_bytes, read_file_node, read_leaf
+
+# Stand ins for an ipfs node, ipfs cluster and an ethereum node, used by the
+# tests and the benchmark scripts instead of real daemons
+
+# ipfs streams file contents in pieces of this size
+CAT_CHUNK_SIZE = 64 * 1024
+
+
+class LocalIPFS(object):
+    """An in-memory stand in for the parts of the ipfs http client used by the
+    client. Every request waits for the given latency and is counted"""
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+        self.requests = 0
+        self.transferred_bytes = 0
+        self._lock = threading.Lock()
+
+        self._files = {}
+        self._blocks = {}
+
+        self.block = types.SimpleNamespace(stat=self._block_stat, put=self._block_put, get=self._block_get)
+        self.dag = types.SimpleNamespace(imprt=self._dag_import)
+        self.pin = types.SimpleNamespace(add=self._pin_add)
+
+
+    def _request(self, transferred_bytes=0):
+        with self._lock:
+            self.requests += 1
+            self.transferred_bytes += transferred_bytes
+        time.sleep(self.latency)
+
+
+    def _contents(self, ipfs_hash):
+        if ipfs_hash in self._files:
+            return self._files[ipfs_hash]
+        if ipfs_hash not in self._blocks:
+            raise ErrorResponse(f"{ipfs_hash} not found", None)
+
+        block = self._blocks[ipfs_hash]
+        children = read_file_node(block)
+        if not children:
+            return read_leaf(block)
+        return b"".join(self._contents(cid) for cid, _ in children)
+
+
+    def add(self, filepath, **kwargs):
+        with open(filepath, "rb") as infile:
+            data = infile.read()
+        self._request(len(data))
+
+        ipfs_hash = hash_bytes(data)
+        self._files[ipfs_hash] = data
+        return {"Hash": ipfs_hash}
+
+
+    def add_bytes(self, data, **kwargs):
+        self._request(len(data))
+
+        ipfs_hash = hash_bytes(data)
+        self._files[ipfs_hash] = data
+        return ipfs_hash
+
+
+    def cat(self, ipfs_hash, stream=False, **kwargs):
+        data = self._contents(ipfs_hash)
+        self._request(len(data))
+
+        if stream:
+            return (data[i:i + CAT_CHUNK_SIZE] for i in range(0, len(data), CAT_CHUNK_SIZE))
+        return data
+
+
+    def _block_stat(self, cid, **kwargs):
+        self._request()
+        if cid not in self._blocks and cid not in self._files:
+            raise ErrorResponse(f"block {cid} not found", None)
+        return {"Key": cid}
+
+
+    def _block_put(self, infile, **kwargs):
+        block = infile.read()
+        self._request(len(block))
+
+        cid = digest_to_cid(hashlib.sha256(block).digest())
+        self._blocks[cid] = block
+        return {"Key": cid}
+
+
+    def _block_get(self, cid, **kwargs):
+        block = self._blocks[cid]
+        self._request(len(block))
+        return block
+
+
+    def _dag_import(self, infile, **kwargs):
+        car = infile.read()
+        self._request(len(car))
+
+        # A header then (CID, block) records, each prefixed with its length. Packs only hold CIDv0 blocks
+        length, position = _read_varint(car, 0)
+        position += length
+        while position < len(car):
+            length, position = _read_varint(car, position)
+            record = car[position:position + length]
+            position += length
+            self._blocks[digest_to_cid(record[2:34])] = record[34:]
+        return {}
+
+
+    def _pin_add(self, ipfs_hash, **kwargs):
+        self._request()
+        return {"Pins": [ipfs_hash]}
+
+
+    def close(self):
+        pass
+
+
+    def install(self):
+        """Hand this node to every thread asking for an ipfs connection"""
+        transfer.ipfshttpclient.connect = lambda **kwargs: self
+
+
+def _read_varint(data, position):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if byte < 0x80:
+            return value, position
+
+
+class StubPeer(object):
+    """Enough of the ipfs HTTP API for cat and add, over a store shared by
+    every peer as if the cluster had already replicated it"""
+    def __init__(self, store, latency, capacity):
+        self.store = store
+        self.latency = latency
+        self.requests = 0
+        self.breaks_off = False
+
+        slots = threading.Semaphore(capacity)
+        peer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                url = urllib.parse.urlparse(self.path)
+                query = urllib.parse.parse_qs(url.query)
+                body = self._read_body()
+
+                with slots:
+                    peer.requests += 1
+                    time.sleep(peer.latency)
+
+                    if url.path == "/api/v0/version":
+                        self._reply(json.dumps({"Version": "0.7.0"}).encode(), "application/json")
+                    elif url.path == "/api/v0/cat":
+                        data = peer.store[query["arg"][0]][int(query.get("offset", ["0"])[0]):]
+                        if peer.breaks_off:
+                            # Promise all of it, send half and hang up
+                            self._reply(data, "application/octet-stream", len(data) // 2)
+                        else:
+                            self._reply(data, "application/octet-stream")
+                    elif url.path == "/api/v0/add":
+                        data = _multipart_file(self.headers["Content-Type"], body)
+                        ipfs_hash = hash_bytes(data)
+                        peer.store[ipfs_hash] = data
+                        self._reply(json.dumps({"Name": ipfs_hash, "Hash": ipfs_hash, "Size": str(len(data))}).encode(), "application/json")
+                    else:
+                        self.send_error(404)
+
+            def _read_body(self):
+                if self.headers.get("Transfer-Encoding") != "chunked":
+                    return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+                body = b""
+                while True:
+                    size = int(self.rfile.readline().strip(), 16)
+                    body += self.rfile.read(size)
+                    self.rfile.readline()
+                    if size == 0:
+                        return body
+
+            def _reply(self, data, content_type, sent=None):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data[:sent])
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.address = f"/ip4/127.0.0.1/tcp/{self.server.server_port}/http"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class StubCluster(object):
+    """Records the pins requested through the cluster REST API"""
+    def __init__(self):
+        self.pins = {}
+        cluster = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                url = urllib.parse.urlparse(self.path)
+                cid = url.path[len("/pins/"):]
+                cluster.pins[cid] = {k: v[0] for k, v in urllib.parse.parse_qs(url.query).items()}
+
+                data = json.dumps({"cid": cid}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+def _multipart_file(content_type, body):
+    boundary = content_type.split("boundary=")[1].strip('"').encode()
+    part = body.split(b"--" + boundary)[1]
+    return part.split(b"\r\n\r\n", 1)[1][:-len(b"\r\n")]
+
+
+# Enough for the largest commit transactions, the same as mainnet
+BLOCK_GAS_LIMIT = 30000000
+
+
+class LocalChain(object):
+    """An eth-tester chain the wrapper talks to in-process. Every JSON-RPC
+    request waits for the given latency and is counted, a batch counts as one
+    request made up of several calls"""
+    def __init__(self, latency):
+        genesis = PyEVMBackend._generate_genesis_params(overrides={"gas_limit": BLOCK_GAS_LIMIT})
+        self.tester = EthereumTester(PyEVMBackend(genesis_parameters=genesis))
+        self.private_key = get_default_account_keys()[0].to_hex()
+        self.latency = latency
+
+        self.requests = 0
+        self.calls = 0
+        self.transactions = []
+        self._lock = threading.Lock()
+
+        # Receipts are read through a connection of our own so they don't add to the counts
+        self.w3 = Web3(EthereumTesterProvider(self.tester))
+        self.provider = _CountingProvider(self, self.tester)
+
+
+    def request(self, calls=1):
+        with self._lock:
+            self.requests += 1
+            self.calls += calls
+        time.sleep(self.latency)
+
+
+    def gas_used(self, transactions):
+        return sum(self.w3.eth.get_transaction_receipt(tx_hash).gasUsed for tx_hash in transactions)
+
+
+    def install(self):
+        """Point the wrapper at this chain instead of a node"""
+        eth_wrapper.HTTPProvider = lambda conn_url: self.provider
+        eth_wrapper.requests = types.SimpleNamespace(Session=lambda: _LocalSession(self))
+
+
+class _CountingProvider(EthereumTesterProvider):
+    def __init__(self, chain, tester):
+        super().__init__(tester)
+        self._chain = chain
+
+
+    def make_request(self, method, params):
+        self._chain.request()
+        if method == "eth_estimateGas" and params[1:] == ["pending"]:
+            # eth-tester mines every transaction as soon as it is sent, so the pending state is the latest block
+            params = [params[0], "latest"]
+        response = super().make_request(method, params)
+        if method == "eth_sendRawTransaction" and "result" in response:
+            self._chain.transactions.append(response["result"])
+        return response
+
+
+class _LocalResponse(object):
+    def __init__(self, replies):
+        self._replies = replies
+
+
+    def raise_for_status(self):
+        pass
+
+
+    def json(self):
+        return self._replies
+
+
+class _LocalSession(object):
+    """Answers the JSON-RPC batches of eth_calls the wrapper posts"""
+    def __init__(self, chain):
+        self._chain = chain
+
+
+    def post(self, url, json):
+        self._chain.request(len(json))
+
+        replies = []
+        for request in json:
+            try:
+                result = self._chain.w3.eth.call(*request["params"]).hex()
+            except Exception as e:
+                replies.append({"jsonrpc": "2.0", "id": request["id"], "error": str(e)})
+                continue
+            replies.append({"jsonrpc": "2.0", "id": request["id"], "result": result})
+
+        return _LocalResponse(replies)
+
+
+class LocalRepository(object):
+    """An in-memory stand in for the getters of RepositoryContractWrapper that
+    the metadata mirror reads from. Every call is recorded with the ids asked for"""
+    def __init__(self, owner="0x" + "a1" * 20):
+        self.owner = owner
+        self.branches = [[owner, "master"]]
+        self.editors = {0: []}
+        # The null commit at the start of the repository
+        self.commits = [[owner, 0, "", 0, 0, False, 0]]
+        self.pending = set()
+        self.file_sets = {}
+        self.files = []
+        self.commit_files = {0: []}
+        self.calls = []
+
+
+    def add_branch(self, name, editors=()):
+        self.branches.append([self.owner, name])
+        self.editors[len(self.branches) - 1] = list(editors)
+        return len(self.branches) - 1
+
+
+    def add_commit(self, files, branch_id=0, comment="", previous=None, previous2=None, pending=False, file_set=None):
+        """Add a commit with a path:ipfs_hash dictionary of files, or sharing the
+        files of the commit file_set. Returns its id"""
+        commit_id = len(self.commits)
+        previous = commit_id - 1 if previous is None else previous
+        self.commits.append([self.owner, branch_id, comment, commit_id, previous, previous2 is not None, previous2 or 0])
+
+        self.commit_files[commit_id] = []
+        if file_set is not None:
+            self.file_sets[commit_id] = file_set
+        for filepath, ipfs_hash in files.items():
+            self.commit_files[commit_id].append(len(self.files))
+            self.files.append([filepath, ipfs_hash, commit_id])
+
+        if pending:
+            self.pending.add(commit_id)
+        return commit_id
+
+
+    def _record(self, name, ids):
+        self.calls.append((name, list(ids)))
+
+
+    def get_branch_count(self):
+        return len(self.branches)
+
+
+    def get_branches(self, ids):
+        self._record("get_branches", ids)
+        return [list(self.branches[i]) for i in ids]
+
+
+    def get_branches_editors(self, ids):
+        self._record("get_branches_editors", ids)
+        return [list(self.editors[i]) for i in ids]
+
+
+    def get_branch_editors(self, branch_id):
+        self._record("get_branch_editors", [branch_id])
+        return list(self.editors[branch_id])
+
+
+    def get_commits_count(self):
+        return len(self.commits)
+
+
+    def get_commits(self, ids):
+        self._record("get_commits", ids)
+        return [list(self.commits[i]) for i in ids]
+
+
+    def get_commits_pending(self, ids):
+        self._record("get_commits_pending", ids)
+        return [i in self.pending for i in ids]
+
+
+    def get_file_set_commits(self, ids):
+        self._record("get_file_set_commits", ids)
+        return [self.file_sets.get(i, i) for i in ids]
+
+
+    def get_files_from_commits(self, ids):
+        self._record("get_files_from_commits", ids)
+        return [list(self.commit_files[i]) for i in ids]
+
+
+    def get_files(self, ids):
+        self._record("get_files", ids)
+        return [list(self.files[i]) for i in ids]
+
+
+    def most_recent_commit(self, branch_id):
+        return max(i for i, commit in enumerate(self.commits) if commit[1] == branch_id and i not in self.pending)
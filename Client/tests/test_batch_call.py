@@ -0,0 +1,74 @@
+import pytest
+
+
+def record_batches(contract, reorder=None):
+    """Record the number of calls in each batch posted, reorder is applied to
+    the replies before the wrapper sees them"""
+    post = contract._session.post
+    sizes = []
+
+    def recording_post(url, json):
+        sizes.append(len(json))
+        response = post(url, json)
+        if reorder is not None:
+            replies = reorder(response.json())
+            response.json = lambda: replies
+        return response
+
+    contract._session.post = recording_post
+    return sizes
+
+
+def fork_branches(contract, count):
+    for i in range(count):
+        contract.fork_new_branch(f"branch{i}", 0)
+    return list(range(contract.get_branch_count()))
+
+
+def test_batches_are_split(contract):
+    contract.batch_size = 3
+    branch_ids = fork_branches(contract, 7)
+    sizes = record_batches(contract)
+
+    branches = contract.get_branches(branch_ids)
+
+    assert sizes == [3, 3, 2]
+    assert branches == [contract.get_branch(i) for i in branch_ids]
+    assert [branch[1] for branch in branches[1:]] == [f"branch{i}" for i in range(7)]
+
+
+def test_replies_out_of_order(contract):
+    contract.batch_size = 4
+    branch_ids = fork_branches(contract, 5)
+    record_batches(contract, reorder=lambda replies: list(reversed(replies)))
+
+    # Each result goes back with the arguments it was asked for whatever order the node replies in
+    assert contract.get_branches(branch_ids) == [contract.get_branch(i) for i in branch_ids]
+    assert contract.get_commits(list(reversed(range(3)))) == [contract.get_commit(i) for i in reversed(range(3))]
+
+
+def test_tuples_and_single_values(contract):
+    branch_ids = fork_branches(contract, 2)
+
+    # Functions with several outputs give lists and those with one give the value itself, like call() does
+    assert contract.get_commits([0]) == [contract.get_commit(0)]
+    assert contract.get_branches_editors(branch_ids) == [contract.get_branch_editors(i) for i in branch_ids]
+
+
+def test_empty_list_sends_nothing(contract):
+    sizes = record_batches(contract)
+    assert contract.get_branches([]) == []
+    assert sizes == []
+
+
+def test_failed_call(contract):
+    # Branch 5 doesn't exist so its call reverts
+    with pytest.raises(ValueError, match=r"Call to GetBranchEditors\(5,\) failed"):
+        contract.get_branches_editors([0, 5])
+
+
+def test_rejected_batch(contract):
+    record_batches(contract, reorder=lambda replies: {"jsonrpc": "2.0", "id": None, "error": "batch too large"})
+
+    with pytest.raises(ValueError, match="Batch request for branches failed"):
+        contract.get_branches([0])
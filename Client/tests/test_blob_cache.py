@@ -0,0 +1,40 @@
+import os
+
+from blob_cache import BlobCache
+from fakes import CAT_CHUNK_SIZE, LocalIPFS
+
+
+def add(ipfs, tmp_path, size):
+    source = tmp_path / "source"
+    source.write_bytes(os.urandom(size))
+    return ipfs.add(str(source))["Hash"], source.read_bytes()
+
+
+def test_cat_to_file_streams_from_ipfs_then_cache(tmp_path):
+    ipfs = LocalIPFS()
+    ipfshash, data = add(ipfs, tmp_path, 5 * CAT_CHUNK_SIZE + 123)
+    cache = BlobCache(str(tmp_path / "cache"), max_bytes=len(data))
+
+    target = tmp_path / "target"
+    cache.cat_to_file(ipfs, ipfshash, str(target), buffer_size=4096)
+    assert target.read_bytes() == data
+    assert cache.get(ipfshash) == data
+    assert ipfs.requests == 2
+
+    # The second time it comes from the cache
+    target.unlink()
+    cache.cat_to_file(ipfs, ipfshash, str(target), buffer_size=4096)
+    assert target.read_bytes() == data
+    assert ipfs.requests == 2
+    assert [p.name for p in tmp_path.iterdir() if p.name.startswith(".tmp-")] == []
+
+
+def test_cat_to_file_without_cache(tmp_path):
+    ipfs = LocalIPFS()
+    ipfshash, data = add(ipfs, tmp_path, 3 * CAT_CHUNK_SIZE)
+    cache = BlobCache(str(tmp_path / "cache"), max_bytes=0)
+
+    target = tmp_path / "target"
+    cache.cat_to_file(ipfs, ipfshash, str(target))
+    assert target.read_bytes() == data
+    assert cache.path(ipfshash) is None
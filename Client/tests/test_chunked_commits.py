@@ -0,0 +1,100 @@
+import pytest
+
+import eth_wrapper
+from metadata_mirror import MetadataMirror
+from unixfs_hash import hash_bytes
+
+# These need the contract functions added for commits spread over several transactions
+pytestmark = pytest.mark.usefixtures("current_build")
+
+# Small enough that a handful of files already take several transactions
+CHUNK_SIZE = 10
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(eth_wrapper, "COMMIT_CHUNK_SIZE", CHUNK_SIZE)
+    monkeypatch.setattr(eth_wrapper, "RECEIPT_POLL_INTERVAL", 0)
+
+
+def make_files(count, packable=True):
+    file_paths = [f"./src/file{i}.txt" for i in range(count)]
+    # Hashes that aren't CIDs can't be packed, so they are sent as ';' separated strings
+    ipfs_hashes = [hash_bytes(f"contents {i}\n".encode()) if packable else f"hash{i}" for i in range(count)]
+    return file_paths, ipfs_hashes
+
+
+def committed_files(contract, commit_id):
+    return [filedata[:2] for filedata in contract.get_files(contract.get_files_from_commit(commit_id))]
+
+
+@pytest.mark.parametrize("packable", [True, False])
+def test_commit_larger_than_a_chunk(chain, contract, packable):
+    file_paths, ipfs_hashes = make_files(2 * CHUNK_SIZE + 5, packable)
+    head = contract.most_recent_commit(0)
+    start = len(chain.transactions)
+
+    contract.make_commit(file_paths, ipfs_hashes, 0, head, "large commit")
+
+    # BeginCommit, 3 batches of files and FinalizeCommit
+    assert len(chain.transactions) - start == 5
+
+    commit_id = contract.most_recent_commit(0)
+    assert commit_id != head
+    assert contract.get_commit(commit_id)[2] == "large commit"
+    assert contract.get_commits_pending([commit_id]) == [False]
+    assert contract.get_commits_from_branch(0)[-1] == commit_id
+    assert committed_files(contract, commit_id) == [list(f) for f in zip(file_paths, ipfs_hashes)]
+
+
+def test_multi_parent_commit_larger_than_a_chunk(contract):
+    file_paths, ipfs_hashes = make_files(CHUNK_SIZE + 1)
+    contract.make_commit(file_paths[:1], ipfs_hashes[:1], 0, contract.most_recent_commit(0))
+    first = contract.most_recent_commit(0)
+    contract.fork_new_branch("feature", 0)
+
+    contract.make_commit_multiparent(file_paths, ipfs_hashes, 0, first, contract.most_recent_commit(1), "merge")
+
+    commit = contract.get_commit(contract.most_recent_commit(0))
+    assert commit[4:] == [first, True, contract.most_recent_commit(1)]
+
+
+def test_unfinalized_commit_stays_out_of_the_branch(chain, contract, tmp_path):
+    functions = contract._repo_contract.functions
+    file_paths, ipfs_hashes = make_files(3, packable=False)
+    head = contract.most_recent_commit(0)
+
+    receipt = contract._send_transaction(functions.BeginCommit(0, head, False, 0, "unfinished"))
+    commit_id = contract._repo_contract.events.CommitStarted().processReceipt(receipt)[0].args.commitID
+    contract._send_transaction(functions.AddFilesToCommit(commit_id, ";".join(file_paths), ";".join(ipfs_hashes)))
+
+    # The commit exists but isn't part of the branch's history until it is finalized
+    assert contract.get_commits_count() == commit_id + 1
+    assert contract.get_commits_pending([commit_id]) == [True]
+    assert commit_id not in contract.get_commits_from_branch(0)
+    assert contract.get_commits_count(0) == len(contract.get_commits_from_branch(0))
+    assert contract.most_recent_commit(0) == head
+    # Only the null commit has been announced
+    assert [i for i, _ in contract.iter_commit_events()] == [0]
+
+    mirror = MetadataMirror(contract, str(tmp_path / "mirror.sqlite"))
+    mirror.sync()
+    assert commit_id not in [i for i, _ in mirror.get_commits_from_branch(0)]
+    assert mirror.get_files_from_commit(commit_id) == []
+
+    contract._send_transaction(functions.FinalizeCommit(commit_id))
+
+    assert contract.get_commits_from_branch(0)[-1] == commit_id
+    assert contract.most_recent_commit(0) == commit_id
+    mirror.sync()
+    assert [i for i, _ in mirror.get_commits_from_branch(0)][-1] == commit_id
+    assert [f[:2] for f in mirror.get_files_from_commit(commit_id)] == [list(f) for f in zip(file_paths, ipfs_hashes)]
+
+
+def test_finalized_commit_takes_no_more_files(contract):
+    file_paths, ipfs_hashes = make_files(CHUNK_SIZE + 1)
+    contract.make_commit(file_paths, ipfs_hashes, 0, contract.most_recent_commit(0))
+    commit_id = contract.most_recent_commit(0)
+
+    with pytest.raises(Exception):
+        contract._send_transaction(contract._repo_contract.functions.AddFilesToCommit(commit_id, "./late.txt", "late"))
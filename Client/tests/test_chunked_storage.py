@@ -0,0 +1,102 @@
+import io
+import random
+import sys
+
+import vcs
+from blob_cache import BlobCache
+from chunked_storage import upload_chunked_file
+from unixfs_hash import CDC_MAX_CHUNK, chunk_file, hash_files
+
+MEGABYTE = 1024 * 1024
+
+
+def write(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def random_bytes(size, seed=0):
+    return random.Random(seed).randbytes(size)
+
+
+def test_upload_round_trip(ipfs, tmp_path):
+    data = random_bytes(3 * MEGABYTE)
+    filepath = write(tmp_path / "large.bin", data)
+
+    root, sent = upload_chunked_file(filepath)
+    assert root == hash_files([filepath], chunk_threshold=MEGABYTE)[0]
+    assert sent == len(data)
+    assert ipfs.cat(root) == data
+    assert b"".join(ipfs.cat(root, stream=True)) == data
+
+    # Every chunk is already held by the node the second time
+    assert upload_chunked_file(filepath) == (root, 0)
+
+
+def test_insertion_only_changes_nearby_chunks(ipfs, tmp_path):
+    data = random_bytes(4 * MEGABYTE)
+    old_path = write(tmp_path / "old.bin", data)
+    edited = data[:MEGABYTE] + b"inserted" * 100 + data[MEGABYTE:]
+    new_path = write(tmp_path / "new.bin", edited)
+
+    old_root, old_leaves, _ = chunk_file(old_path)
+    new_root, new_leaves, _ = chunk_file(new_path)
+    assert old_root != new_root
+
+    # The boundaries line up again after the insertion, so the chunks before and after it are shared
+    old_cids = {cid for _, _, cid in old_leaves}
+    changed = [leaf for leaf in new_leaves if leaf[2] not in old_cids]
+    assert 1 <= len(changed) <= 2
+    assert len(new_leaves) > 4
+
+    upload_chunked_file(old_path)
+    root, sent = upload_chunked_file(new_path)
+    assert root == new_root
+    assert sent == sum(length for _, length, _ in changed) <= 2 * CDC_MAX_CHUNK
+    assert ipfs.cat(root) == edited
+
+
+def test_chunking_is_stable(tmp_path):
+    data = random_bytes(2 * MEGABYTE, seed=1)
+    first = chunk_file(write(tmp_path / "a.bin", data))
+    second = chunk_file(write(tmp_path / "b.bin", data))
+    assert first == second
+
+    # An edit at the end of the file leaves every chunk before it alone
+    third = chunk_file(write(tmp_path / "c.bin", data + b"appended"))
+    assert third[1][:-1] == first[1][:-1]
+
+
+def make_repository(tmp_path):
+    repository = vcs.Repository(str(tmp_path / "repo"), blob_cache=BlobCache(str(tmp_path / "cache")), output=io.StringIO(), jobs=4)
+    repository.chunk_threshold = MEGABYTE
+    store = BlobCache(str(tmp_path / "queued"), max_bytes=sys.maxsize)
+    return repository, store
+
+
+def test_upload_blobs_keeps_matching_roots(ipfs, tmp_path):
+    repository, store = make_repository(tmp_path)
+    data = random_bytes(2 * MEGABYTE, seed=2)
+    filepath = write(tmp_path / "large.bin", data)
+    ipfshash = hash_files([filepath], chunk_threshold=MEGABYTE)[0]
+    store.put_file(ipfshash, filepath)
+
+    packs, renamed = repository._upload_blobs({ipfshash: len(data)}, store)
+    assert (packs, renamed) == ([], {})
+    assert ipfs.cat(ipfshash) == data
+
+
+def test_upload_blobs_renames_a_different_root(ipfs, tmp_path):
+    repository, store = make_repository(tmp_path)
+    data = random_bytes(2 * MEGABYTE, seed=3)
+    filepath = write(tmp_path / "large.bin", data)
+
+    # Queued under the hash of the whole file rather than of its chunks
+    queued = hash_files([filepath])[0]
+    store.put_file(queued, filepath)
+
+    _, renamed = repository._upload_blobs({queued: len(data)}, store)
+    root = chunk_file(filepath)[0]
+    assert renamed == {queued: root}
+    assert ipfs.cat(root) == data
+    assert f"WARNING: ipfs hashed {queued} as {root}" in repository.output.getvalue()
@@ -0,0 +1,119 @@
+import pytest
+
+import eth_wrapper
+from unixfs_hash import hash_bytes
+
+# These need the contract functions that emit the events and the block the repository was deployed in
+pytestmark = pytest.mark.usefixtures("current_build")
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(eth_wrapper, "RECEIPT_POLL_INTERVAL", 0)
+
+
+@pytest.fixture
+def editor(chain, contract):
+    """A wrapper for a second account that is an editor of the mainline branch"""
+    from eth_tester.backends.pyevm.main import get_default_account_keys
+
+    other = eth_wrapper.RepositoryContractWrapper.connect_to_repository("http://in-process", get_default_account_keys()[1].to_hex(), contract.repository_address)
+    contract.add_editor_to_branch(0, other.account_address)
+    return other
+
+
+def commit(contract, branch_id, comment, timestamp=None, chain=None):
+    """Make a commit of a single file on top of the branch's head, at the given block time"""
+    if timestamp is not None:
+        chain.tester.time_travel(timestamp)
+    contract.make_commit(["./file.txt"], [hash_bytes(comment.encode())], branch_id, contract.most_recent_commit(branch_id), comment)
+    return contract.most_recent_commit(branch_id)
+
+
+def commit_ids(events):
+    return [commit_id for commit_id, _ in events]
+
+
+def test_commits_newest_first(contract):
+    made = [commit(contract, 0, f"commit {i}") for i in range(1, 6)]
+
+    events = list(contract.iter_commit_events())
+
+    # The null commit made by the constructor is announced too
+    assert commit_ids(events) == list(reversed(made)) + [0]
+    # In the same form as get_commit
+    for commit_id, event_commit in events:
+        assert event_commit == contract.get_commit(commit_id)
+    assert events[0][1][2] == "commit 5"
+    assert events[0][1][4] == made[3]
+
+
+def test_filters_by_branch_and_author(contract, editor):
+    first = commit(contract, 0, "owner on mainline")
+    contract.fork_new_branch("feature", 0)
+    second = commit(contract, 1, "owner on feature")
+    third = commit(editor, 0, "editor on mainline")
+
+    assert commit_ids(contract.iter_commit_events(branch_id=1)) == [second, contract.get_commits_from_branch(1)[0]]
+    assert commit_ids(contract.iter_commit_events(author=editor.account_address)) == [third]
+    assert commit_ids(contract.iter_commit_events(branch_id=0, author=contract.account_address)) == [first, 0]
+
+
+def test_stops_at_since(chain, contract):
+    start = chain.w3.eth.get_block("latest").timestamp + 100
+    made = [commit(contract, 0, f"commit {i}", start + 10 * i, chain) for i in range(1, 6)]
+
+    assert commit_ids(contract.iter_commit_events(since=start + 30)) == made[:1:-1]
+
+
+def test_reads_back_through_empty_blocks(chain, contract, monkeypatch):
+    monkeypatch.setattr(eth_wrapper, "LOG_BLOCK_RANGE", 2)
+    monkeypatch.setattr(eth_wrapper, "MAX_LOG_BLOCK_RANGE", 8)
+
+    first = commit(contract, 0, "first")
+    chain.tester.mine_blocks(30)
+    second = commit(contract, 0, "second")
+    chain.tester.mine_blocks(3)
+
+    events = contract.iter_commit_events()
+
+    # The newest commit comes back before the older blocks are searched
+    assert next(events)[0] == second
+    assert commit_ids(events) == [first, 0]
+
+
+def test_created_commit_ids(contract):
+    head = contract.most_recent_commit(0)
+    with contract.pipeline() as receipts:
+        contract.make_commit(["./a.txt"], [hash_bytes(b"a")], 0, head, "queued")
+        contract.fork_new_branch("feature", 0)
+        contract.add_editor_to_branch(1, "0x" + "b0" * 20)
+
+    # The fork makes the first commit of the new branch, adding an editor makes none
+    assert contract.created_commit_ids(receipts) == [contract.most_recent_commit(0), contract.most_recent_commit(1), None]
+
+
+def test_branch_forked(contract):
+    source = commit(contract, 0, "before the fork")
+    receipt = contract.fork_new_branch("feature", 0)
+
+    forked = contract._repo_contract.events.BranchForked().processReceipt(receipt)
+    assert len(forked) == 1
+    args = forked[0].args
+    assert (args.branchID, args.sourceBranchID, args.owner, args.name) == (1, 0, contract.account_address, "feature")
+    assert contract.get_branch(1)[1] == "feature"
+
+    # The new branch starts with a commit on top of the source branch's head
+    created = contract._repo_contract.events.CommitCreated().processReceipt(receipt)
+    assert len(created) == 1
+    args = created[0].args
+    assert args.commitID == contract.most_recent_commit(1)
+    assert (args.branchID, args.author, args.previous, args.multi_parent, args.comment) == (1, contract.account_address, source, False, "before the fork")
+    assert args.creation_time == contract.get_commit(args.commitID)[3]
+
+
+def test_editor_changed(contract, editor):
+    receipt = contract.remove_editor_from_branch(0, editor.account_address)
+
+    args = contract._repo_contract.events.EditorChanged().processReceipt(receipt)[0].args
+    assert (args.branchID, args.editor, args.added) == (0, editor.account_address, False)
@@ -0,0 +1,176 @@
+import random
+
+import pytest
+
+from commit_graph import CommitGraph
+
+
+class Mirror(object):
+    """The parent links of commits the way the metadata mirror gives them, the
+    null commit 0 points back at itself"""
+    def __init__(self, parents):
+        self.parents = parents
+
+
+    def get_commit_parents(self, start):
+        rows = []
+        for commit_id, parents in enumerate(self.parents[start:], start):
+            previous = parents[0] if parents else 0
+            rows.append((commit_id, previous, len(parents) > 1, parents[1] if len(parents) > 1 else 0))
+        return rows
+
+
+class CountingGraph(CommitGraph):
+    """Counts the commits whose parents were looked up"""
+    visited = 0
+
+    def parents(self, commit_id):
+        self.visited += 1
+        return super().parents(commit_id)
+
+
+def make_graph(tmp_path, parents, graph_class=CommitGraph):
+    graph = graph_class(str(tmp_path / "graph"))
+    graph.update(Mirror(parents))
+    return graph
+
+
+def ancestors(parents, commit_id):
+    found = set()
+    stack = [commit_id]
+    while stack:
+        current = stack.pop()
+        if current not in found:
+            found.add(current)
+            stack.extend(parents[current])
+    return found
+
+
+def lowest_common_ancestors(parents, commit1, commit2):
+    common = ancestors(parents, commit1) & ancestors(parents, commit2)
+    return sorted(c for c in common if not any(other != c and c in ancestors(parents, other) for other in common))
+
+
+# Commit 0 is the null commit, each list holds the parents of the commit at its index
+LINEAR = [[], [0], [1], [2], [3]]
+
+#   1 - 2 - 4
+#    \     /
+#     3 - 5
+FORKED = [[], [0], [1], [1], [2], [3, 2]]
+
+# 3 and 4 each merge both 1 and 2, so 1 and 2 are both lowest common ancestors of 5 and 6
+#     1 - 3 - 5
+#   /   X
+# 0 - 2 - 4 - 6
+CRISS_CROSS = [[], [0], [0], [1, 2], [2, 1], [3], [4]]
+
+
+def test_generations(tmp_path):
+    graph = make_graph(tmp_path, CRISS_CROSS)
+    assert list(graph.generation) == [1, 2, 2, 3, 3, 4, 4]
+    assert graph.parents(0) == []
+    assert graph.parents(3) == [1, 2]
+
+
+def test_saved_graph_is_extended(tmp_path):
+    make_graph(tmp_path, FORKED[:4])
+
+    graph = CommitGraph(str(tmp_path / "graph"))
+    assert len(graph) == 4
+    graph.update(Mirror(FORKED))
+    assert len(graph) == len(FORKED)
+    assert list(CommitGraph(str(tmp_path / "graph")).generation) == list(graph.generation)
+
+
+@pytest.mark.parametrize("parents, commit1, commit2, expected", [
+    (LINEAR, 4, 2, [2]),
+    (LINEAR, 3, 3, [3]),
+    (FORKED, 4, 3, [1]),
+    (FORKED, 4, 5, [2]),
+    (CRISS_CROSS, 5, 6, [1, 2]),
+    (CRISS_CROSS, 3, 4, [1, 2]),
+    (CRISS_CROSS, 6, 4, [4]),
+])
+def test_merge_bases(tmp_path, parents, commit1, commit2, expected):
+    graph = make_graph(tmp_path, parents)
+    assert sorted(graph.merge_bases(commit1, commit2)) == expected
+    assert sorted(graph.merge_bases(commit2, commit1)) == expected
+
+
+def test_merge_base_picks_one_of_a_criss_cross(tmp_path):
+    graph = make_graph(tmp_path, CRISS_CROSS)
+    # Both have the same generation, the newer commit is picked the same way from either side
+    assert graph.merge_base(5, 6) == graph.merge_base(6, 5) == 2
+
+
+@pytest.mark.parametrize("parents, ancestor, commit_id, expected", [
+    (LINEAR, 1, 4, True),
+    (LINEAR, 4, 1, False),
+    (LINEAR, 2, 2, True),
+    (FORKED, 3, 4, False),
+    (FORKED, 3, 5, True),
+    (FORKED, 2, 5, True),
+    (CRISS_CROSS, 2, 5, True),
+    (CRISS_CROSS, 3, 6, False),
+])
+def test_is_ancestor(tmp_path, parents, ancestor, commit_id, expected):
+    assert make_graph(tmp_path, parents).is_ancestor(ancestor, commit_id) == expected
+
+
+@pytest.mark.parametrize("parents, commit1, commit2, expected", [
+    (LINEAR, 4, 2, (2, 0)),
+    (LINEAR, 2, 4, (0, 2)),
+    (FORKED, 4, 3, (2, 1)),
+    (FORKED, 5, 4, (2, 1)),
+    (CRISS_CROSS, 5, 6, (2, 2)),
+])
+def test_ahead_behind(tmp_path, parents, commit1, commit2, expected):
+    assert make_graph(tmp_path, parents).ahead_behind(commit1, commit2) == expected
+
+
+def random_history(seed, count):
+    rng = random.Random(seed)
+    parents = [[], [0]]
+    for commit_id in range(2, count):
+        first = rng.randrange(max(1, commit_id - 5), commit_id)
+        if rng.random() < 0.3:
+            second = rng.randrange(1, commit_id)
+            if second != first:
+                parents.append([first, second])
+                continue
+        parents.append([first])
+    return parents
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_walking_every_ancestor(tmp_path, seed):
+    parents = random_history(seed, 60)
+    graph = make_graph(tmp_path, parents)
+
+    rng = random.Random(seed)
+    for _ in range(40):
+        commit1, commit2 = rng.randrange(len(parents)), rng.randrange(len(parents))
+        reachable1, reachable2 = ancestors(parents, commit1), ancestors(parents, commit2)
+
+        assert sorted(graph.merge_bases(commit1, commit2)) == lowest_common_ancestors(parents, commit1, commit2)
+        assert graph.is_ancestor(commit1, commit2) == (commit1 in reachable2)
+        assert graph.ahead_behind(commit1, commit2) == (len(reachable1 - reachable2), len(reachable2 - reachable1))
+
+
+def test_generations_prune_the_walks(tmp_path):
+    # A long history with 2 short branches forked off the top of it
+    parents = [[], [0]] + [[i] for i in range(1, 2000)]
+    top = len(parents) - 1
+    parents += [[top], [top + 1], [top], [top + 3]]
+    graph = make_graph(tmp_path, parents, CountingGraph)
+
+    # A commit with a larger generation can't be an ancestor, nothing is walked
+    assert not graph.is_ancestor(top, 1000)
+    assert graph.visited == 0
+
+    # The walk stops at the fork rather than going down the whole history
+    assert graph.merge_base(top + 2, top + 4) == top
+    assert graph.ahead_behind(top + 2, top + 4) == (2, 2)
+    assert graph.is_ancestor(top - 1, top + 4)
+    assert graph.visited < 20
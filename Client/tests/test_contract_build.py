@@ -0,0 +1,35 @@
+import json
+import shutil
+import subprocess
+
+import pytest
+from hexbytes import HexBytes
+
+import eth_wrapper
+from conftest import CONTRACT_SOURCE
+
+pytestmark = pytest.mark.skipif(shutil.which("solc") is None, reason="Checking the committed build needs solc")
+
+
+@pytest.fixture(scope="module")
+def fresh_build(tmp_path_factory):
+    """VCS.sol compiled the way Contracts/build.sh does it"""
+    build_dir = tmp_path_factory.mktemp("fresh")
+    subprocess.run(["solc", "--abi", "--bin", CONTRACT_SOURCE, "-o", str(build_dir)], check=True)
+    with open(build_dir / "Repository.abi", "r") as infile:
+        return json.load(infile), (build_dir / "Repository.bin").read_text()
+
+
+def by_name(abi):
+    return sorted(abi, key=lambda entry: (entry["type"], entry.get("name", "")))
+
+
+def test_committed_abi_is_the_compiled_one(fresh_build):
+    # Contracts/target is only ever written by build.sh, run it after changing VCS.sol
+    with open(eth_wrapper.CONTRACT_ABI_FILEPATH, "r") as infile:
+        committed = json.load(infile)
+    assert by_name(committed) == by_name(fresh_build[0])
+
+
+def test_committed_bin_implements_the_abi(fresh_build):
+    assert eth_wrapper.missing_functions(HexBytes(eth_wrapper.contract_bin), fresh_build[0]) == []
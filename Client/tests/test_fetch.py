@@ -0,0 +1,124 @@
+import io
+import os
+
+import pytest
+
+import repo_index
+import vcs
+from blob_cache import BlobCache
+from fakes import LocalRepository
+
+
+@pytest.fixture
+def repository(ipfs, tmp_path):
+    path = tmp_path / "repo"
+    path.mkdir()
+    return vcs.Repository(str(path), blob_cache=BlobCache(str(tmp_path / "cache")), output=io.StringIO(), jobs=2)
+
+
+@pytest.fixture
+def contract(ipfs):
+    """A repository whose files are stored in the in-memory ipfs node"""
+    repo = LocalRepository()
+
+    def add_commit(contents, **kwargs):
+        return repo.add_commit({filepath: ipfs.add_bytes(data.encode()) for filepath, data in contents.items()}, **kwargs)
+
+    repo.add_contents = add_commit
+    return repo
+
+
+@pytest.fixture
+def downloads(ipfs):
+    """The hashes read from ipfs"""
+    hashes = []
+    cat = ipfs.cat
+
+    def recording_cat(ipfs_hash, **kwargs):
+        hashes.append(ipfs_hash)
+        return cat(ipfs_hash, **kwargs)
+
+    ipfs.cat = recording_cat
+    return hashes
+
+
+def read(repository, filepath):
+    with open(repository._path(filepath), "r") as infile:
+        return infile.read()
+
+
+def stats(repository):
+    """The inode and mtime of every file in the working tree, a file written again gets a new inode"""
+    result = {}
+    for filepath in repo_index.list_working_tree(vcs.METADATA_FILES, repository.path):
+        stat = os.stat(repository._path(filepath))
+        result[filepath] = (stat.st_ino, stat.st_mtime_ns)
+    return result
+
+
+def test_fetch_writes_the_commit(repository, contract):
+    commit_id = contract.add_contents({"./a.txt": "a\n", "./src/b.txt": "b\n", "./src/deep/c.txt": "c\n"})
+
+    repository._fetch(contract, commit_id)
+
+    assert sorted(stats(repository)) == ["./a.txt", "./src/b.txt", "./src/deep/c.txt"]
+    assert read(repository, "./src/deep/c.txt") == "c\n"
+    index = repo_index.load_index(repository.path)
+    assert all(repo_index.is_unchanged(f, entry, repository.path) for f, entry in index.items())
+
+
+def test_only_changed_files_are_written(repository, contract, downloads):
+    first = contract.add_contents({"./a.txt": "a\n", "./src/b.txt": "b\n", "./src/c.txt": "c\n"})
+    second = contract.add_contents({"./a.txt": "a\n", "./src/b.txt": "changed\n", "./src/c.txt": "c\n"})
+    repository._fetch(contract, first)
+    before = stats(repository)
+    downloads.clear()
+
+    repository._fetch(contract, second)
+
+    after = stats(repository)
+    assert after["./a.txt"] == before["./a.txt"]
+    assert after["./src/c.txt"] == before["./src/c.txt"]
+    assert after["./src/b.txt"] != before["./src/b.txt"]
+    assert read(repository, "./src/b.txt") == "changed\n"
+    assert downloads == [contract.files[-2][1]]
+
+
+def test_removed_files_and_empty_directories_are_deleted(repository, contract):
+    first = contract.add_contents({"./a.txt": "a\n", "./old/b.txt": "b\n"})
+    second = contract.add_contents({"./a.txt": "a\n"})
+    repository._fetch(contract, first)
+    # A file the commit doesn't have is removed too
+    with open(repository._path("./untracked.txt"), "w") as outfile:
+        outfile.write("untracked\n")
+
+    repository._fetch(contract, second)
+
+    assert sorted(os.listdir(repository.path)) == sorted(["a.txt", os.path.basename(vcs.MIRROR_FILEPATH), os.path.basename(repo_index.INDEX_FILEPATH)])
+    assert list(repo_index.load_index(repository.path)) == ["./a.txt"]
+
+
+def test_local_changes_are_replaced(repository, contract):
+    first = contract.add_contents({"./a.txt": "a\n", "./b.txt": "b\n"})
+    second = contract.add_contents({"./a.txt": "a\n", "./b.txt": "b2\n"})
+    repository._fetch(contract, first)
+    with open(repository._path("./a.txt"), "w") as outfile:
+        outfile.write("edited\n")
+
+    repository._fetch(contract, second)
+
+    # The same hash in both commits, but the file on disk no longer matches its index entry
+    assert read(repository, "./a.txt") == "a\n"
+    assert read(repository, "./b.txt") == "b2\n"
+
+
+def test_sparse_files_are_only_indexed(repository, contract):
+    commit_id = contract.add_contents({"./src/a.txt": "a\n", "./assets/big.bin": "big\n"})
+    repository.sparse_exclude = ["assets"]
+
+    repository._fetch(contract, commit_id)
+
+    assert sorted(stats(repository)) == ["./src/a.txt"]
+    index = repo_index.load_index(repository.path)
+    assert repo_index.is_sparse(index["./assets/big.bin"])
+    assert index["./assets/big.bin"]["ipfs_hash"] == contract.files[-1][1]
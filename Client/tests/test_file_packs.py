@@ -0,0 +1,63 @@
+import os
+import random
+
+from file_packs import PACK_MAX_FILES, group_files, read_pack, upload_pack
+from transfer import ipfs_connection, run_transfers
+from unixfs_hash import hash_files
+
+
+def download_files(ipfs_hashes):
+    return run_transfers(lambda h: ipfs_connection().cat(h), ipfs_hashes)
+
+
+def download_packs(packs):
+    def download(pack):
+        data = ipfs_connection().cat(pack)
+        return [data[offset:offset + size] for _, offset, size in read_pack(pack)]
+
+    return [data for files in run_transfers(download, packs) for data in files]
+
+
+def generate(directory, count):
+    rng = random.Random(count)
+    files = []
+    for i in range(count):
+        filepath = os.path.join(directory, f"dir{i // 100}", f"file{i}.txt")
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        # Sizes vary so that files don't all land at the same offsets
+        data = rng.randbytes(rng.randrange(1, 400))
+        with open(filepath, "wb") as outfile:
+            outfile.write(data)
+        files.append((filepath, data))
+    return files
+
+
+def test_packs_give_back_the_files(ipfs, tmp_path):
+    files = generate(tmp_path, 2500)
+    filepaths = [filepath for filepath, _ in files]
+    ipfs_hashes = hash_files(filepaths)
+
+    groups = group_files([(f, h, len(data)) for f, h, (_, data) in zip(filepaths, ipfs_hashes, files)])
+    assert all(len(group) <= PACK_MAX_FILES for group in groups)
+    packs = run_transfers(upload_pack, groups)
+    assert len(packs) == len(groups) > 1
+
+    by_pack = download_packs(packs)
+    assert sorted(by_pack) == sorted(data for _, data in files)
+
+
+def test_files_in_packs_are_readable_on_their_own(ipfs, tmp_path):
+    files = generate(tmp_path, 300)
+    filepaths = [filepath for filepath, _ in files]
+    ipfs_hashes = hash_files(filepaths)
+
+    groups = group_files([(f, h, len(data)) for f, h, (_, data) in zip(filepaths, ipfs_hashes, files)])
+    packs = [upload_pack(group) for group in groups]
+
+    # Only the packs were uploaded, every file is still reachable under its own hash
+    assert download_files(ipfs_hashes) == [data for _, data in files]
+
+    contents = dict(zip(ipfs_hashes, (data for _, data in files)))
+    for pack in packs:
+        for ipfs_hash, _, size in read_pack(pack):
+            assert len(contents[ipfs_hash]) == size
@@ -0,0 +1,69 @@
+import os
+import threading
+
+import pytest
+
+import ipfs_cluster
+from fakes import StubCluster, StubPeer
+from transfer import run_transfers
+from unixfs_hash import hash_bytes
+
+LATENCY = 0.01
+
+
+def read_all(peers, ipfs_hashes, workers):
+    """Read every file through the given peers, one client for each thread"""
+    local = threading.local()
+
+    def cat(ipfs_hash):
+        if getattr(local, "client", None) is None:
+            local.client = ipfs_cluster.ClusterClient([p.address for p in peers], [])
+        return b"".join(local.client.cat(ipfs_hash, stream=True))
+
+    return run_transfers(cat, ipfs_hashes, workers=workers)
+
+
+@pytest.fixture
+def store():
+    files = {}
+    for _ in range(60):
+        data = os.urandom(16 * 1024)
+        files[hash_bytes(data)] = data
+    return files
+
+
+@pytest.fixture
+def peers(store):
+    started = [StubPeer(store, LATENCY, 2) for _ in range(3)]
+    yield started
+    for peer in started:
+        if peer.server.socket.fileno() != -1:
+            peer.stop()
+
+
+def test_reads_are_spread_over_peers(store, peers):
+    assert read_all(peers, list(store), 8) == list(store.values())
+    assert all(peer.requests > 0 for peer in peers)
+
+
+def test_reads_carry_on_when_a_peer_goes_down(store, peers):
+    # The last peer goes down a little way into the reads
+    threading.Timer(LATENCY * 3, peers[-1].stop).start()
+    assert read_all(peers, list(store), 8) == list(store.values())
+
+
+def test_downloads_that_break_off_are_finished_by_another_peer(store, peers):
+    ipfs_hashes = list(store)[:10]
+    peers[0].breaks_off = True
+    assert read_all(peers[:2], ipfs_hashes, 4) == [store[h] for h in ipfs_hashes]
+    assert peers[0].requests > 0
+
+
+def test_uploads_are_pinned_in_the_cluster(store, peers, monkeypatch):
+    cluster = StubCluster()
+    monkeypatch.setattr(ipfs_cluster, "REPLICATION", "2:3")
+    client = ipfs_cluster.ClusterClient([peers[0].address], [cluster.url])
+
+    ipfs_hash = client.add_bytes(b"pinned through the cluster\n")
+    assert store.get(ipfs_hash) == b"pinned through the cluster\n"
+    assert cluster.pins.get(ipfs_hash) == {"replication-min": "2", "replication-max": "3"}
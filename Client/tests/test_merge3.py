@@ -0,0 +1,93 @@
+import random
+import shutil
+import subprocess
+
+import pytest
+
+from merge3 import merge3, merge_many
+
+# (base, parent, child) and the output of diff3 -m -L PARENT -L BASE -L CHILD parent base child
+FIXTURES = [
+    # Changes to different lines are both taken
+    (b"a\nb\nc\nd\ne\n", b"A\nb\nc\nd\ne\n", b"a\nb\nc\nd\nE\n",
+     b"A\nb\nc\nd\nE\n"),
+    # The same change on both sides is still bracketed
+    (b"a\nb\nc\nd\ne\n", b"a\nB\nc\nd\ne\n", b"a\nB\nc\nd\ne\n",
+     b"a\n<<<<<<< BASE\nb\n=======\nB\n>>>>>>> CHILD\nc\nd\ne\n"),
+    # Different changes to the same line conflict
+    (b"a\nb\nc\nd\ne\n", b"a\nX\nc\nd\ne\n", b"a\nY\nc\nd\ne\n",
+     b"a\n<<<<<<< PARENT\nX\n||||||| BASE\nb\n=======\nY\n>>>>>>> CHILD\nc\nd\ne\n"),
+    # Changes to neighbouring lines conflict
+    (b"a\nb\nc\nd\ne\n", b"a\nB\nc\nd\ne\n", b"a\nb\nC\nd\ne\n",
+     b"a\n<<<<<<< PARENT\nB\nc\n||||||| BASE\nb\nc\n=======\nb\nC\n>>>>>>> CHILD\nd\ne\n"),
+    # So does a line inserted right before a changed one
+    (b"a\nb\nc\nd\ne\n", b"a\nb\nX\nc\nd\ne\n", b"a\nb\nC\nd\ne\n",
+     b"a\nb\n<<<<<<< PARENT\nX\nc\n||||||| BASE\nc\n=======\nC\n>>>>>>> CHILD\nd\ne\n"),
+    # But not with a line in between
+    (b"a\nb\nc\nd\ne\n", b"a\nb\nX\nc\nd\ne\n", b"a\nb\nc\nD\ne\n",
+     b"a\nb\nX\nc\nD\ne\n"),
+    # The changes are lined up the way diff does before they are compared
+    (b"e\nb\nc\na\nc\nc\nc\n", b"e\nb\na\nc\nc\nc\nc\n", b"e\nb\na\nc\nc\nc\n",
+     b"e\nb\n<<<<<<< PARENT\na\nc\n||||||| BASE\nc\na\n=======\na\n>>>>>>> CHILD\nc\nc\nc\n"),
+    # Lines added at the end by both
+    (b"a\nb\n", b"a\nb\nc\n", b"a\nb\nd\n",
+     b"a\nb\n<<<<<<< PARENT\nc\n||||||| BASE\n=======\nd\n>>>>>>> CHILD\n"),
+    (b"", b"a\n", b"a\n",
+     b"<<<<<<< BASE\n=======\na\n>>>>>>> CHILD\n"),
+    (b"a\nb\nc\n", b"", b"a\nb\nc\nd\n",
+     b"<<<<<<< PARENT\n||||||| BASE\na\nb\nc\n=======\na\nb\nc\nd\n>>>>>>> CHILD\n"),
+]
+
+
+@pytest.mark.parametrize("base, parent, child, expected", FIXTURES)
+def test_merge3_matches_diff3(base, parent, child, expected):
+    merged, conflicts = merge3(base, parent, child)
+    assert merged == expected
+    assert (conflicts > 0) == (b"<<<<<<<" in expected)
+
+
+def test_conflicting_regions_are_counted():
+    base = b"a\nb\nc\nd\ne\nf\ng\n"
+    assert merge3(base, b"A\nb\nc\nd\ne\nf\nG\n", b"a1\nb\nc\nD\ne\nf\ng1\n")[1] == 2
+
+
+def test_unterminated_lines_in_conflicts():
+    merged, conflicts = merge3(b"a\nb", b"a\nX", b"a\nY")
+    assert merged == b"a\n<<<<<<< PARENT\nX\n||||||| BASE\nb\n=======\nY\n>>>>>>> CHILD\n"
+    assert conflicts == 1
+
+
+def test_merge_many_keeps_order():
+    merges = [(b"a\n", f"{i}\n".encode(), b"a\n") for i in range(20)]
+    assert merge_many(merges, workers=2) == [(f"{i}\n".encode(), 0) for i in range(20)]
+
+
+def _mutate(rng, lines, alphabet):
+    lines = list(lines)
+    for _ in range(rng.randrange(0, 6)):
+        position = rng.randrange(len(lines) + 1)
+        operation = rng.randrange(3)
+        if operation == 0:
+            lines[position:position] = [rng.choice(alphabet) for _ in range(rng.randrange(1, 3))]
+        elif operation == 1:
+            del lines[position:position + rng.randrange(1, 3)]
+        elif lines:
+            lines[min(position, len(lines) - 1)] = rng.choice(alphabet)
+    return lines
+
+
+@pytest.mark.skipif(shutil.which("diff3") is None, reason="needs GNU diff3")
+def test_random_merges_match_diff3(tmp_path):
+    rng = random.Random(0)
+    paths = [tmp_path / name for name in ("parent", "base", "child")]
+    for _ in range(300):
+        alphabet = [f"{c}\n" for c in "abcdefgh"[:rng.randrange(2, 9)]]
+        base = [rng.choice(alphabet) for _ in range(rng.randrange(0, 150))]
+        files = [_mutate(rng, base, alphabet), base, _mutate(rng, base, alphabet)]
+        for path, lines in zip(paths, files):
+            path.write_text("".join(lines))
+
+        result = subprocess.run(["diff3", "-m", "-L", "PARENT", "-L", "BASE", "-L", "CHILD"] + [str(p) for p in paths], capture_output=True)
+        merged, conflicts = merge3(*(path.read_bytes() for path in (paths[1], paths[0], paths[2])))
+        assert merged == result.stdout
+        assert (conflicts > 0) == (result.returncode == 1)
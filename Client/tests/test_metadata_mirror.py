@@ -0,0 +1,112 @@
+from fakes import LocalRepository
+from metadata_mirror import MetadataMirror
+
+
+def calls(repo, name):
+    return [ids for called, ids in repo.calls if called == name]
+
+
+def open_mirror(tmp_path, repo):
+    mirror = MetadataMirror(repo, str(tmp_path / "mirror.sqlite"))
+    mirror.sync()
+    return mirror
+
+
+def test_first_sync_copies_everything(tmp_path):
+    repo = LocalRepository()
+    first = repo.add_commit({"./a.txt": "QmA", "./b.txt": "QmB"}, comment="first")
+    branch = repo.add_branch("feature", ["0x" + "b0" * 20])
+    repo.add_commit({"./a.txt": "QmA2"}, branch_id=branch, previous=first)
+
+    mirror = open_mirror(tmp_path, repo)
+
+    assert mirror.get_branches() == [(0, repo.branches[0]), (1, repo.branches[1])]
+    assert mirror.get_branch_editors(branch) == ["0x" + "b0" * 20]
+    assert mirror.get_commits_count() == 3
+    assert mirror.get_commit(first) == repo.commits[first]
+    assert mirror.get_files_from_commit(first) == [["./a.txt", "QmA", first], ["./b.txt", "QmB", first]]
+    assert [commit_id for commit_id, _ in mirror.get_commits_from_branch(branch)] == [2]
+
+
+def test_sync_only_fetches_what_is_new(tmp_path):
+    repo = LocalRepository()
+    repo.add_commit({"./a.txt": "QmA"})
+    mirror = open_mirror(tmp_path, repo)
+
+    repo.calls = []
+    mirror.sync()
+    # Nothing was added, so no rows are asked for
+    assert all(ids == [] for _, ids in repo.calls)
+
+    repo.calls = []
+    branch = repo.add_branch("feature")
+    second = repo.add_commit({"./b.txt": "QmB"}, branch_id=branch)
+    third = repo.add_commit({"./c.txt": "QmC"}, branch_id=branch)
+    mirror.sync()
+
+    assert calls(repo, "get_branches") == [[branch]]
+    assert calls(repo, "get_commits") == [[second, third]]
+    assert calls(repo, "get_files") == [[1, 2]]
+    assert mirror.get_files_from_commit(third) == [["./c.txt", "QmC", third]]
+
+    # The data stays when the mirror is opened again
+    reopened = MetadataMirror(repo, str(tmp_path / "mirror.sqlite"))
+    assert reopened.get_commits_count() == 4
+    assert reopened.get_branch(branch) == repo.branches[branch]
+
+
+def test_pending_commits_are_synced_again(tmp_path):
+    repo = LocalRepository()
+    first = repo.add_commit({"./a.txt": "QmA"})
+    pending = repo.add_commit({"./b.txt": "QmB"}, pending=True)
+    mirror = open_mirror(tmp_path, repo)
+
+    # A commit still being made is not part of the branch's history and has no files yet
+    assert [commit_id for commit_id, _ in mirror.get_commits_from_branch(0)] == [0, first]
+    assert mirror.get_files_from_commit(pending) == []
+
+    repo.calls = []
+    mirror.sync()
+    # It is asked about again on every sync until it is finalized
+    assert calls(repo, "get_commits_pending") == [[pending]]
+    assert calls(repo, "get_files_from_commits") == [[]]
+
+    repo.pending.discard(pending)
+    later = repo.add_commit({"./c.txt": "QmC"})
+    repo.calls = []
+    mirror.sync()
+
+    assert calls(repo, "get_commits_pending") == [[pending, later]]
+    assert calls(repo, "get_files_from_commits") == [[pending, later]]
+    assert [commit_id for commit_id, _ in mirror.get_commits_from_branch(0)] == [0, first, pending, later]
+    assert mirror.get_files_from_commit(pending) == [["./b.txt", "QmB", pending]]
+
+    repo.calls = []
+    mirror.sync()
+    assert calls(repo, "get_commits_pending") == [[]]
+
+
+def test_shared_file_sets(tmp_path):
+    repo = LocalRepository()
+    first = repo.add_commit({"./a.txt": "QmA"})
+    branch = repo.add_branch("fork")
+    forked = repo.add_commit({}, branch_id=branch, previous=first, file_set=first)
+
+    mirror = open_mirror(tmp_path, repo)
+
+    # The fork's files are not fetched again, they are read from the commit it shares them with
+    assert calls(repo, "get_files_from_commits") == [[0, first]]
+    assert mirror.get_files_from_commit(forked) == [["./a.txt", "QmA", first]]
+
+
+def test_sync_editors(tmp_path):
+    repo = LocalRepository()
+    mirror = open_mirror(tmp_path, repo)
+
+    repo.editors[0] = ["0x" + "b0" * 20, "0x" + "c0" * 20]
+    # Editors can change without anything being added, a sync doesn't see them
+    mirror.sync()
+    assert mirror.get_branch_editors(0) == []
+
+    mirror.sync_editors(0)
+    assert mirror.get_branch_editors(0) == repo.editors[0]
@@ -0,0 +1,73 @@
+import pytest
+
+import eth_wrapper
+from eth_wrapper import PACKED_PATH_LENGTH_BYTES, pack_files
+from unixfs_hash import digest_to_cid, hash_bytes
+
+FILE_PATHS = ["./README.md", "./src/a;b.txt", "./docs/ünïcödé.md", "./" + "deep/" * 50 + "file.txt"]
+IPFS_HASHES = [hash_bytes(f"contents {i}".encode()) for i in range(len(FILE_PATHS))]
+
+
+def unpack_files(files_data):
+    """Read packed files back the way AddFilesPacked in VCS.sol does"""
+    files = []
+    it = 0
+    while it < len(files_data):
+        assert it + 2 <= len(files_data), "Incomplete file entry"
+        path_length = files_data[it] << 8 | files_data[it + 1]
+        it += 2
+
+        assert it + path_length + 32 <= len(files_data), "Incomplete file entry"
+        file_path = files_data[it:it + path_length]
+        it += path_length
+
+        digest = files_data[it:it + 32]
+        it += 32
+
+        files.append((file_path.decode(), digest_to_cid(digest)))
+    return files
+
+
+def test_round_trip():
+    files_data = pack_files(FILE_PATHS, IPFS_HASHES)
+
+    # Paths can hold the ';' the string encoding splits on
+    assert unpack_files(files_data) == list(zip(FILE_PATHS, IPFS_HASHES))
+    assert len(files_data) == sum(PACKED_PATH_LENGTH_BYTES + len(f.encode()) + 32 for f in FILE_PATHS)
+
+
+def test_layout():
+    files_data = pack_files(["./a"], [IPFS_HASHES[0]])
+    assert files_data[:2] == b"\x00\x03"
+    assert files_data[2:5] == b"./a"
+    assert digest_to_cid(files_data[5:]) == IPFS_HASHES[0]
+
+
+def test_no_files():
+    assert pack_files([], []) == b""
+    assert unpack_files(b"") == []
+
+
+@pytest.mark.parametrize("ipfs_hash", ["hash0", "Qm" + "1" * 44, "bafybeigdyrzt5sfp7udm7hu76uh7y26nf3efuylqabf3oclgtqy55fbzdi"])
+def test_hashes_that_are_not_cidv0(ipfs_hash):
+    assert pack_files(FILE_PATHS[:2], [IPFS_HASHES[0], ipfs_hash]) is None
+
+
+def test_longest_path():
+    longest = "./" + "a" * ((1 << 8 * PACKED_PATH_LENGTH_BYTES) - 3)
+    assert unpack_files(pack_files([longest], IPFS_HASHES[:1])) == [(longest, IPFS_HASHES[0])]
+    assert pack_files([longest + "a"], IPFS_HASHES[:1]) is None
+
+
+@pytest.mark.usefixtures("current_build")
+def test_packed_commit_on_chain(chain, contract, monkeypatch):
+    monkeypatch.setattr(eth_wrapper, "RECEIPT_POLL_INTERVAL", 0)
+
+    receipt = contract.make_commit(FILE_PATHS, IPFS_HASHES, 0, contract.most_recent_commit(0), "packed")
+
+    transaction = chain.w3.eth.get_transaction(receipt.transactionHash)
+    assert contract._repo_contract.decode_function_input(transaction.input)[0].fn_name == "MakeCommitPacked"
+
+    commit_id = contract.most_recent_commit(0)
+    files = contract.get_files(contract.get_files_from_commit(commit_id))
+    assert [filedata[:2] for filedata in files] == [list(f) for f in zip(FILE_PATHS, IPFS_HASHES)]
@@ -0,0 +1,126 @@
+import json
+import threading
+import time
+
+import profiling
+import pytest
+import vcs
+
+
+@pytest.fixture
+def events(monkeypatch):
+    monkeypatch.setattr(profiling, "_events", [])
+    monkeypatch.setattr(profiling, "_start", time.perf_counter())
+    return profiling._events
+
+
+def make_class():
+    class Work(object):
+        @profiling.phase
+        def run(self, value):
+            return self._step(value) + 1
+
+        @profiling.phase
+        def _step(self, value):
+            return value * 2
+
+        def untraced(self):
+            return "untraced"
+
+        @classmethod
+        @profiling.phase
+        def create(cls):
+            return cls()
+
+    return Work
+
+
+def test_phase_leaves_function_alone():
+    Work = make_class()
+
+    # Nothing is wrapped until instrument() is called
+    assert Work.__dict__["run"].__name__ == "run"
+    assert not hasattr(Work.__dict__["run"], "__wrapped__")
+    assert Work().run(2) == 5
+
+
+def test_instrument_records_marked_phases(events):
+    Work = make_class()
+    profiling.instrument(Work)
+    # A second call doesn't wrap the phases again
+    profiling.instrument(Work)
+
+    work = Work.create()
+    assert work.run(2) == 5
+    assert work.untraced() == "untraced"
+
+    assert [event["name"] for event in events] == ["create", "_step", "run"]
+    assert all(event["cat"] == "phase" for event in events)
+
+
+def test_instrument_records_errors(events):
+    class Failing(object):
+        @profiling.phase
+        def run(self):
+            raise ValueError()
+
+    profiling.instrument(Failing)
+    with pytest.raises(ValueError):
+        Failing().run()
+
+    assert events[0]["args"] == {"error": "ValueError"}
+
+
+def test_repository_commands_are_phases():
+    marked = {name for name, attribute in vars(vcs.Repository).items() if profiling._is_phase(getattr(attribute, "__func__", attribute))}
+
+    assert {"init", "clone", "fetch", "checkout", "commit", "push", "merge", "branch", "status", "diff"} <= marked
+    assert {"_fetch", "_make_commit", "_upload_blobs", "_submit_commits", "_three_way_merge"} <= marked
+    assert "_command" not in marked
+
+    # The functions the repository calls from other modules are phases too
+    assert profiling._is_phase(vcs.hash_files)
+    assert profiling._is_phase(vcs.run_transfers)
+
+
+def test_write_produces_a_chrome_trace(events, tmp_path, capsys):
+    Work = make_class()
+    profiling.instrument(Work)
+    sleep = profiling.traced("ipfs.cat", "ipfs", lambda seconds: time.sleep(seconds) or b"data", profiling._received_size)
+
+    Work().run(2)
+    thread = threading.Thread(target=sleep, args=(0.01,))
+    thread.start()
+    thread.join()
+    list(profiling._traced_stream("ipfs.cat", iter([b"ab", b"cde"])))
+
+    profiling.write(str(tmp_path / "profile"))
+
+    with open(tmp_path / "profile.trace.json", "r") as infile:
+        trace = json.load(infile)
+
+    assert trace["displayTimeUnit"] == "ms"
+    trace_events = trace["traceEvents"]
+    assert [event["name"] for event in trace_events] == ["_step", "run", "ipfs.cat", "ipfs.cat"]
+    for event in trace_events:
+        # Complete events, everything chrome://tracing needs to place them
+        assert event["ph"] == "X"
+        assert isinstance(event["name"], str) and isinstance(event["cat"], str)
+        assert isinstance(event["ts"], (int, float)) and event["ts"] >= 0
+        assert isinstance(event["dur"], (int, float)) and event["dur"] >= 0
+        assert isinstance(event["pid"], int) and isinstance(event["tid"], int)
+        assert isinstance(event["args"], dict)
+
+    step, run, cat, stream = trace_events
+    # Nested phases sit inside the span of their caller
+    assert run["ts"] <= step["ts"] and step["ts"] + step["dur"] <= run["ts"] + run["dur"]
+    # The thread shows up on its own track
+    assert cat["tid"] != run["tid"] and cat["pid"] == run["pid"]
+    assert cat["dur"] >= 10000
+    assert (cat["args"], stream["args"]) == ({"bytes": 4}, {"bytes": 5})
+
+    with open(tmp_path / "profile.json", "r") as infile:
+        report = json.load(infile)
+    assert report["events"] == trace_events
+    assert {(row["name"], row["count"], row["bytes"]) for row in report["summary"]} == {("run", 1, 0), ("_step", 1, 0), ("ipfs.cat", 2, 9)}
+    assert "Profile written to" in capsys.readouterr().err
@@ -0,0 +1,225 @@
+import io
+import json
+import os
+
+import pytest
+
+import commit_queue
+import eth_wrapper
+import vcs
+from blob_cache import BlobCache
+from file_packs import split_packs
+
+
+@pytest.fixture(autouse=True)
+def local_stores(monkeypatch, tmp_path):
+    monkeypatch.setattr(commit_queue, "QUEUE_BLOB_DIR", str(tmp_path / "queued"))
+    monkeypatch.setattr(eth_wrapper, "RECEIPT_POLL_INTERVAL", 0)
+
+
+@pytest.fixture
+def repository(chain, ipfs, contract, tmp_path):
+    path = tmp_path / "repo"
+    path.mkdir()
+    # Written by hand rather than with init, which refuses to deploy a build older than the ABI
+    with open(path / vcs.REPODATA_FILEPATH, "w") as outfile:
+        json.dump({"repo_name": "test", "repo_address": contract.repository_address, "current_branch_id": 0, "current_commit_id": 0}, outfile)
+    return vcs.Repository(str(path), chain.private_key, conn_url="http://in-process", blob_cache=BlobCache(str(tmp_path / "cache")), output=io.StringIO(), jobs=2)
+
+
+@pytest.fixture
+def other(chain, repository, tmp_path):
+    """Another working tree of the repository, used by a second account that can edit mainline"""
+    from eth_tester.backends.pyevm.main import get_default_account_keys
+
+    private_key = get_default_account_keys()[1].to_hex()
+    repository._connect().add_editor_to_branch(0, chain.w3.eth.account.from_key(private_key).address)
+    return vcs.Repository.clone(str(tmp_path / "other"), repository.repo_address, private_key, conn_url="http://in-process", blob_cache=repository.blob_cache, output=io.StringIO(), jobs=2)
+
+
+def write(repository, filepath, contents):
+    path = repository._path(filepath)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as outfile:
+        outfile.write(contents)
+
+
+def read(repository, filepath):
+    with open(repository._path(filepath), "r") as infile:
+        return infile.read()
+
+
+def history(repository):
+    """The comments of the commits made on mainline, oldest first"""
+    contract = repository._connect()
+    return [commit[2] for commit in contract.get_commits(range(contract.get_commits_count())) if commit[1] == 0]
+
+
+def committed_files(repository, commit_id):
+    contract = repository._connect()
+    return dict(filedata[:2] for filedata in split_packs(contract.get_files(contract.get_files_from_commit(commit_id)))[0])
+
+
+def test_push_sends_the_queue_in_order(repository):
+    write(repository, "./a.txt", "a\n")
+    repository.commit("first")
+    write(repository, "./b.txt", "b\n")
+    repository.commit("second")
+    assert history(repository) == ["Null Commit"]
+
+    repository.push()
+
+    assert history(repository)[1:] == ["first", "second"]
+    head = repository._connect().most_recent_commit(0)
+    assert repository.current_commit == head
+    assert set(committed_files(repository, head)) == {"./a.txt", "./b.txt"}
+
+
+def test_push_clears_the_queue(repository):
+    write(repository, "./a.txt", "a\n")
+    repository.commit("first")
+    store = commit_queue.blob_store(repository.repo_address, repository.path).directory
+    assert repository.queued_commits() == 1
+    assert os.listdir(store)
+    # Nothing may replace the working tree while its commits are only stored locally
+    with pytest.raises(vcs.QueuedCommitsError):
+        repository.checkout(0)
+
+    repository.push()
+
+    assert repository.queued_commits() == 0
+    assert not os.path.exists(repository._path(commit_queue.QUEUE_FILEPATH))
+    assert not os.path.exists(store)
+    repository.checkout(0)
+    assert repository.output.getvalue().endswith("Pushed 1 commit(s)\n")
+
+    repository.push()
+    assert repository.output.getvalue().endswith("Nothing to push\n")
+
+
+def test_working_trees_keep_their_own_queues(repository, other):
+    write(repository, "./mine.txt", "mine\n")
+    repository.commit("mine")
+    write(other, "./theirs.txt", "theirs\n")
+    other.commit("theirs", push=True)
+
+    # Pushing from the other working tree leaves the contents queued in this one
+    assert repository.queued_commits() == 1
+    repository.push()
+    assert history(repository)[1:] == ["theirs", "mine"]
+    assert read(repository, "./theirs.txt") == "theirs\n"
+
+
+def test_push_rebases_onto_a_moved_head(repository, other):
+    write(repository, "./shared.txt", "one\ntwo\nthree\n")
+    repository.commit("base", push=True)
+    other.checkout(0)
+
+    write(repository, "./mine.txt", "mine\n")
+    repository.commit("mine")
+    write(repository, "./shared.txt", "one\ntwo\nthree\nfour\n")
+    repository.commit("append")
+
+    # Another editor commits on mainline before the queue is pushed
+    write(other, "./theirs.txt", "theirs\n")
+    write(other, "./shared.txt", "zero\none\ntwo\nthree\n")
+    other.commit("theirs", push=True)
+    theirs = repository._connect().most_recent_commit(0)
+
+    repository.push()
+
+    assert "Branch has moved on to commit" in repository.output.getvalue()
+    assert history(repository)[1:] == ["base", "theirs", "mine", "append"]
+    contract = repository._connect()
+    head = contract.most_recent_commit(0)
+    assert contract.get_commit(contract.get_commit(head)[4])[4] == theirs
+    assert set(committed_files(repository, head)) == {"./shared.txt", "./mine.txt", "./theirs.txt"}
+
+    # The working tree is brought up to the rebased head
+    assert repository.current_commit == head
+    assert read(repository, "./theirs.txt") == "theirs\n"
+    assert read(repository, "./shared.txt") == "zero\none\ntwo\nthree\nfour\n"
+
+
+def test_conflicting_rebase_keeps_the_queue(repository, other):
+    write(repository, "./shared.txt", "one\n")
+    repository.commit("base", push=True)
+    other.checkout(0)
+
+    write(repository, "./shared.txt", "mine\n")
+    repository.commit("mine")
+    write(other, "./shared.txt", "theirs\n")
+    other.commit("theirs", push=True)
+
+    repository.push()
+
+    assert "Conflicts rebasing \"mine\"" in repository.output.getvalue()
+    assert history(repository)[1:] == ["base", "theirs"]
+    assert repository.queued_commits() == 1
+
+
+def test_squash_merge_leaves_the_branch(repository, ipfs, tmp_path):
+    write(repository, "./a.txt", "a\n")
+    repository.commit("base", push=True)
+    contract = repository._connect()
+    base = contract.most_recent_commit(0)
+
+    contract.fork_new_branch("feature", 0)
+    feature = contract.get_branch_count() - 1
+    (tmp_path / "f.txt").write_text("f\n")
+    files = committed_files(repository, base)
+    files["./f.txt"] = ipfs.add(str(tmp_path / "f.txt"))["Hash"]
+    contract.make_commit(list(files), list(files.values()), feature, contract.most_recent_commit(feature), "on feature")
+
+    write(repository, "./b.txt", "b\n")
+    repository.commit("queued")
+    queue = commit_queue.load_queue(repository.path)
+
+    # The squash commit's previous is the head of the feature branch, walking back from mainline's head goes
+    # through the feature branch and comes out at the base commit it was forked from
+    contract.squash_merge(0, feature, "squash")
+    assert contract.get_commit(contract.most_recent_commit(0))[4] == contract.most_recent_commit(feature)
+
+    # None of the commits found that way are on mainline, even those made by this account
+    queue["commits"] = [{"message": message, "files": {}} for message in ["base", "on feature", "squash"]]
+    assert repository._pushed_commits(contract, queue) == (0, base)
+
+    repository.push()
+
+    assert history(repository)[1:] == ["base", "squash", "queued"]
+    assert set(committed_files(repository, contract.most_recent_commit(0))) == {"./a.txt", "./b.txt", "./f.txt"}
+    assert repository.queued_commits() == 0
+
+
+@pytest.mark.usefixtures("current_build")
+def test_pushed_ids_come_from_the_events(chain, repository, other):
+    contract = repository._connect()
+    other_contract = other._connect()
+    for i in range(4):
+        write(repository, f"./file{i}.txt", f"{i}\n")
+        repository.commit(f"commit {i}")
+
+    # Another editor's commit is mined right after the first of ours, taking the id predicted for the second
+    make_request = chain.provider.make_request
+    sent = []
+
+    def request(method, params):
+        response = make_request(method, params)
+        if method == "eth_sendRawTransaction":
+            sent.append(params[0])
+            if len(sent) == 1:
+                other_contract.make_commit([], [], 0, contract.most_recent_commit(0), "theirs")
+        return response
+
+    chain.provider.make_request = request
+    repository.push()
+    chain.provider.make_request = make_request
+
+    comments = history(repository)[1:]
+    assert comments == ["commit 0", "theirs", "commit 1", "commit 2", "commit 3"]
+    assert repository.queued_commits() == 0
+    assert repository.current_commit == contract.most_recent_commit(0)
+
+    # Each commit is on top of the one before it
+    commit_ids = contract.get_commits_from_branch(0)
+    assert [contract.get_commit(commit_id)[4] for commit_id in commit_ids[1:]] == commit_ids[:-1]
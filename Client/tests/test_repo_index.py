@@ -0,0 +1,140 @@
+import json
+import os
+
+import pytest
+
+import repo_index
+from unixfs_hash import hash_files
+
+IGNORED = {repo_index.INDEX_FILEPATH}
+
+# Far enough back that the index, written now, is clearly newer than the files
+OLD_MTIME_NS = 1_600_000_000 * 10**9
+
+
+def write(root, filepath, contents, mtime_ns=OLD_MTIME_NS):
+    path = os.path.join(root, filepath)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as outfile:
+        outfile.write(contents)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def index_files(root, filepaths):
+    """Record the files as they are on disk, the way a fetch or commit does"""
+    hashes = hash_files([os.path.join(root, f) for f in filepaths])
+    index = {f: repo_index.make_entry(f, h, root=root) for f, h in zip(filepaths, hashes)}
+    repo_index.save_index(index, root)
+    return index
+
+
+@pytest.fixture
+def hashed(monkeypatch):
+    """The paths of the files status reads to hash"""
+    paths = []
+
+    def counting_hash_files(filepaths, chunk_threshold=None):
+        paths.extend(os.path.normpath(f) for f in filepaths)
+        return hash_files(filepaths, chunk_threshold=chunk_threshold)
+
+    monkeypatch.setattr(repo_index, "hash_files", counting_hash_files)
+    return paths
+
+
+def status(root):
+    return repo_index.working_tree_status(IGNORED, root=str(root))
+
+
+def test_clean_tree_reads_nothing(tmp_path, hashed):
+    write(tmp_path, "./a.txt", "a\n")
+    write(tmp_path, "./src/b.txt", "b\n")
+    index_files(tmp_path, ["./a.txt", "./src/b.txt"])
+
+    assert status(tmp_path) == ([], [], [])
+    assert hashed == []
+
+
+def test_modified_added_and_deleted(tmp_path):
+    write(tmp_path, "./a.txt", "a\n")
+    write(tmp_path, "./b.txt", "b\n")
+    write(tmp_path, "./c.txt", "c\n")
+    index = index_files(tmp_path, ["./a.txt", "./b.txt", "./c.txt"])
+    index["./sparse.txt"] = repo_index.make_sparse_entry(index["./a.txt"]["ipfs_hash"])
+    repo_index.save_index(index, tmp_path)
+
+    write(tmp_path, "./a.txt", "changed\n")
+    os.remove(tmp_path / "c.txt")
+    write(tmp_path, "./src/new.txt", "new\n")
+
+    # A file left out of a sparse checkout is not on disk without having been deleted
+    assert status(tmp_path) == (["./a.txt"], ["./src/new.txt"], ["./c.txt"])
+
+
+def test_touched_file_is_refreshed(tmp_path, hashed):
+    write(tmp_path, "./a.txt", "a\n")
+    index_files(tmp_path, ["./a.txt"])
+
+    write(tmp_path, "./a.txt", "a\n", mtime_ns=OLD_MTIME_NS + 10**9)
+
+    assert status(tmp_path) == ([], [], [])
+    assert hashed == [str(tmp_path / "a.txt")]
+    # The new stat information is recorded so the file isn't read again
+    assert repo_index.load_index(tmp_path)["./a.txt"]["mtime"] == OLD_MTIME_NS + 10**9
+    assert status(tmp_path) == ([], [], [])
+    assert len(hashed) == 1
+
+
+def test_matching_stat_is_trusted(tmp_path):
+    write(tmp_path, "./a.txt", "a\n")
+    index_files(tmp_path, ["./a.txt"])
+
+    # Rewritten in place with the same size and its mtime put back, only reading the file could tell
+    write(tmp_path, "./a.txt", "b\n")
+    assert status(tmp_path) == ([], [], [])
+
+
+def racy_index(root, filepath, contents):
+    """Index a file written in the same clock tick as the index itself"""
+    write(root, filepath, contents)
+    index_files(root, [filepath])
+    mtime_ns = os.stat(os.path.join(root, filepath)).st_mtime_ns
+    os.utime(os.path.join(root, repo_index.INDEX_FILEPATH), ns=(mtime_ns, mtime_ns))
+    return mtime_ns
+
+
+def test_racy_file_is_hashed_again(tmp_path, hashed):
+    mtime_ns = racy_index(tmp_path, "./a.txt", "a\n")
+
+    # Changed again within that tick, nothing in the stat moves
+    write(tmp_path, "./a.txt", "b\n", mtime_ns=mtime_ns)
+    hashed.clear()
+
+    assert status(tmp_path) == (["./a.txt"], [], [])
+    assert hashed == [str(tmp_path / "a.txt")]
+
+
+def test_racy_unchanged_file_is_refreshed(tmp_path, hashed):
+    racy_index(tmp_path, "./a.txt", "a\n")
+    hashed.clear()
+
+    assert not repo_index.is_unchanged("./a.txt", repo_index.load_index(tmp_path)["./a.txt"], tmp_path)
+    assert status(tmp_path) == ([], [], [])
+    assert hashed == [str(tmp_path / "a.txt")]
+
+    # The index written by status is newer than the file, so it is trusted from then on
+    assert repo_index.is_unchanged("./a.txt", repo_index.load_index(tmp_path)["./a.txt"], tmp_path)
+    assert status(tmp_path) == ([], [], [])
+    assert len(hashed) == 1
+
+
+def test_old_index_format(tmp_path, hashed):
+    write(tmp_path, "./a.txt", "a\n")
+    write(tmp_path, "./b.txt", "b\n")
+    hashes = hash_files([str(tmp_path / "a.txt"), str(tmp_path / "b.txt")])
+    with open(tmp_path / repo_index.INDEX_FILEPATH, "w") as outfile:
+        json.dump({"./a.txt": hashes[0], "./b.txt": "QmOld"}, outfile)
+
+    # Entries with only a hash have to be read once, after that they carry their stat information
+    assert status(tmp_path) == (["./b.txt"], [], [])
+    assert len(hashed) == 2
+    assert repo_index.load_index(tmp_path)["./a.txt"]["size"] == 2
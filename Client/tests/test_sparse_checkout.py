@@ -0,0 +1,59 @@
+import pytest
+
+from sparse_checkout import is_included, matches
+
+
+@pytest.mark.parametrize("filepath, pattern, expected", [
+    # A path matches a file itself or everything inside a directory
+    ("./src/app/main.py", "src/app", True),
+    ("./src/app/main.py", "./src/app/", True),
+    ("./src/app", "src/app", True),
+    ("./src/application.py", "src/app", False),
+    ("./lib/src/app/main.py", "src/app", False),
+    ("./docs/logo.psd", "*.psd", True),
+    ("./docs/logo.psd.txt", "*.psd", False),
+    ("./src/main.py", "src/ma?n.py", True),
+    ("./src/main.py", "src/[lm]ain.py", True),
+    ("./src/main.py", "src/[!m]ain.py", False),
+    # ** stands for any number of directories
+    ("./src/test/a.py", "src/**/test", True),
+    ("./src/lib/core/test/a.py", "src/**/test", True),
+    ("./src/testing/a.py", "src/**/test", False),
+    ("./build/out.o", "**/build", True),
+    ("./a/b/build/out.o", "**/build", True),
+    ("./a/rebuild/out.o", "**/build", False),
+    ("./assets/icons/a.psd", "**/*.psd", True),
+    ("./assets/x", "assets/**", True),
+    ("./assets", "assets/**", False),
+    # A leading ! is ignored by matches itself, \! is a literal !
+    ("./src/a.py", "!src", True),
+    ("./!notes.txt", "\\!notes.txt", True),
+])
+def test_matches(filepath, pattern, expected):
+    assert matches(filepath, pattern) == expected
+
+
+@pytest.mark.parametrize("filepath, include, exclude, expected", [
+    ("./src/app/main.py", ["src/app"], [], True),
+    ("./src/application.py", ["src/app"], [], False),
+    ("./docs/logo.psd", [], ["*.psd"], False),
+    ("./docs/index.md", ["docs", "src"], ["*.psd"], True),
+    ("./README.md", ["src"], [], False),
+    ("./README.md", [], [], True),
+    ("./src/app/vendor/lib.py", ["src/app"], ["src/app/vendor"], False),
+    # A negated pattern takes back the earlier patterns of its list
+    ("./src/generated/api.py", ["src", "!src/generated"], [], False),
+    ("./src/app/main.py", ["src", "!src/generated"], [], True),
+    ("./assets/icons/a.png", [], ["assets", "!assets/icons"], True),
+    ("./assets/photos/a.png", [], ["assets", "!assets/icons"], False),
+    # The last pattern matching a path decides
+    ("./src/generated/keep/a.py", ["src", "!src/generated", "src/generated/keep"], [], True),
+    ("./src/generated/other/a.py", ["src", "!src/generated", "src/generated/keep"], [], False),
+    # Only negated include patterns leave out what they match from every file
+    ("./tests/a.py", ["!tests"], [], False),
+    ("./src/a.py", ["!tests"], [], True),
+    ("./src/lib/test/a.py", [], ["**/test"], False),
+    ("./src/lib/a.py", [], ["**/test"], True),
+])
+def test_is_included(filepath, include, exclude, expected):
+    assert is_included(filepath, include, exclude) == expected
@@ -0,0 +1,128 @@
+import pytest
+from web3 import Web3
+
+import eth_wrapper
+from eth_wrapper import TransactionError
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(eth_wrapper, "RECEIPT_POLL_INTERVAL", 0)
+
+
+def drop_transactions(chain, count, skip=0):
+    """Have the node accept count raw transactions, after the first skip, without
+    keeping them, as if they dropped out of its mempool"""
+    make_request = chain.provider.make_request
+    sent = []
+    dropped = []
+
+    def request(method, params):
+        if method == "eth_sendRawTransaction":
+            sent.append(params[0])
+            if skip < len(sent) <= skip + count:
+                dropped.append(params[0])
+                return {"jsonrpc": "2.0", "id": 0, "result": Web3.keccak(hexstr=params[0]).hex()}
+        return make_request(method, params)
+
+    chain.provider.make_request = request
+    return dropped
+
+
+def nonce_of(chain, tx_hash):
+    return chain.w3.eth.get_transaction(tx_hash).nonce
+
+
+def test_pipelined_transactions_take_consecutive_nonces(chain, contract):
+    start = chain.w3.eth.get_transaction_count(contract.account_address)
+
+    with contract.pipeline() as receipts:
+        tx_hashes = [contract.fork_new_branch(f"branch{i}", 0) for i in range(5)]
+        # Nothing is waited for inside the block
+        assert receipts == []
+
+    assert [nonce_of(chain, tx_hash) for tx_hash in tx_hashes] == list(range(start, start + 5))
+    assert [receipt.transactionHash for receipt in receipts] == tx_hashes
+    assert all(receipt.status == 1 for receipt in receipts)
+    assert [contract.get_branch(i)[1] for i in range(1, 6)] == [f"branch{i}" for i in range(5)]
+
+
+def test_nonce_is_only_asked_for_once(chain, contract):
+    contract.fork_new_branch("first", 0)
+    start = len(chain.transactions)
+    counted = []
+    make_request = chain.provider.make_request
+    chain.provider.make_request = lambda method, params: counted.append(method) or make_request(method, params)
+
+    with contract.pipeline():
+        for i in range(3):
+            contract.fork_new_branch(f"branch{i}", 0)
+
+    assert "eth_getTransactionCount" not in counted
+    assert len(chain.transactions) == start + 3
+
+
+def test_dropped_transaction_is_sent_again(chain, contract):
+    dropped = drop_transactions(chain, 1)
+
+    receipt = contract.fork_new_branch("resent", 0)
+
+    assert len(dropped) == 1
+    assert receipt.status == 1
+    assert contract.get_branch(1)[1] == "resent"
+
+
+def test_dropped_transactions_in_a_pipeline(chain, contract):
+    # eth-tester refuses a nonce with a gap before it rather than holding it back the way a node does, so the last ones are lost
+    dropped = drop_transactions(chain, 2, skip=2)
+
+    with contract.pipeline() as receipts:
+        for i in range(4):
+            contract.fork_new_branch(f"branch{i}", 0)
+
+    assert len(dropped) == 2
+    assert len(receipts) == 4
+    assert [contract.get_branch(i)[1] for i in range(1, 5)] == [f"branch{i}" for i in range(4)]
+
+
+def test_replaced_transaction_fails_and_resets_the_nonce(chain, contract):
+    drop_transactions(chain, 1)
+
+    # Another client takes the nonce of the dropped transaction
+    w3 = chain.w3
+    with pytest.raises(TransactionError, match="was replaced by another transaction") as error:
+        with contract.pipeline():
+            contract.fork_new_branch("lost", 0)
+            w3.eth.send_transaction({"from": w3.eth.accounts[0], "to": w3.eth.accounts[1], "value": 1})
+
+    assert error.value.receipts == [None]
+    assert contract._next_nonce is None
+
+    # The next transaction asks the node for the nonce again and goes through
+    assert contract.fork_new_branch("next", 0).status == 1
+    assert contract.get_branch(1)[1] == "next"
+
+
+def test_failed_submission_resets_the_nonce(chain, contract):
+    contract.fork_new_branch("first", 0)
+    assert contract._next_nonce is not None
+
+    # Branch 7 doesn't exist, the gas estimate fails before anything is sent
+    with pytest.raises(Exception):
+        contract.add_editor_to_branch(7, "0x" + "b0" * 20)
+
+    assert contract._next_nonce is None
+    assert contract.fork_new_branch("second", 0).status == 1
+
+
+def test_reset_nonce_picks_up_other_clients(chain, contract):
+    contract.fork_new_branch("first", 0)
+
+    # The same account is used by another client in between
+    w3 = chain.w3
+    w3.eth.send_transaction({"from": w3.eth.accounts[0], "to": w3.eth.accounts[1], "value": 1})
+
+    contract.reset_nonce()
+    receipt = contract.fork_new_branch("second", 0)
+    assert receipt.status == 1
+    assert nonce_of(chain, receipt.transactionHash) == w3.eth.get_transaction_count(contract.account_address) - 1
@@ -0,0 +1,163 @@
+import pytest
+
+from tree_manifest import TREE_ROOT_PATH, build_tree, decode_manifest, diff_trees, merge_trees, read_tree, tree_root
+from unixfs_hash import hash_bytes
+
+FILES = {
+    "./README.md": hash_bytes(b"readme"),
+    "./src/main.py": hash_bytes(b"main"),
+    "./src/util/strings.py": hash_bytes(b"strings"),
+    "./src/util/numbers.py": hash_bytes(b"numbers"),
+    "./docs/index.md": hash_bytes(b"index"),
+}
+
+
+class Store(object):
+    """The manifests of several trees, counting the ones that are loaded"""
+    def __init__(self):
+        self.manifests = {}
+        self.loaded = []
+
+
+    def add(self, files):
+        root, manifests = build_tree(files)
+        self.manifests.update(manifests)
+        return root
+
+
+    def load(self, ipfs_hash):
+        self.loaded.append(ipfs_hash)
+        return self.manifests[ipfs_hash]
+
+
+def changed(files, changes):
+    """files with the contents of the paths in changes replaced, None deletes them"""
+    files = dict(files)
+    for filepath, contents in changes.items():
+        if contents is None:
+            del files[filepath]
+        else:
+            files[filepath] = hash_bytes(contents)
+    return files
+
+
+def test_round_trip():
+    store = Store()
+    root = store.add(FILES)
+
+    assert read_tree(root, store.load) == FILES
+    # The root, src, src/util and docs
+    assert len(store.manifests) == 4
+    entries = decode_manifest(store.manifests[root])
+    assert entries["README.md"] == {"type": "file", "hash": FILES["./README.md"]}
+    assert {name: entry["type"] for name, entry in entries.items()} == {"README.md": "file", "src": "dir", "docs": "dir"}
+
+
+def test_empty_tree():
+    store = Store()
+    root = store.add({})
+    assert read_tree(root, store.load) == {}
+
+
+def test_same_files_same_root():
+    # However the files were listed
+    assert build_tree(FILES)[0] == build_tree(dict(reversed(list(FILES.items()))))[0]
+    assert build_tree(FILES)[0] != build_tree(changed(FILES, {"./src/util/numbers.py": b"changed"}))[0]
+
+
+def test_tree_root():
+    root = build_tree(FILES)[0]
+    assert tree_root([[TREE_ROOT_PATH, root, 1]]) == root
+    assert tree_root([["./README.md", FILES["./README.md"], 1]]) is None
+    assert tree_root([[TREE_ROOT_PATH, root, 1], ["./README.md", FILES["./README.md"], 1]]) is None
+
+
+def test_diff_only_loads_changed_directories():
+    store = Store()
+    old = store.add(FILES)
+    new = store.add(changed(FILES, {"./src/util/strings.py": b"changed", "./docs/guide.md": b"guide", "./README.md": None}))
+    store.loaded = []
+
+    assert diff_trees(old, new, store.load) == [
+        ("./README.md", FILES["./README.md"], None),
+        ("./docs/guide.md", None, hash_bytes(b"guide")),
+        ("./src/util/strings.py", FILES["./src/util/strings.py"], hash_bytes(b"changed")),
+    ]
+    # Both roots, docs, src and src/util from each side
+    assert len(store.loaded) == 8
+
+    store.loaded = []
+    assert diff_trees(old, old, store.load) == []
+    assert store.loaded == []
+
+
+def test_directory_replaced_by_a_file():
+    store = Store()
+    old = store.add(FILES)
+    files = {f: h for f, h in FILES.items() if not f.startswith("./docs/")}
+    files["./docs"] = hash_bytes(b"docs")
+    new = store.add(files)
+
+    assert read_tree(new, store.load) == files
+    assert sorted(diff_trees(old, new, store.load)) == [("./docs", None, hash_bytes(b"docs")), ("./docs/index.md", FILES["./docs/index.md"], None)]
+
+
+def merge_file(filepath, parent_hash, child_hash, base_hash):
+    # Stands in for a line merge, only the files named "merges" can be combined
+    return hash_bytes(b"merged") if filepath.endswith("merges.txt") else None
+
+
+@pytest.mark.parametrize("parent_changes, child_changes, expected_changes, conflicts", [
+    # Changes to different files in the same directory
+    ({"./src/main.py": b"parent"}, {"./src/util/strings.py": b"child"}, {"./src/main.py": b"parent", "./src/util/strings.py": b"child"}, []),
+    # Additions and deletions on both sides
+    ({"./new.txt": b"new", "./docs/index.md": None}, {"./src/util/numbers.py": None}, {"./new.txt": b"new", "./docs/index.md": None, "./src/util/numbers.py": None}, []),
+    # The same change on both sides
+    ({"./README.md": b"same"}, {"./README.md": b"same"}, {"./README.md": b"same"}, []),
+    # Both changed a file that can be merged
+    ({"./src/merges.txt": b"parent"}, {"./src/merges.txt": b"child"}, {"./src/merges.txt": b"merged"}, []),
+    # Both changed a file that can't, the parent's side is kept
+    ({"./src/main.py": b"parent"}, {"./src/main.py": b"child"}, {"./src/main.py": b"parent"}, ["./src/main.py"]),
+    # Deleted on one side and changed on the other
+    ({"./README.md": None}, {"./README.md": b"child"}, {"./README.md": None}, ["./README.md"]),
+])
+def test_merge(parent_changes, child_changes, expected_changes, conflicts):
+    store = Store()
+    base_files = changed(FILES, {"./src/merges.txt": b"base"})
+    base = store.add(base_files)
+    parent = store.add(changed(base_files, parent_changes))
+    child = store.add(changed(base_files, child_changes))
+
+    root, manifests, found = merge_trees(base, parent, child, store.load, merge_file)
+    store.manifests.update(manifests)
+
+    assert found == conflicts
+    assert read_tree(root, store.load) == changed(base_files, expected_changes)
+
+
+def test_merge_takes_unchanged_directories_without_loading_them():
+    store = Store()
+    base = store.add(FILES)
+    parent = store.add(changed(FILES, {"./docs/index.md": b"parent"}))
+    child = store.add(changed(FILES, {"./src/util/strings.py": b"child"}))
+    store.loaded = []
+
+    root, manifests, conflicts = merge_trees(base, parent, child, store.load, merge_file)
+
+    # Only the 3 roots are read, docs is taken from the parent and src from the child
+    assert len(store.loaded) == 3
+    assert manifests.keys() == {root}
+    store.manifests.update(manifests)
+    assert read_tree(root, store.load) == changed(FILES, {"./docs/index.md": b"parent", "./src/util/strings.py": b"child"})
+
+
+def test_merge_that_empties_the_tree():
+    store = Store()
+    base = store.add({"./a/b.txt": hash_bytes(b"b")})
+    empty = store.add({})
+
+    root, manifests, conflicts = merge_trees(base, empty, base, store.load, merge_file)
+
+    store.manifests.update(manifests)
+    assert read_tree(root, store.load) == {}
+    assert conflicts == []
@@ -0,0 +1,53 @@
+import random
+
+import pytest
+
+from unixfs_hash import CHUNK_SIZE, MAX_LINKS, cid_to_digest, digest_to_cid, hash_bytes, hash_file, hash_files
+
+# Hashes printed by kubo's `ipfs add --only-hash` with its default settings, for
+# files of random bytes made by fixture_data. They cover a single leaf, a root
+# linking a few leaves, a root linking exactly MAX_LINKS leaves and the trees one
+# level deeper that files of more than MAX_LINKS chunks need
+FIXTURES = [
+    (0, "QmbFMke1KXqnYyBBWxB74N4c5SBnJMVAiMNRcGu6x1AwQH"),
+    (CHUNK_SIZE, "Qmbd9VNLTfpBW2arj1AkAJnVRYBq1WEY6Uu6wLEiemGipi"),
+    (CHUNK_SIZE + 1, "QmdkAszdeWKht9nXSzPKGUYvUqpMfm325GuCn1pZnTa9ja"),
+    (3 * CHUNK_SIZE + 1000, "QmcRbAne22sa4ZPSRW3sucbMLv7R2UJFAG87WgiqmuCR2w"),
+    (MAX_LINKS * CHUNK_SIZE, "QmNWRuH9CkAYPi3Gf99g1nB74Cw3y5NuPKohRs7KX2KsJz"),
+    (MAX_LINKS * CHUNK_SIZE + 1, "QmWvAUzQsaCFMPzTTFKwGmTmijHZ5aVRwJqGwrSHF89cuy"),
+    (180 * CHUNK_SIZE + 12345, "QmYRdsKC5U4mf6qaQHCky3hDxtgtxpjJ9iDgCp2kjrjeRT"),
+]
+
+
+def fixture_data(size):
+    return random.Random(size).randbytes(size)
+
+
+def test_hello_world():
+    assert hash_bytes(b"hello world\n") == "QmT78zSuBmuS4z925WZfrqQ1qHaJ56DQaTfyMUF7F8ff5o"
+
+
+@pytest.mark.parametrize("size,expected", FIXTURES)
+def test_matches_ipfs_add(tmp_path, size, expected):
+    filepath = tmp_path / "data"
+    filepath.write_bytes(fixture_data(size))
+
+    assert hash_file(filepath) == expected
+
+
+def test_hash_files_keeps_order(tmp_path):
+    filepaths = []
+    for size, _ in FIXTURES[:4]:
+        filepaths.append(tmp_path / str(size))
+        filepaths[-1].write_bytes(fixture_data(size))
+
+    assert hash_files(filepaths, workers=2) == [expected for _, expected in FIXTURES[:4]]
+
+
+@pytest.mark.parametrize("_,cid", FIXTURES)
+def test_digest_roundtrip(_, cid):
+    assert digest_to_cid(cid_to_digest(cid)) == cid
+
+
+def test_digest_of_other_cids():
+    assert cid_to_digest("bafkreifzjut3te2nhyekklss27nh3k72ysco7y32koao5eei66wof36n5e") is None
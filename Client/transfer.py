@@ -0,0 +1,104 @@
+import ipfs_cluster
+import ipfshttpclient
+import os
+import profiling
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+# Number of files that are uploaded to or downloaded from ipfs at the same time
+DEFAULT_WORKERS = int(os.getenv("VCS_JOBS") or 8)
+
+# Size in bytes of the buffer each transfer reads and writes file contents through,
+# which bounds the memory used by a transfer however large the file is
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+TRANSFER_BUFFER_SIZE = int(os.getenv("VCS_TRANSFER_BUFFER") or DEFAULT_BUFFER_SIZE)
+
+# Number of times a single file transfer is retried before giving up on it
+DEFAULT_RETRIES = 3
+RETRY_DELAY = 0.5
+
+_thread_data = threading.local()
+
+# Connections handed back by finished transfers, the worker threads of a pool go
+# away with it but their connections are picked up again by the next transfers
+_idle_connections = []
+_idle_lock = threading.Lock()
+
+
+def ipfs_connection():
+    """Return the ipfs client belonging to the current thread, so that every
+    worker thread has a connection of its own. Idle connections are reused
+    before new ones are opened"""
+    if getattr(_thread_data, "ipfs", None) is None:
+        with _idle_lock:
+            client = _idle_connections.pop() if _idle_connections else None
+
+        if client is None and ipfs_cluster.configured():
+            client = ipfs_cluster.connect(chunk_size=TRANSFER_BUFFER_SIZE)
+        elif client is None:
+            # Uploads are streamed from disk in pieces of chunk_size
+            client = ipfshttpclient.connect(chunk_size=TRANSFER_BUFFER_SIZE)
+        _thread_data.ipfs = client
+    return _thread_data.ipfs
+
+
+def release_ipfs_connection():
+    """Hand the connection of the current thread back for other threads to use"""
+    client = getattr(_thread_data, "ipfs", None)
+    if client is not None:
+        _thread_data.ipfs = None
+        with _idle_lock:
+            _idle_connections.append(client)
+
+
+class TransferError(Exception):
+    """Raised after every transfer has been attempted if any of them failed.
+    failures holds (item, exception) pairs in the order the items were given"""
+    def __init__(self, failures):
+        self.failures = failures
+
+        lines = [f"    {item}: {error!r}" for item, error in failures]
+        super().__init__(f"{len(failures)} transfer(s) failed:\n" + "\n".join(lines))
+
+
+def _with_retries(function, item, retries):
+    attempt = 0
+    try:
+        while True:
+            try:
+                return function(item)
+            except Exception:
+                if attempt >= retries:
+                    raise
+                time.sleep(RETRY_DELAY * 2 ** attempt)
+                attempt += 1
+    finally:
+        release_ipfs_connection()
+
+
+@profiling.phase
+def run_transfers(function, items, workers=DEFAULT_WORKERS, retries=DEFAULT_RETRIES):
+    """Call function on every item using a pool of worker threads and return
+    the results in the same order as items"""
+    items = list(items)
+    if not items:
+        return []
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [executor.submit(_with_retries, function, item, retries) for item in items]
+
+    results = []
+    failures = []
+    for item, future in zip(items, futures):
+        error = future.exception()
+        if error is not None:
+            failures.append((item, error))
+        else:
+            results.append(future.result())
+
+    if failures:
+        raise TransferError(failures)
+
+    return results
@@ -0,0 +1,173 @@
+import json
+
+from unixfs_hash import hash_bytes
+
+# Repositories can store each commit as a tree of directory manifests on ipfs
+# instead of listing every file on the chain. A manifest lists the entries of a
+# single directory, files point at their contents and subdirectories at their own
+# manifest, so a directory that did not change between 2 commits has the same hash
+# in both. The commit itself only records the hash of the root manifest, as a
+# single file entry with a path that can never appear in a working tree
+"""
+{
+    "version": 1,
+    "entries": {
+        "README.md": {"type": "file", "hash": "QmT78zSuBmuS4z925WZfrqQ1qHaJ56DQaTfyMUF7F8ff5o"},
+        "src": {"type": "dir", "hash": "QmbFMke1KXqnYyBBWxB74N4c5SBnJMVAiMNRcGu6x1AwQH"}
+    }
+}
+"""
+
+TREE_ROOT_PATH = "/"
+
+MANIFEST_VERSION = 1
+
+
+def tree_root(files):
+    """Return the root manifest hash if the [file_path, ipfs_hash, ...] entries of
+    a commit describe a tree, or None if the commit lists its files directly"""
+    if len(files) == 1 and files[0][0] == TREE_ROOT_PATH:
+        return files[0][1]
+    return None
+
+
+def encode_manifest(entries):
+    # Keys are sorted and whitespace left out so the same directory always gets the same hash
+    return json.dumps({"version": MANIFEST_VERSION, "entries": entries}, sort_keys=True, separators=(",", ":")).encode()
+
+
+def decode_manifest(data):
+    return json.loads(data)["entries"]
+
+
+def _store_manifest(entries, manifests):
+    data = encode_manifest(entries)
+    ipfs_hash = hash_bytes(data)
+    manifests[ipfs_hash] = data
+    return ipfs_hash
+
+
+def build_tree(files):
+    """Build the manifests for a file_path:ipfs_hash dictionary, returning the
+    root hash and a hash:manifest dictionary of every directory in the tree"""
+    root = {}
+    for filepath, ipfs_hash in files.items():
+        *directories, name = filepath[2:].split("/") if filepath.startswith("./") else filepath.split("/")
+
+        node = root
+        for directory in directories:
+            node = node.setdefault(directory, {})
+        node[name] = ipfs_hash
+
+    manifests = {}
+
+    def build(node):
+        entries = {}
+        for name, child in node.items():
+            if isinstance(child, dict):
+                entries[name] = {"type": "dir", "hash": build(child)}
+            else:
+                entries[name] = {"type": "file", "hash": child}
+        return _store_manifest(entries, manifests)
+
+    return build(root), manifests
+
+
+def _file_hash(entry):
+    return entry["hash"] if entry is not None and entry["type"] == "file" else None
+
+
+def _dir_hash(entry):
+    return entry["hash"] if entry is not None and entry["type"] == "dir" else None
+
+
+def diff_trees(old_root, new_root, load, prefix="."):
+    """Return (file_path, old_hash, new_hash) for every file that differs between
+    2 trees, a hash is None where the file does not exist. Directories with the
+    same hash in both trees are skipped without loading them. load takes the hash
+    of a manifest and returns its contents"""
+    if old_root == new_root:
+        return []
+
+    old_entries = decode_manifest(load(old_root)) if old_root is not None else {}
+    new_entries = decode_manifest(load(new_root)) if new_root is not None else {}
+
+    changes = []
+    for name in sorted(old_entries.keys() | new_entries.keys()):
+        old, new = old_entries.get(name), new_entries.get(name)
+        if old == new:
+            continue
+
+        path = f"{prefix}/{name}"
+
+        old_file, new_file = _file_hash(old), _file_hash(new)
+        if old_file != new_file:
+            changes.append((path, old_file, new_file))
+
+        old_dir, new_dir = _dir_hash(old), _dir_hash(new)
+        if old_dir != new_dir:
+            changes.extend(diff_trees(old_dir, new_dir, load, path))
+
+    return changes
+
+
+def read_tree(root, load):
+    """Return the file_path:ipfs_hash dictionary of every file in a tree"""
+    return {path: ipfs_hash for path, _, ipfs_hash in diff_trees(None, root, load)}
+
+
+def merge_trees(base_root, parent_root, child_root, load, merge_file):
+    """Three way merge of 2 trees against their common ancestor. Directories that
+    only changed on one side are taken from that side without being loaded.
+    merge_file(file_path, parent_hash, child_hash, base_hash) is called for files
+    changed on both sides and returns the merged hash, or None for a conflict.
+    Returns the merged root hash, the new manifests and the conflicting paths"""
+    manifests = {}
+    conflicts = []
+
+    def merge(base, parent, child, prefix):
+        if parent == child or base == child:
+            return parent
+        if base == parent:
+            return child
+
+        base_entries = decode_manifest(load(base)) if base is not None else {}
+        parent_entries = decode_manifest(load(parent)) if parent is not None else {}
+        child_entries = decode_manifest(load(child)) if child is not None else {}
+
+        entries = {}
+        for name in parent_entries.keys() | child_entries.keys():
+            b, p, c = base_entries.get(name), parent_entries.get(name), child_entries.get(name)
+            path = f"{prefix}/{name}"
+
+            if p == c or b == c:
+                result = p
+            elif b == p:
+                result = c
+            elif _dir_hash(p) is not None and _dir_hash(c) is not None:
+                merged = merge(_dir_hash(b), p["hash"], c["hash"], path)
+                result = {"type": "dir", "hash": merged} if merged is not None else None
+            elif _file_hash(p) is not None and _file_hash(c) is not None:
+                merged = merge_file(path, p["hash"], c["hash"], _file_hash(b))
+                if merged is None:
+                    conflicts.append(path)
+                result = {"type": "file", "hash": merged} if merged is not None else p
+            else:
+                # Deleted on one side and changed on the other, or a file replaced by a directory
+                conflicts.append(path)
+                result = p
+
+            if result is not None:
+                entries[name] = result
+
+        if not entries:
+            # Directories that end up empty are left out, the same as a working tree with no files in them
+            return None
+
+        return _store_manifest(entries, manifests)
+
+    root = merge(base_root, parent_root, child_root, ".")
+    if root is None:
+        root = _store_manifest({}, manifests)
+
+    return root, manifests, conflicts
@@ -0,0 +1,316 @@
+import hashlib
+import io
+import os
+import profiling
+import zlib
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+# Works out the same CIDv0 hashes as `ipfs add` with its default settings, without
+# needing an ipfs daemon. Files are split into fixed size chunks which become the
+# leaves of a balanced tree of dag-pb nodes holding unixfs data
+
+CHUNK_SIZE = 262144
+MAX_LINKS = 174
+
+# Multihash prefix for a 32 byte sha2-256 digest
+SHA2_256_PREFIX = b"\x12\x20"
+
+UNIXFS_FILE = 2
+
+BASE58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+
+# Large files can instead be split at content defined boundaries, so that an edit
+# only changes the chunks around it and every other chunk keeps its hash. A chunk
+# ends after an anchor byte when the checksum of the bytes before it has its low
+# bits clear, giving chunks of around 256KiB between the minimum and maximum size
+CDC_MIN_CHUNK = 64 * 1024
+CDC_MAX_CHUNK = 512 * 1024
+CDC_ANCHOR = b"\x5a"
+CDC_WINDOW = 64
+CDC_MASK = (1 << 10) - 1
+CDC_READ_SIZE = 4 * 1024 * 1024
+
+
+def _varint(value):
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _varint_field(number, value):
+    return _varint(number << 3) + _varint(value)
+
+
+def _bytes_field(number, data):
+    return _varint((number << 3) | 2) + _varint(len(data)) + data
+
+
+def _read_varint(data, position):
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, position
+
+
+def _fields(data):
+    """Yield the (field number, value) pairs of a serialised protobuf message,
+    only the varint and length delimited wire types are used by dag-pb"""
+    position = 0
+    while position < len(data):
+        key, position = _read_varint(data, position)
+        if key & 7 == 0:
+            value, position = _read_varint(data, position)
+        elif key & 7 == 2:
+            length, position = _read_varint(data, position)
+            value = data[position:position + length]
+            position += length
+        else:
+            raise ValueError(f"unexpected protobuf wire type {key & 7}")
+        yield key >> 3, value
+
+
+def _base58(data):
+    value = int.from_bytes(data, "big")
+    out = ""
+    while value > 0:
+        value, remainder = divmod(value, 58)
+        out = BASE58_ALPHABET[remainder] + out
+
+    # Leading zero bytes are kept as leading 1s
+    padding = len(data) - len(data.lstrip(b"\0"))
+    return BASE58_ALPHABET[0] * padding + out
+
+
+def _base58_decode(text):
+    value = 0
+    for char in text:
+        value = value * 58 + BASE58_ALPHABET.index(char)
+
+    padding = len(text) - len(text.lstrip(BASE58_ALPHABET[0]))
+    return b"\0" * padding + value.to_bytes((value.bit_length() + 7) // 8, "big")
+
+
+def cid_to_digest(cid):
+    """Return the 32 byte sha2-256 digest inside a CIDv0, or None if the
+    hash is in some other format"""
+    if not (len(cid) == 46 and cid.startswith("Qm")):
+        return None
+
+    try:
+        multihash = _base58_decode(cid)
+    except ValueError:
+        return None
+
+    if len(multihash) != 34 or not multihash.startswith(SHA2_256_PREFIX):
+        return None
+    return multihash[2:]
+
+
+def digest_to_cid(digest):
+    return _base58(SHA2_256_PREFIX + bytes(digest))
+
+
+def _unixfs_data(data, filesize, blocksizes=()):
+    out = _varint_field(1, UNIXFS_FILE)
+    if data:
+        out += _bytes_field(2, data)
+    out += _varint_field(3, filesize)
+    for blocksize in blocksizes:
+        out += _varint_field(4, blocksize)
+    return out
+
+
+def _encode_node(data, links):
+    """Serialise a dag-pb node, links are (multihash, cumulative size, file
+    size) tuples for the children"""
+    out = b""
+    # Links are serialised before the data, and always carry an empty name
+    for multihash, tsize, _ in links:
+        out += _bytes_field(2, _bytes_field(1, multihash) + _bytes_field(2, b"") + _varint_field(3, tsize))
+    out += _bytes_field(1, data)
+    return out
+
+
+def _dag_node(data, links):
+    """Serialise a dag-pb node and return its multihash and cumulative size"""
+    out = _encode_node(data, links)
+
+    multihash = SHA2_256_PREFIX + hashlib.sha256(out).digest()
+    return multihash, len(out) + sum(link[1] for link in links)
+
+
+def _leaf(chunk):
+    multihash, tsize = _dag_node(_unixfs_data(chunk, len(chunk)), [])
+    return multihash, tsize, len(chunk)
+
+
+def _parent(children):
+    filesize = sum(child[2] for child in children)
+    data = _unixfs_data(b"", filesize, [child[2] for child in children])
+    multihash, tsize = _dag_node(data, children)
+    return multihash, tsize, filesize
+
+
+def parent_block(children):
+    """Return the serialised node joining children, (multihash, cumulative size,
+    file size) tuples, into one file, its CID and the node's own tuple"""
+    filesize = sum(child[2] for child in children)
+    block = _encode_node(_unixfs_data(b"", filesize, [child[2] for child in children]), children)
+
+    multihash = SHA2_256_PREFIX + hashlib.sha256(block).digest()
+    return block, _base58(multihash), (multihash, len(block) + sum(child[1] for child in children), filesize)
+
+
+def read_file_node(block):
+    """Return the (CID, file size) of every child of a serialised file node, in order"""
+    links = []
+    blocksizes = []
+    for number, value in _fields(block):
+        if number == 2:
+            links.append(_base58(dict(_fields(value))[1]))
+        elif number == 1:
+            blocksizes = [size for field, size in _fields(value) if field == 4]
+
+    if len(links) != len(blocksizes):
+        raise ValueError("file node has a different number of links and block sizes")
+    return list(zip(links, blocksizes))
+
+
+def read_leaf(block):
+    """Return the part of a file held by a serialised leaf node"""
+    for number, value in _fields(block):
+        if number == 1:
+            return dict(_fields(value)).get(2, b"")
+    return b""
+
+
+def hash_stream(stream):
+    """Return the CIDv0 of everything read from a binary file object"""
+    nodes = []
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        nodes.append(_leaf(chunk))
+
+    if not nodes:
+        nodes.append(_leaf(b""))
+
+    # Build the balanced tree from the bottom up, a file that fits in a single chunk is just the leaf
+    while len(nodes) > 1:
+        nodes = [_parent(nodes[i:i + MAX_LINKS]) for i in range(0, len(nodes), MAX_LINKS)]
+
+    return _base58(nodes[0][0])
+
+
+def hash_bytes(data):
+    return hash_stream(io.BytesIO(data))
+
+
+def hash_file(filepath):
+    with open(filepath, "rb") as infile:
+        return hash_stream(infile)
+
+
+def cdc_chunks(stream):
+    """Yield the content defined chunks of everything read from a binary file object"""
+    buffer = b""
+    while True:
+        data = stream.read(CDC_READ_SIZE)
+        buffer += data
+
+        while True:
+            cut = _find_boundary(buffer, not data)
+            if cut is None:
+                break
+            yield buffer[:cut]
+            buffer = buffer[cut:]
+
+        if not data:
+            return
+
+
+def _find_boundary(buffer, end_of_file):
+    position = buffer.find(CDC_ANCHOR, CDC_MIN_CHUNK - 1, CDC_MAX_CHUNK)
+    while position != -1:
+        cut = position + 1
+        if zlib.crc32(buffer[cut - CDC_WINDOW:cut]) & CDC_MASK == 0:
+            return cut
+        position = buffer.find(CDC_ANCHOR, cut, CDC_MAX_CHUNK)
+
+    if len(buffer) >= CDC_MAX_CHUNK:
+        return CDC_MAX_CHUNK
+    if end_of_file and buffer:
+        return len(buffer)
+    return None
+
+
+def leaf_block(chunk):
+    """Return the serialised leaf node holding a chunk of a file and its CID"""
+    block = _encode_node(_unixfs_data(chunk, len(chunk)), [])
+    return block, _base58(SHA2_256_PREFIX + hashlib.sha256(block).digest())
+
+
+def chunk_file(filepath):
+    """Split a file into content defined chunks and build a balanced tree of
+    nodes over them, the same shape `ipfs add` uses. Returns the root CID, the
+    (offset, length, CID) of every leaf and the (CID, block) of every node above
+    the leaves. The leaves are not kept, they can be read back from the file"""
+    leaves = []
+    nodes = []
+    offset = 0
+    with open(filepath, "rb") as infile:
+        for chunk in cdc_chunks(infile):
+            multihash, tsize, size = _leaf(chunk)
+            leaves.append((offset, size, _base58(multihash)))
+            nodes.append((multihash, tsize, size))
+            offset += size
+
+    if not nodes:
+        nodes.append(_leaf(b""))
+        leaves.append((0, 0, _base58(nodes[0][0])))
+
+    parents = []
+    while len(nodes) > 1:
+        level = []
+        for i in range(0, len(nodes), MAX_LINKS):
+            block, cid, node = parent_block(nodes[i:i + MAX_LINKS])
+            parents.append((cid, block))
+            level.append(node)
+        nodes = level
+
+    return _base58(nodes[0][0]), leaves, parents
+
+
+def _hash_path(filepath, chunk_threshold=None):
+    if chunk_threshold is not None and os.path.getsize(filepath) >= chunk_threshold:
+        return chunk_file(filepath)[0]
+    return hash_file(filepath)
+
+
+@profiling.phase
+def hash_files(filepaths, workers=None, chunk_threshold=None):
+    """Hash a list of files spread across a pool of processes, the hashes are
+    returned in the same order as filepaths. Files of at least chunk_threshold
+    bytes are hashed as content defined chunks"""
+    filepaths = list(filepaths)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    hash_path = partial(_hash_path, chunk_threshold=chunk_threshold)
+
+    if len(filepaths) < 2 or workers == 1:
+        return [hash_path(filepath) for filepath in filepaths]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(hash_path, filepaths, chunksize=max(1, len(filepaths) // (workers * 4))))
+
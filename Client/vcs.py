@@ -0,0 +1,1032 @@
+import itertools
+import json
+import os
+import profiling
+
+import repo_index
+from blob_cache import BlobCache
+from chunked_storage import upload_chunked_file
+from commit_graph import GRAPH_FILEPATH, CommitGraph
+from commit_queue import QUEUE_FILEPATH, blob_store, clear_queue, load_queue, new_queue, save_queue
+from eth_wrapper import COMMIT_CHUNK_SIZE, EVENTS_VERSION, RepositoryContractWrapper, TransactionError
+from file_packs import PACK_FILE_SIZE, PACK_MIN_USED, group_files, pack_entries, pack_size, read_pack, split_packs, upload_pack, used_size
+from merge3 import merge_many
+from metadata_mirror import MIRROR_FILEPATH, MetadataMirror
+from sparse_checkout import is_included
+from transfer import DEFAULT_WORKERS, ipfs_connection, run_transfers
+from tree_manifest import TREE_ROOT_PATH, build_tree, diff_trees, merge_trees, read_tree, tree_root
+from unixfs_hash import hash_files
+from web3.exceptions import ContractLogicError
+
+# The commands of the client. A Repository holds everything a command needs to
+# know about one working tree, main.py runs them from the command line and they
+# can be used from Python the same way. Several can be used from the same
+# program, and the connection to the contract is kept open between calls:
+#
+#     repo = vcs.Repository.clone("./checkout", "0x...", private_key)
+#     repo.commit("Update the docs", push=True)
+#
+# Every path is taken relative to the root of the working tree, so the current
+# directory doesn't matter. A Repository is used by one thread at a time, the
+# settings of the working tree are read again at the start of every command
+
+# Example .repodata.json file
+"""
+{
+    "repo_name": "testing",
+    "repo_address": "0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF"
+    "current_branch_id": 0,
+    "tree_manifests": false,
+    "chunk_threshold": 16777216,
+    "sparse_include": ["src/app", "docs"],
+    "sparse_exclude": ["*.psd"]
+}
+"""
+
+CONNECTION_ADDRESS = "http://localhost:7545"
+
+REPODATA_FILEPATH = "./.repodata.json"
+
+# Files at the root of the repository that hold metadata rather than tracked content
+METADATA_FILES = {
+    REPODATA_FILEPATH,
+    repo_index.INDEX_FILEPATH,
+    MIRROR_FILEPATH,
+    MIRROR_FILEPATH + "-journal",
+    GRAPH_FILEPATH,
+    GRAPH_FILEPATH + ".tmp",
+    QUEUE_FILEPATH,
+    QUEUE_FILEPATH + ".tmp",
+}
+
+# The number of times push rebases the queue onto a branch that moved on and tries again
+PUSH_ATTEMPTS = 5
+
+
+class QueuedCommitsError(Exception):
+    """Raised when the working tree would be replaced while there are commits
+    waiting to be pushed"""
+    pass
+
+
+def get_commit_files(mirror: MetadataMirror, commit_id):
+    """The [file_path, ipfs_hash, commit_id] entries of a commit without its packs"""
+    return split_packs(mirror.get_files_from_commit(commit_id))[0]
+
+
+def merge_file_lists(parent_head_files, child_head_files, common_ancestor_files):
+    """Three way merge of 2 file_path:ipfs_hash dictionaries against their common
+    ancestor. Returns the merged files and a list of (file, parent_hash,
+    child_hash, ancestor_hash) for the files changed on both sides, which still
+    need merging with merge_files"""
+    # list which is going to contain the resulting merge of both commits
+    resulting_files = {}
+
+    # Files changed on both branches, these are merged together once every file has been looked at
+    conflicting = []
+
+    for file in sorted(parent_head_files.keys() | child_head_files.keys()):
+        parent_hash = parent_head_files.get(file, None)
+        child_hash = child_head_files.get(file, None)
+        ancestor_hash = common_ancestor_files.get(file, None)
+
+        if parent_hash == child_hash:
+            # Both branches are equal here
+            if parent_hash != None:
+                resulting_files[file] = parent_hash
+        elif parent_hash == ancestor_hash and parent_hash != child_hash:
+            # the file has been updated on the child branch but not on the parent branch
+            # we take the updates on the child branch
+            resulting_files[file] = child_hash
+        elif child_hash == ancestor_hash and parent_hash != child_hash:
+            # the file has been updated on the parent branch but not on the child branch
+            # we take the updates on the parent branch
+            resulting_files[file] = parent_hash
+        elif parent_hash != child_hash and parent_hash != ancestor_hash and ancestor_hash != child_hash:
+            # the same file in both parent and child have been updated independantly causing a merge conflict
+            conflicting.append((file, parent_hash, child_hash, ancestor_hash))
+        else:
+            # I've missed something here
+            raise Exception
+
+    return resulting_files, conflicting
+
+
+class Repository(object):
+    """A working tree of a repository. Progress, warnings and errors are
+    printed to output, stdout when it is None"""
+    def __init__(self, path=".", private_key=None, conn_url=CONNECTION_ADDRESS, jobs=DEFAULT_WORKERS, blob_cache=None, output=None):
+        self.path = os.path.abspath(path)
+        self.private_key = private_key
+        self.conn_url = conn_url
+        self.jobs = jobs
+        self.blob_cache = blob_cache if blob_cache is not None else BlobCache()
+        self.output = output
+
+        # Read from the repodata file at the start of every command
+        self.repo_address = None
+        self.current_branch = None
+        self.current_commit = None
+        self.tree_manifests = False
+        self.chunk_threshold = None
+        self.sparse_include = []
+        self.sparse_exclude = []
+
+        # The contract wrappers connected so far, one for each private key and repository
+        self._contracts = {}
+
+        if os.path.exists(self._path(REPODATA_FILEPATH)):
+            self.load_repodata()
+
+
+    @classmethod
+    @profiling.phase
+    def init(cls, path, name, private_key, tree_manifests=False, chunk_threshold=None, **kwargs):
+        """Deploy a new repository and make path its working tree"""
+        self = cls(path, private_key, **kwargs)
+        os.makedirs(self.path, exist_ok=True)
+
+        contract = RepositoryContractWrapper.deploy_new_repository(self.conn_url, private_key, name)
+        self._contracts[(private_key, contract.repository_address.lower())] = contract
+
+        self._save_repodata({
+            "repo_name": name,
+            "repo_address": contract.repository_address,
+            "current_branch_id": 0,
+            "current_commit_id": 0,
+            "tree_manifests": tree_manifests,
+            "chunk_threshold": chunk_threshold,
+        })
+        return self
+
+
+    @classmethod
+    @profiling.phase
+    def clone(cls, path, repository_address, private_key, chunk_threshold=None, include=(), exclude=(), **kwargs):
+        """Clone the mainline branch of a repository into path, only writing
+        the files matching the sparse checkout patterns if there are any"""
+        self = cls(path, private_key, **kwargs)
+        os.makedirs(self.path, exist_ok=True)
+
+        self.repo_address = repository_address
+        self.sparse_include, self.sparse_exclude = list(include), list(exclude)
+        contract = self._connect()
+
+        # Get the most recent commit on the branch with id 0 - mainline
+        commit_id = contract.most_recent_commit(0)
+
+        # Update the local files
+        self._fetch(contract, commit_id)
+
+        # Calculate the current repository data, new commits use the same format as the mainline branch
+        self._save_repodata({
+            "repo_name": contract.get_repository_name(),
+            "repo_address": repository_address,
+            "current_branch_id": 0,
+            "current_commit_id": commit_id,
+            "tree_manifests": tree_root(get_commit_files(self._load_mirror(contract), commit_id)) is not None,
+            "chunk_threshold": chunk_threshold,
+            "sparse_include": self.sparse_include,
+            "sparse_exclude": self.sparse_exclude,
+        })
+        return self
+
+
+    def _path(self, filepath):
+        """The location on disk of a path in the format stored on the chain, such as ./src/main.py"""
+        return os.path.join(self.path, filepath)
+
+
+    def _print(self, *args, **kwargs):
+        print(*args, file=self.output, **kwargs)
+
+
+    @profiling.phase
+    def load_repodata(self):
+        """Read the settings of the working tree from its repodata file"""
+        with open(self._path(REPODATA_FILEPATH), "r") as repodatafile:
+            repodata = json.load(repodatafile)
+
+        self.repo_address = repodata["repo_address"]
+        self.current_branch = repodata["current_branch_id"]
+        self.current_commit = repodata["current_commit_id"]
+        self.tree_manifests = repodata.get("tree_manifests", False)
+        self.chunk_threshold = repodata.get("chunk_threshold")
+        self.sparse_include = repodata.get("sparse_include", [])
+        self.sparse_exclude = repodata.get("sparse_exclude", [])
+
+        return repodata
+
+
+    def _save_repodata(self, repodata):
+        with open(self._path(REPODATA_FILEPATH), "w") as outfile:
+            json.dump(repodata, outfile)
+        self.load_repodata()
+
+
+    def _update_repodata(self, **changes):
+        repodata = self.load_repodata()
+        repodata.update(changes)
+        self._save_repodata(repodata)
+
+
+    @profiling.phase
+    def _connect(self):
+        """Return the wrapper of the repository's contract, connecting to it
+        the first time it is needed with the current private key"""
+        if self.private_key is None:
+            raise ValueError("A private key is needed to use the chain")
+
+        key = (self.private_key, self.repo_address.lower())
+        contract = self._contracts.get(key)
+        if contract is None:
+            contract = RepositoryContractWrapper.connect_to_repository(self.conn_url, self.private_key, self.repo_address)
+            self._contracts[key] = contract
+        else:
+            # Other clients may have sent transactions from the same account since the last call
+            contract.reset_nonce()
+
+        return contract
+
+
+    def _command(self):
+        """Start a command that uses the chain"""
+        self.load_repodata()
+        return self._connect()
+
+
+    def queued_commits(self):
+        """Return the number of commits waiting to be pushed"""
+        queue = load_queue(self.path)
+        return len(queue["commits"]) if queue is not None else 0
+
+
+    def has_queued_commits(self):
+        return self.queued_commits() > 0
+
+
+    def _check_queue(self):
+        if self.has_queued_commits():
+            raise QueuedCommitsError("There are commits waiting to be pushed, push them before changing the working tree")
+
+
+    @profiling.phase
+    def status(self):
+        """Return the lists of modified, added and deleted files"""
+        self.load_repodata()
+        return repo_index.working_tree_status(METADATA_FILES, self.chunk_threshold, self.path)
+
+
+    def sparse_files(self):
+        """Return the files of the checked out commit left out by the sparse checkout"""
+        return [filepath for filepath, entry in repo_index.load_index(self.path).items() if repo_index.is_sparse(entry)]
+
+
+    def set_sparse_patterns(self, include, exclude):
+        """Change the files written to disk by the next checkouts and fetches. Saved
+        before the files are fetched, so an interrupted fetch can be run again"""
+        self._update_repodata(sparse_include=list(include), sparse_exclude=list(exclude))
+
+
+    def _set_sparse_patterns(self, include, exclude):
+        # None keeps the patterns, empty lists write every file again
+        if include is not None or exclude is not None:
+            self.set_sparse_patterns(include or [], exclude or [])
+
+
+    @profiling.phase
+    def _fetch(self, contract: RepositoryContractWrapper, commit_id: int):
+        """Update the current local files, their contents and the directory
+        structure to match the ones specified at the given commit. Only the files
+        that differ from the currently checked out commit are touched"""
+
+        commit_files, packs = split_packs(self._load_mirror(contract).get_files_from_commit(commit_id))
+        current_files = repo_index.load_index(self.path)
+
+        root = tree_root(commit_files)
+        if root is not None:
+            # Rebuild the manifests of the checked out files locally so only the subtrees that differ need to be read
+            current_root, current_manifests = build_tree({f: e["ipfs_hash"] for f, e in current_files.items()})
+            load = lambda h: current_manifests[h] if h in current_manifests else self._load_manifest(h)
+
+            target_files = {f: e["ipfs_hash"] for f, e in current_files.items()}
+            for filepath, _, ipfshash in diff_trees(current_root, root, load):
+                if ipfshash is None:
+                    del target_files[filepath]
+                else:
+                    target_files[filepath] = ipfshash
+        else:
+            target_files = dict(map(lambda x: x[:2], commit_files))
+
+        # Files left out of a sparse checkout are only recorded in the index
+        sparse_files = {f: h for f, h in target_files.items() if not is_included(f, self.sparse_include, self.sparse_exclude)}
+        target_files = {f: h for f, h in target_files.items() if f not in sparse_files}
+
+        # Files which are on disk unmodified with the same contents as in the target commit can be kept as they are
+        kept_files = {}
+        for filepath, ipfshash in target_files.items():
+            entry = current_files.get(filepath)
+            if entry is not None and entry["ipfs_hash"] == ipfshash and repo_index.is_unchanged(filepath, entry, self.path):
+                kept_files[filepath] = entry
+
+        # Walk bottom up so that directories are already empty by the time we get to them
+        for root, dirs, files in os.walk(self.path, topdown=False):
+            prefix = repo_index.tree_path(self.path, root)
+            for name in files:
+                filepath = os.path.join(prefix, name)
+
+                if filepath in METADATA_FILES:
+                    # Don't delete the repodata file - that is going to end badly
+                    continue
+
+                if filepath in kept_files:
+                    continue
+
+                os.remove(os.path.join(root, name))
+            for directory in dirs:
+                fulldir = os.path.join(root, directory)
+                if not os.listdir(fulldir):
+                    os.rmdir(fulldir)
+
+        # Only download the files that are not already on disk
+        changed_files = [(f, h) for f, h in target_files.items() if f not in kept_files]
+
+        wanted = {}
+        for filepath, ipfshash in changed_files:
+            wanted.setdefault(ipfshash, []).append(filepath)
+
+        # Packs mostly made up of wanted files are downloaded whole, each file is taken from the first pack holding it
+        unpack = []
+        for pack, files in zip(packs, run_transfers(read_pack, packs, workers=self.jobs)):
+            if used_size(files, wanted) < PACK_MIN_USED * pack_size(files):
+                continue
+            unpack.append((pack, [(wanted.pop(h), offset, size) for h, offset, size in files if h in wanted]))
+
+        def download_pack(item):
+            pack, files = item
+            data = ipfs_connection().cat(pack)
+
+            entries = {}
+            for filepaths, offset, size in files:
+                for filepath in filepaths:
+                    os.makedirs(os.path.dirname(self._path(filepath)), exist_ok=True)
+                    with open(self._path(filepath), "wb") as outfile:
+                        outfile.write(data[offset:offset + size])
+                    entries[filepath] = repo_index.make_entry(filepath, target_files[filepath], root=self.path)
+            return entries
+
+        for entries in run_transfers(download_pack, unpack, workers=self.jobs):
+            kept_files.update(entries)
+
+        changed_files = [(f, h) for f, h in changed_files if f not in kept_files]
+
+        def download(item):
+            filepath, ipfshash = item
+
+            os.makedirs(os.path.dirname(self._path(filepath)), exist_ok=True)
+            self.blob_cache.cat_to_file(ipfs_connection(), ipfshash, self._path(filepath))
+
+            return repo_index.make_entry(filepath, ipfshash, root=self.path)
+
+        downloaded = run_transfers(download, changed_files, workers=self.jobs)
+
+        kept_files.update(zip([f for f, _ in changed_files], downloaded))
+        kept_files.update((f, repo_index.make_sparse_entry(h)) for f, h in sparse_files.items())
+        repo_index.save_index(kept_files, self.path)
+
+
+    @profiling.phase
+    def fetch(self, commit_id, include=None, exclude=None):
+        """Replace the working tree with the files of a commit, changing the
+        sparse checkout patterns first if any are given"""
+        contract = self._command()
+        self._check_queue()
+        self._set_sparse_patterns(include, exclude)
+        self._fetch(contract, commit_id)
+
+
+    @profiling.phase
+    def checkout(self, branch_id, include=None, exclude=None):
+        """Switch the working tree to the most recent commit of a branch"""
+        contract = self._command()
+        self._check_queue()
+        self._set_sparse_patterns(include, exclude)
+
+        commit_id = contract.most_recent_commit(branch_id)
+
+        self._fetch(contract, commit_id)
+
+        self._update_repodata(current_branch_id=branch_id, current_commit_id=commit_id)
+
+
+    @profiling.phase
+    def commit(self, message, push=False):
+        """Record the working tree as a new commit in the local commit queue,
+        push sends the queued commits to the chain"""
+        self.load_repodata()
+        self._make_commit(message)
+
+        if push:
+            self.push()
+
+
+    @profiling.phase
+    def _make_commit(self, commit_message: str):
+        index = repo_index.load_index(self.path)
+
+        filepaths = repo_index.list_working_tree(METADATA_FILES, self.path)
+        entries = {}
+        to_hash = []
+
+        for filepath in filepaths:
+            if filepath in index and repo_index.is_unchanged(filepath, index[filepath], self.path):
+                # Unchanged since it was last committed or fetched, reuse the recorded hash
+                entries[filepath] = index[filepath]
+                continue
+
+            # Take the stat before hashing so that any changes made while reading the file are picked up next time
+            entries[filepath] = repo_index.make_entry(filepath, None, root=self.path)
+            to_hash.append(filepath)
+
+        # Files left out of a sparse checkout keep the contents they have in the commit the working tree is based on
+        for filepath, entry in index.items():
+            if repo_index.is_sparse(entry) and filepath not in entries:
+                entries[filepath] = entry
+
+        queue = load_queue(self.path) or new_queue(self.current_branch, self.current_commit)
+        store = blob_store(self.repo_address, self.path)
+
+        # Work out the hashes locally, only contents that are not already stored in ipfs or the queue need to be kept for uploading
+        known_hashes = {entry["ipfs_hash"] for entry in index.values()} | queue["blobs"].keys()
+
+        for filepath, ipfshash in zip(to_hash, hash_files([self._path(f) for f in to_hash], chunk_threshold=self.chunk_threshold)):
+            entries[filepath]["ipfs_hash"] = ipfshash
+
+            if ipfshash not in known_hashes:
+                self._print(filepath)
+                store.put_file(ipfshash, self._path(filepath))
+                queue["blobs"][ipfshash] = entries[filepath]["size"]
+                known_hashes.add(ipfshash)
+
+        queue["commits"].append({"message": commit_message, "files": {filepath: entry["ipfs_hash"] for filepath, entry in entries.items()}})
+        save_queue(queue, self.path)
+
+        # The index now holds exactly the files of the new commit
+        repo_index.save_index(entries, self.path)
+
+        self._print(f"{len(queue['commits'])} commit(s) waiting to be pushed")
+
+
+    @profiling.phase
+    def _upload_blobs(self, blobs, store):
+        """Upload the queued contents, a hash:size dictionary, from the blob store.
+        Returns the packs made and a dictionary of any hashes ipfs gave differently"""
+        to_upload = list(blobs)
+
+        # Large files are sent as chunks one file at a time, the chunks of each file go up in parallel instead
+        chunked = [h for h in to_upload if self.chunk_threshold is not None and blobs[h] >= self.chunk_threshold]
+        to_upload = [h for h in to_upload if h not in chunked]
+
+        renamed = {}
+        for expected in chunked:
+            ipfshash, sent = upload_chunked_file(store.path(expected), workers=self.jobs)
+            self._print(f"{expected}: sent {sent} of {blobs[expected]} bytes")
+            if ipfshash != expected:
+                # The file was chunked differently to when it was hashed, the root that was uploaded is the one that can be read back
+                self._print(f"WARNING: ipfs hashed {expected} as {ipfshash}")
+                renamed[expected] = ipfshash
+
+        # Small files are sent in packs, each pack is a single upload and pin however many files it holds
+        packed = [h for h in to_upload if blobs[h] <= PACK_FILE_SIZE]
+        packs = []
+        if len(packed) > 1:
+            packs = run_transfers(upload_pack, group_files([(store.path(h), h, blobs[h]) for h in packed]), workers=self.jobs)
+            to_upload = [h for h in to_upload if h not in packed]
+
+        uploaded = run_transfers(lambda h: ipfs_connection().add(store.path(h))["Hash"], to_upload, workers=self.jobs)
+
+        for expected, ipfshash in zip(to_upload, uploaded):
+            if ipfshash != expected:
+                # The daemon is using different settings to ours, trust the hash it gave back
+                self._print(f"WARNING: ipfs hashed {expected} as {ipfshash}")
+                renamed[expected] = ipfshash
+
+        return packs, renamed
+
+
+    @profiling.phase
+    def _rebase_queue(self, contract: RepositoryContractWrapper, queue, head_commit):
+        """Replay the changes made by each queued commit on top of head_commit, the
+        way a merge would. Returns False if any of them conflict"""
+        mirror = self._load_mirror(contract)
+
+        base = dict(map(lambda x: x[:2], self._get_all_files_from_commit(mirror, queue["base_commit_id"])))
+        onto = dict(map(lambda x: x[:2], self._get_all_files_from_commit(mirror, head_commit)))
+
+        for commit in queue["commits"]:
+            files = commit["files"]
+
+            resulting, conflicting = merge_file_lists(onto, files, base)
+            merged = self._merge_files(conflicting)
+            if len(merged) != len(conflicting):
+                self._print(f"ERROR: Conflicts rebasing \"{commit['message']}\" onto commit {head_commit}. Push Aborted")
+                return False
+            resulting.update(merged)
+
+            commit["files"] = resulting
+            base, onto = files, resulting
+
+        queue["base_commit_id"] = head_commit
+        save_queue(queue, self.path)
+        return True
+
+
+    def _commit_lists(self, contract: RepositoryContractWrapper, queue):
+        """The file paths and hashes to record on the chain for each queued commit"""
+        mirror = self._load_mirror(contract)
+        packs = split_packs(mirror.get_files_from_commit(queue["base_commit_id"]))[1]
+
+        lists = []
+        for commit in queue["commits"]:
+            # Packs are kept while most of what they hold is still in use
+            packs = self._carry_packs(queue["packs"] + [p for p in packs if p not in queue["packs"]], set(commit["files"].values()))
+            lists.append(self._commit_file_lists(commit["files"], packs))
+        return lists
+
+
+    @profiling.phase
+    def _send_commits(self, contract: RepositoryContractWrapper, branch_id, commits, previous):
+        """Send (file lists, queued commit) pairs to the chain back to back on top
+        of commit previous and return the receipts of those that were sent"""
+        # Commit ids are handed out in order, so each commit can build on the predicted id of the one before it.
+        # A commit made by somebody else in the meantime takes one of the ids and the commits after it are reverted
+        first_id = contract.get_commits_count()
+        try:
+            with contract.pipeline() as receipts:
+                for i, ((filepaths, ipfs_hashes), commit) in enumerate(commits):
+                    contract.make_commit(filepaths, ipfs_hashes, branch_id, previous if i == 0 else first_id + i - 1, comment=commit["message"])
+            return receipts
+        except TransactionError as e:
+            self._print(f"WARNING: {e}")
+            return e.receipts
+        except (ContractLogicError, ValueError) as e:
+            self._print(f"WARNING: {e}")
+
+        # Let the transactions that were already sent finish before looking at the branch
+        try:
+            return contract.wait_for_transactions()
+        except TransactionError as e:
+            return e.receipts
+
+
+    @profiling.phase
+    def _submit_commits(self, contract: RepositoryContractWrapper, queue):
+        """Send the queued commits to the chain back to back, each expecting the one
+        before it to be the head of the branch, so the chain's latency is paid once
+        rather than for every commit. The commits after one that got a different
+        id than predicted are sent again on top of the id it did get. Use
+        _pushed_commits to find out which were made"""
+        lists = self._commit_lists(contract, queue)
+        previous = queue["base_commit_id"]
+
+        try:
+            if any(len(filepaths) > COMMIT_CHUNK_SIZE for filepaths, _ in lists):
+                # Commits spread over several transactions need their ids from the chain, these go one at a time
+                for (filepaths, ipfs_hashes), commit in zip(lists, queue["commits"]):
+                    receipt = contract.make_commit(filepaths, ipfs_hashes, queue["branch_id"], previous, comment=commit["message"])
+                    ids = contract.created_commit_ids([receipt])
+                    previous = ids[0] if ids is not None else contract.most_recent_commit(queue["branch_id"])
+                return
+        except (TransactionError, ContractLogicError, ValueError) as e:
+            self._print(f"WARNING: {e}")
+            return
+
+        commits = list(zip(lists, queue["commits"]))
+        while commits:
+            receipts = self._send_commits(contract, queue["branch_id"], commits, previous)
+
+            ids = contract.created_commit_ids(receipts)
+            if ids is None:
+                # Without the events _pushed_commits reads the branch to find out what was made
+                return
+
+            made = 0
+            while made < len(ids) and ids[made] is not None:
+                made += 1
+            if made == 0:
+                return
+
+            previous = ids[made - 1]
+            commits = commits[made:]
+
+
+    @profiling.phase
+    def _pushed_commits(self, contract: RepositoryContractWrapper, queue):
+        """Return how many commits at the front of the queue have been made on the
+        branch since the queue's base commit, and the id of the last of them"""
+        mirror = self._load_mirror(contract)
+
+        # Walk back from the head of the branch to the base commit
+        chain = []
+        commit_id = contract.most_recent_commit(queue["branch_id"])
+        while commit_id > queue["base_commit_id"]:
+            chain.append(commit_id)
+            commit_id = mirror.get_commit(commit_id)[4]
+
+        made, last = 0, queue["base_commit_id"]
+        if commit_id != queue["base_commit_id"]:
+            return made, last
+
+        for commit_id, queued in zip(reversed(chain), queue["commits"]):
+            commit = mirror.get_commit(commit_id)
+            # A squash merge's previous is on the merged branch, the commits the walk found there were not made by push
+            if commit[1] != queue["branch_id"] or commit[0].lower() != contract.account_address.lower() or commit[2] != queued["message"]:
+                break
+            made, last = made + 1, commit_id
+
+        return made, last
+
+
+    @profiling.phase
+    def push(self):
+        """Upload the contents of the queued commits and send the commits to the chain"""
+        contract = self._command()
+
+        queue = load_queue(self.path)
+        if queue is None or not queue["commits"]:
+            self._print("Nothing to push")
+            return
+
+        store = blob_store(self.repo_address, self.path)
+
+        if queue["blobs"]:
+            packs, renamed = self._upload_blobs(queue["blobs"], store)
+            for commit in queue["commits"]:
+                commit["files"] = {f: renamed.get(h, h) for f, h in commit["files"].items()}
+
+            # Saved so that a push that fails after this point does not upload everything again
+            queue["blobs"] = {}
+            queue["packs"] += packs
+            save_queue(queue, self.path)
+
+        rebased = False
+        for _ in range(PUSH_ATTEMPTS):
+            head_commit = contract.most_recent_commit(queue["branch_id"])
+            if head_commit != queue["base_commit_id"]:
+                self._print(f"Branch has moved on to commit {head_commit}, rebasing {len(queue['commits'])} commit(s)")
+                if not self._rebase_queue(contract, queue, head_commit):
+                    return
+                rebased = True
+
+            self._submit_commits(contract, queue)
+
+            made, last = self._pushed_commits(contract, queue)
+            if made:
+                self._print(f"Pushed {made} commit(s)")
+                queue["commits"] = queue["commits"][made:]
+                queue["base_commit_id"] = last
+                save_queue(queue, self.path)
+
+            if not queue["commits"]:
+                break
+        else:
+            self._print(f"ERROR: Gave up after {PUSH_ATTEMPTS} attempts, {len(queue['commits'])} commit(s) are still waiting to be pushed")
+            return
+
+        head_commit = contract.most_recent_commit(queue["branch_id"])
+        clear_queue(self.repo_address, self.path)
+
+        self._update_repodata(current_commit_id=head_commit)
+
+        if rebased:
+            # The working tree still has the files from before the rebase
+            self._fetch(contract, head_commit)
+
+
+    @profiling.phase
+    def branch(self, name):
+        """Fork a new branch from the current one"""
+        contract = self._command()
+        contract.fork_new_branch(name, self.current_branch)
+
+
+    def branches(self):
+        """Return a list of (branch_id, [owner, name]) pairs for every branch"""
+        contract = self._command()
+        return self._load_mirror(contract).get_branches()
+
+
+    @profiling.phase
+    def branch_info(self):
+        """Return the [owner, name] of the current branch, its editors and how
+        many commits it is ahead and behind mainline, None on mainline itself"""
+        contract = self._command()
+
+        mirror = self._load_mirror(contract)
+        mirror.sync_editors(self.current_branch)
+
+        branch_data = mirror.get_branch(self.current_branch)
+        editors = mirror.get_branch_editors(self.current_branch)
+
+        ahead_behind = None
+        if self.current_branch != 0:
+            # Compare against the mainline branch
+            graph = self._load_commit_graph(mirror)
+            ahead_behind = graph.ahead_behind(contract.most_recent_commit(self.current_branch), contract.most_recent_commit(0))
+
+        return branch_data, editors, ahead_behind
+
+
+    def add_editors(self, addresses):
+        contract = self._command()
+
+        # Submit all the transactions at once and wait for them together
+        with contract.pipeline():
+            for address in addresses:
+                self._print(f"Adding \"{address}\" to branch")
+                contract.add_editor_to_branch(self.current_branch, address)
+
+
+    def remove_editors(self, addresses):
+        contract = self._command()
+
+        with contract.pipeline():
+            for address in addresses:
+                self._print(f"Removing \"{address}\" from branch")
+                contract.remove_editor_from_branch(self.current_branch, address)
+
+
+    @profiling.phase
+    def merge(self, child_branch_id, message=None, squash=False):
+        """Merge a branch into the current branch"""
+        contract = self._command()
+        self._check_queue()
+
+        if squash:
+            self._squash_merge(contract, child_branch_id, message)
+        else:
+            self._three_way_merge(contract, child_branch_id, message)
+
+
+    @profiling.phase
+    def _squash_merge(self, contract: RepositoryContractWrapper, child_branch, comment):
+        if comment is None:
+            comment = f"Squash Merge From Branch ID {child_branch}"
+        contract.squash_merge(self.current_branch, child_branch, comment)
+        commit_id = contract.most_recent_commit(self.current_branch)
+
+        # The squash merge commit has the files of the child branch
+        self._fetch(contract, commit_id)
+
+        self._update_repodata(current_commit_id=commit_id)
+
+
+    @profiling.phase
+    def _load_mirror(self, contract: RepositoryContractWrapper):
+        """Open the local copy of the repository metadata and bring it up to date with the chain"""
+        mirror = MetadataMirror(contract, self._path(MIRROR_FILEPATH))
+        mirror.sync()
+        return mirror
+
+
+    @profiling.phase
+    def _load_commit_graph(self, mirror: MetadataMirror):
+        """Open the local commit graph and add any commits that are new in the mirror"""
+        graph = CommitGraph(self._path(GRAPH_FILEPATH))
+        graph.update(mirror)
+        return graph
+
+
+    def _carry_packs(self, packs, ipfs_hashes):
+        """Return the packs that are still mostly made up of files with the given hashes"""
+        contents = run_transfers(read_pack, packs, workers=self.jobs)
+        return [pack for pack, files in zip(packs, contents) if used_size(files, ipfs_hashes) >= PACK_MIN_USED * pack_size(files)]
+
+
+    @profiling.phase
+    def _load_manifest(self, ipfs_hash):
+        return self.blob_cache.cat(ipfs_connection(), ipfs_hash)
+
+
+    @profiling.phase
+    def _upload_manifests(self, manifests):
+        """Upload the tree manifests that are not already known locally"""
+        new_manifests = [(h, data) for h, data in manifests.items() if self.blob_cache.get(h) is None]
+
+        def upload(item):
+            ipfshash, data = item
+            if ipfs_connection().add_bytes(data) != ipfshash:
+                raise Exception(f"ipfs hashed the manifest {ipfshash} differently, the tree would not be readable")
+            self.blob_cache.put(ipfshash, data)
+
+        run_transfers(upload, new_manifests, workers=self.jobs)
+
+
+    def _commit_file_lists(self, files, packs=()):
+        """Turn a file_path:ipfs_hash dictionary and the packs holding the files
+        into the file paths and hashes to record on the chain, in the format used
+        by this repository"""
+        pack_paths, pack_hashes = pack_entries(packs)
+
+        if self.tree_manifests:
+            root, manifests = build_tree(files)
+            self._upload_manifests(manifests)
+            return [TREE_ROOT_PATH] + pack_paths, [root] + pack_hashes
+
+        return list(files.keys()) + pack_paths, list(files.values()) + pack_hashes
+
+
+    def _merged_packs(self, mirror: MetadataMirror, commits, ipfs_hashes=None):
+        """The packs of the commits being merged that are worth keeping in the merge
+        commit, every pack is kept if the hashes of the merged files aren't given"""
+        packs = []
+        for commit_id in commits:
+            packs += [pack for pack in split_packs(mirror.get_files_from_commit(commit_id))[1] if pack not in packs]
+
+        if ipfs_hashes is None:
+            return packs
+        return self._carry_packs(packs, ipfs_hashes)
+
+
+    def _get_all_files_from_commit(self, mirror: MetadataMirror, commit_id):
+        files = get_commit_files(mirror, commit_id)
+
+        root = tree_root(files)
+        if root is not None:
+            return [[filepath, ipfshash, commit_id] for filepath, ipfshash in read_tree(root, self._load_manifest).items()]
+
+        return files
+
+
+    @profiling.phase
+    def _merge_files(self, conflicting):
+        """Merge the changes made on both branches to each of a list of (file,
+        parent_hash, child_hash, ancestor_hash). Every version is downloaded at
+        once and the merges are spread across a pool of processes. Returns a
+        file:hash dictionary of the files that merged cleanly, every conflict
+        is reported rather than stopping at the first one"""
+        hashes = list({h for _, *file_hashes in conflicting for h in file_hashes if h is not None})
+        contents = dict(zip(hashes, run_transfers(lambda h: self.blob_cache.cat(ipfs_connection(), h), hashes, workers=self.jobs)))
+
+        # A file added on both branches is merged as if it had been empty
+        contents[None] = b""
+
+        # A file deleted on one branch and changed on the other can't be merged line by line
+        mergeable = []
+        for file, parent_hash, child_hash, ancestor_hash in conflicting:
+            if parent_hash is None or child_hash is None:
+                self._print(f"WARNING: could not resolve conflict in file {file}, it was deleted on one branch and changed on the other")
+            else:
+                mergeable.append((file, parent_hash, child_hash, ancestor_hash))
+
+        results = merge_many([(contents[b], contents[p], contents[c]) for _, p, c, b in mergeable])
+
+        merged = []
+        for (file, *_), (output, conflicts) in zip(mergeable, results):
+            if conflicts:
+                self._print(f"WARNING: could not resolve {conflicts} conflicting change(s) in file {file}")
+            else:
+                merged.append((file, output))
+
+        def upload(item):
+            _, output = item
+            filehash = ipfs_connection().add_bytes(output)
+            self.blob_cache.put(filehash, output)
+            return filehash
+
+        return dict(zip([file for file, _ in merged], run_transfers(upload, merged, workers=self.jobs)))
+
+
+    @profiling.phase
+    def _three_way_merge_trees(self, contract: RepositoryContractWrapper, parent_root, child_root, ancestor_root, parent_head_commit, child_head_commit, comment):
+        # Find the files changed on both sides first so they can all be merged together, the parent's version stands in for now
+        conflicting = []
+
+        def collect(file, parent_hash, child_hash, ancestor_hash):
+            conflicting.append((file, parent_hash, child_hash, ancestor_hash))
+            return parent_hash
+
+        merge_trees(ancestor_root, parent_root, child_root, self._load_manifest, collect)
+
+        merged_files = self._merge_files(conflicting)
+
+        # The manifests read by the first pass are in the blob cache, so the second pass only has to build the merged tree
+        root, manifests, conflicts = merge_trees(ancestor_root, parent_root, child_root, self._load_manifest, lambda file, *_: merged_files.get(file))
+
+        # Files that failed to merge have already been reported
+        reported = {file for file, *_ in conflicting}
+        for file in conflicts:
+            if file not in reported:
+                self._print(f"WARNING: could not resolve conflict in {file}")
+
+        if conflicts:
+            self._print("ERROR: Merge Conflicts Detected. Merge Aborted")
+            return
+
+        self._upload_manifests(manifests)
+
+        # Reading every file of the merged tree would undo skipping the unchanged subtrees, packs no longer needed are dropped by the next commit instead
+        packs = self._merged_packs(self._load_mirror(contract), (parent_head_commit, child_head_commit))
+        pack_paths, pack_hashes = pack_entries(packs)
+
+        contract.make_commit_multiparent([TREE_ROOT_PATH] + pack_paths, [root] + pack_hashes, self.current_branch, parent_head_commit, child_head_commit, comment)
+
+        self._fetch(contract, contract.most_recent_commit(self.current_branch))
+
+        self._print("Merge Completed")
+
+
+    @profiling.phase
+    def _three_way_merge(self, contract: RepositoryContractWrapper, child_branch, comment):
+        mirror = self._load_mirror(contract)
+
+        graph = self._load_commit_graph(mirror)
+
+        parent_head_commit = contract.most_recent_commit(self.current_branch)
+        child_head_commit = contract.most_recent_commit(child_branch)
+
+        # Find the common ancestor
+        common_ancestor_commit = graph.merge_base(parent_head_commit, child_head_commit)
+
+        roots = [tree_root(get_commit_files(mirror, c)) for c in (parent_head_commit, child_head_commit, common_ancestor_commit)]
+        if None not in roots:
+            # Subtrees that only changed on one side don't need to be looked at
+            return self._three_way_merge_trees(contract, *roots, parent_head_commit, child_head_commit, comment)
+
+        # Get the list of file hashes/file paths
+        parent_head_files = self._get_all_files_from_commit(mirror, parent_head_commit)
+        child_head_files = self._get_all_files_from_commit(mirror, child_head_commit)
+        common_ancestor_files = self._get_all_files_from_commit(mirror, common_ancestor_commit)
+
+        # Convert into dictionaries of file_path:ipfs_hash
+        parent_head_files = dict(map(lambda x: x[:2], parent_head_files))
+        child_head_files = dict(map(lambda x: x[:2], child_head_files))
+        common_ancestor_files = dict(map(lambda x: x[:2], common_ancestor_files))
+
+        resulting_files, conflicting = merge_file_lists(parent_head_files, child_head_files, common_ancestor_files)
+
+        merged_files = self._merge_files(conflicting)
+        resulting_files.update(merged_files)
+
+        # Return early if there has been a merge conflict
+        if len(merged_files) != len(conflicting):
+            self._print("ERROR: Merge Conflicts Detected. Merge Aborted")
+            return
+
+        # Convert dictionary into 2 lists
+        packs = self._merged_packs(mirror, (parent_head_commit, child_head_commit), set(resulting_files.values()))
+        filepaths, ipfs_hashes = self._commit_file_lists(resulting_files, packs)
+
+        # Create a multi parent commit
+        contract.make_commit_multiparent(filepaths, ipfs_hashes, self.current_branch, parent_head_commit, child_head_commit, comment)
+
+        # Update the directory
+        self._fetch(contract, contract.most_recent_commit(self.current_branch))
+
+        self._print("Merge Completed")
+
+
+    @profiling.phase
+    def commit_log(self, since=None, author=None):
+        """Return an iterator over the (commit_id, commit) of the commits made
+        on the current branch, newest first"""
+        contract = self._command()
+
+        if contract.contract_version >= EVENTS_VERSION:
+            # Read from the event logs a range of blocks at a time, so the newest commits are available straight away
+            return contract.iter_commit_events(self.current_branch, author, since)
+
+        # Older contracts don't emit events, the whole branch is read into the mirror instead
+        commits = reversed(self._load_mirror(contract).get_commits_from_branch(self.current_branch))
+        if author is not None:
+            commits = (c for c in commits if c[1][0].lower() == author.lower())
+        if since is not None:
+            commits = itertools.takewhile(lambda c: c[1][3] >= since, commits)
+        return commits
+
+
+    def log(self, limit=None, since=None, author=None):
+        """Return the (commit_id, commit) of the commits made on the current
+        branch, newest first"""
+        return list(itertools.islice(self.commit_log(since, author), limit))
+
+
+    @profiling.phase
+    def diff(self, old_commit, new_commit):
+        """Return the (file_path, old_hash, new_hash) of every file that differs
+        between 2 commits, the old hash is None for added files and the new
+        hash for deleted ones"""
+        contract = self._command()
+        mirror = self._load_mirror(contract)
+
+        old_files = get_commit_files(mirror, old_commit)
+        new_files = get_commit_files(mirror, new_commit)
+
+        old_root, new_root = tree_root(old_files), tree_root(new_files)
+        if old_root is not None and new_root is not None:
+            # Only the subtrees that differ between the 2 commits are read
+            return list(diff_trees(old_root, new_root, self._load_manifest))
+
+        old_files = dict(map(lambda x: x[:2], self._get_all_files_from_commit(mirror, old_commit)))
+        new_files = dict(map(lambda x: x[:2], self._get_all_files_from_commit(mirror, new_commit)))
+        return [(f, old_files.get(f), new_files.get(f)) for f in sorted(old_files.keys() | new_files.keys()) if old_files.get(f) != new_files.get(f)]
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import socket
+import sys
+import tempfile
+
+from getpass import getpass
+
+# A thin client for vcs_daemon.py taking the same arguments as main.py. It only
+# imports the standard library, the command is sent over a Unix socket to the
+# daemon, which runs it with its modules already loaded and its connections to
+# the node and ipfs already open. The output of the command is streamed back and
+# the daemon asks for the private key when the command needs one. Without a
+# running daemon the command is run by main.py as usual
+
+SOCKET_PATH = os.getenv("VCS_DAEMON_SOCKET") or os.path.join(os.getenv("XDG_RUNTIME_DIR") or tempfile.gettempdir(), f"vcs-daemon-{os.getuid()}.sock")
+
+MAIN_FILEPATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+# Flags that change how the process itself runs, commands using them are never sent to the daemon
+LOCAL_ONLY_FLAGS = ("--profile",)
+
+
+def send(connection, message):
+    connection.sendall(json.dumps(message).encode() + b"\n")
+
+
+def run_locally(argv):
+    os.execv(sys.executable, [sys.executable, MAIN_FILEPATH] + argv)
+
+
+def run(argv):
+    """Run a command in the daemon and return its exit status"""
+    if any(arg in LOCAL_ONLY_FLAGS for arg in argv):
+        run_locally(argv)
+
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(SOCKET_PATH)
+    except (FileNotFoundError, ConnectionRefusedError):
+        run_locally(argv)
+
+    with connection, connection.makefile("r") as replies:
+        send(connection, {"argv": argv, "cwd": os.getcwd(), "private_key": os.getenv("VCS_PRIVATE_KEY")})
+
+        for line in replies:
+            reply = json.loads(line)
+            if "stdout" in reply:
+                sys.stdout.write(reply["stdout"])
+                sys.stdout.flush()
+            elif "stderr" in reply:
+                sys.stderr.write(reply["stderr"])
+                sys.stderr.flush()
+            elif "prompt" in reply:
+                send(connection, {"answer": getpass(reply["prompt"])})
+            elif "exit" in reply:
+                return reply["exit"]
+
+    print("ERROR: The daemon closed the connection before the command finished", file=sys.stderr)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(run(sys.argv[1:]))
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import traceback
+
+import main
+import vcs
+from vcs_client import SOCKET_PATH
+
+# Runs the commands sent by vcs_client.py. web3, the contract ABI and the ipfs
+# client are loaded once, and the contract wrappers, the HTTP sessions to the
+# node and the ipfs connections stay open between commands, so a command only
+# costs the work it does. Each command is run by main.py's own code on the
+# vcs.Repository of the directory the client was started in, with its output
+# streamed back to the client. Commands in different working trees run at the
+# same time, those in the same working tree one after another. The private key
+# is the client's VCS_PRIVATE_KEY, otherwise the daemon's, otherwise the client
+# is asked for it
+
+
+class _ClientStream(io.TextIOBase):
+    """Sends everything written to it to the client, as stdout or stderr"""
+    def __init__(self, handler, name):
+        self._handler = handler
+        self._name = name
+
+
+    def writable(self):
+        return True
+
+
+    def write(self, text):
+        self._handler.send({self._name: text})
+        return len(text)
+
+
+def client_parser(stdout, stderr):
+    """Build main.py's parser so that help, usage and errors are written to the client"""
+    class ClientParser(argparse.ArgumentParser):
+        def _print_message(self, message, file=None):
+            if message:
+                (stderr if file is sys.stderr else stdout).write(message)
+
+    return main.build_parser(ClientParser)
+
+
+class CommandHandler(socketserver.StreamRequestHandler):
+    def send(self, message):
+        self.wfile.write(json.dumps(message).encode() + b"\n")
+        self.wfile.flush()
+
+
+    def prompt(self, text):
+        self.send({"prompt": text})
+        return json.loads(self.rfile.readline())["answer"]
+
+
+    def run(self, repository, request, stdout, stderr):
+        parser = client_parser(stdout, stderr)
+        repository.private_key = request.get("private_key") or os.getenv("VCS_PRIVATE_KEY") or None
+        repository.output = stdout
+        try:
+            main.main(parser.parse_args(request["argv"]), repository, parser, self.prompt)
+        finally:
+            # Neither is kept for the next command, which may come from another client
+            repository.private_key = None
+            repository.output = None
+
+
+    def handle(self):
+        request = json.loads(self.rfile.readline())
+
+        stdout, stderr = _ClientStream(self, "stdout"), _ClientStream(self, "stderr")
+
+        status = 0
+        try:
+            with self.server.repository(request["cwd"]) as repository:
+                self.run(repository, request, stdout, stderr)
+        except SystemExit as e:
+            # argparse exits for help and bad arguments
+            status = e.code if isinstance(e.code, int) else int(e.code is not None)
+        except Exception:
+            traceback.print_exc(file=stderr)
+            status = 1
+
+        self.send({"exit": status})
+
+
+class DaemonServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # A repository and a lock for every working tree a command has been run in
+        self._repositories = {}
+        self._lock = threading.Lock()
+
+
+    @contextlib.contextmanager
+    def repository(self, path):
+        """Hold the repository of the working tree at path for a command"""
+        path = os.path.realpath(path)
+        with self._lock:
+            if path not in self._repositories:
+                self._repositories[path] = (vcs.Repository(path), threading.Lock())
+            repository, lock = self._repositories[path]
+
+        with lock:
+            yield repository
+
+
+def is_running(socket_path):
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with connection:
+        try:
+            connection.connect(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return False
+    return True
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--socket", default=SOCKET_PATH, help=f"The Unix socket to listen on, also set with VCS_DAEMON_SOCKET (default {SOCKET_PATH})")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    if is_running(args.socket):
+        sys.exit(f"A daemon is already listening on {args.socket}")
+    if os.path.exists(args.socket):
+        # Left behind by a daemon that was killed
+        os.remove(args.socket)
+
+    # Only the user running the daemon may connect to it, the commands run with their files and keys
+    umask = os.umask(0o077)
+    server = DaemonServer(args.socket, CommandHandler)
+    os.umask(umask)
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    print(f"Listening on {args.socket}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(args.socket)
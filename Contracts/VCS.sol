@@ -57,16 +57,61 @@ contract Repository {
         address[] editors;
     }
 
+    // A range of consecutive file ids [start, end) that belong to the same commit
+    struct FileRange {
+        uint start;
+        uint end;
+    }
+
     // Where the branch, commit and file data is acutally stored
     Branch[] public branches;
     Commit[] public commits;
     File[] public files;
 
+    // The most recent finalized commit on each branch, indexed by branch id
+    uint[] branchHeads;
+
+    // The ids of the finalized commits on each branch in the order they were finalized, indexed by branch id
+    mapping(uint => uint[]) branchCommits;
+
+    // The files of a commit are pushed onto the files array together, so they are kept as ranges [start, end) of file ids, indexed by commit id
+    mapping(uint => FileRange[]) commitFileRanges;
+
+    // Commits made by forking or squash merging share the file set of the commit they were copied from instead of copying every file, indexed by commit id.
+    // 0 means the commit has its own files, the null commit has no files so it never needs to be shared
+    mapping(uint => uint) fileSetSource;
+
+    // The sha2-256 digests of the ipfs hashes of files added with MakeCommitPacked or AddFilesToCommitPacked, the ipfsHash of those files is left empty. Indexed by file id
+    mapping(uint => bytes32) public fileDigests;
+
+    // Lets clients tell which functions this version of the contract supports, contracts deployed before this was added have none
+    uint public constant VERSION = 5;
+
+    // The block the repository was deployed in, nothing in the repository's history is older so searches of its event logs can stop here
+    uint public deploymentBlock;
+
+    // Commits that are being built up over several transactions, these are not the most recent commit on their branch until they are finalized
+    mapping(uint => bool) public pendingCommits;
+
+    // Emitted when a commit is started with BeginCommit so the author can find out its id
+    event CommitStarted(uint indexed commitID, address indexed author);
+
+    // Emitted when a commit becomes the most recent commit on its branch, so the history of a branch or author can be read with eth_getLogs
+    event CommitCreated(uint indexed commitID, uint indexed branchID, address indexed author, uint previous, bool multi_parent, uint previous2, uint creation_time, string comment);
+
+    // Emitted when a branch is created by forking an existing branch
+    event BranchForked(uint indexed branchID, uint indexed sourceBranchID, address indexed owner, string name);
+
+    // Emitted when an editor is added to or removed from a branch
+    event EditorChanged(uint indexed branchID, address indexed editor, bool added);
+
 
     constructor(string memory _name) {
         // Set the repository owner to the person deploying this smart contract
         owner = msg.sender;
 
+        deploymentBlock = block.number;
+
         // Create the mainline branch
         Branch memory b = Branch(owner, "mainline", new address[](0));     
 
@@ -77,7 +122,8 @@ contract Repository {
         branches[branches.length-1].editors.push(owner);
 
         // Create an initial commit on the mainline branch with no files in it
-        commits.push(Commit(owner, 0, "Null Commit", block.timestamp, 0, false, 0));
+        branchHeads.push(0);
+        PushCommit(Commit(owner, 0, "Null Commit", block.timestamp, 0, false, 0), false);
 
         // Set the repository name
         name = _name;
@@ -134,26 +180,27 @@ contract Repository {
     function GetCommitsCount(uint _branchID) public view returns (uint) {
         require(_branchID < branches.length, "Incorrect Branch ID - GetCommitsCount");
 
-        uint commitCount = 0;
-        for(uint i = 0; i < commits.length; i++){
-            if (commits[i].parentBranchId == _branchID) {
-                commitCount++;
-            }
-        }
-        return commitCount;
+        return branchCommits[_branchID].length;
+    }
+
+    // Function that returns the id of the commit that the files of a commit are stored under
+    function GetFileSetCommit(uint _commitID) public view returns (uint) {
+        require(_commitID < commits.length, "Incorrect Commit ID - GetFileSetCommit");
+
+        uint source = fileSetSource[_commitID];
+
+        return source == 0 ? _commitID : source;
     }
 
     // Function that returns the total number of files in a commit
     function GetFilesCount(uint _commitID) public view returns (uint) {
         require(_commitID < commits.length, "Incorrect Commit ID - GetFilesCount");
 
-        uint fileCount = 0;
+        FileRange[] storage ranges = commitFileRanges[GetFileSetCommit(_commitID)];
 
-        uint i;
-        for(i = 0; i < files.length; i++){
-            if (files[i].parentCommit == _commitID) {
-                fileCount++;
-            }
+        uint fileCount = 0;
+        for(uint i = 0; i < ranges.length; i++){
+            fileCount += ranges[i].end - ranges[i].start;
         }
 
         return fileCount;
@@ -168,11 +215,13 @@ contract Repository {
 
         uint[] memory _files = new uint[](fileCount);
 
+        FileRange[] storage ranges = commitFileRanges[GetFileSetCommit(commitID)];
+
         uint it = 0;
 
-        for(uint i = 0; i < files.length; i++){
-            if(files[i].parentCommit == commitID){
-                _files[it++] = i;
+        for(uint i = 0; i < ranges.length; i++){
+            for(uint j = ranges[i].start; j < ranges[i].end; j++){
+                _files[it++] = j;
             }
         }
 
@@ -183,19 +232,7 @@ contract Repository {
     function GetCommitsFromBranch(uint branchID) public view returns(uint[] memory){
         require(branchID < branches.length, "Incorrect Branch ID - GetCommitsFromBranch");
 
-        uint commitCount = GetCommitsCount(branchID);
-
-        uint[] memory _commits = new uint[](commitCount);
-
-        uint it = 0;
-
-        for(uint i = 0; i < files.length; i++){
-            if(commits[i].parentBranchId == branchID){
-                _commits[it++] = i;
-            }
-        }
-
-        return _commits;
+        return branchCommits[branchID];
     }
 
     // Function that returns the most recent commit on a given branch
@@ -203,41 +240,88 @@ contract Repository {
         //Check that the given branch is going to exist
         require(_branchID < branches.length, "Incorrect Branch ID - MostRecentCommitID");
 
-        // Iterate backwards through all the commits to find the most recent commit on the given branch
-        uint i;
-        for(i = uint(commits.length)-1; i>=0; i--){
-            if (commits[i].parentBranchId == _branchID){
-                break;
-            }
+        return branchHeads[_branchID];
+    }
+
+    // An Internal function for adding a new commit, keeping the per branch indexes up to date
+    function PushCommit(Commit memory _commit, bool pending) internal returns(uint) {
+        commits.push(_commit);
+
+        uint commitID = commits.length-1;
+
+        if (pending) {
+            // Only added to the branch by FinalizeCommit, until then it may be missing some of its files
+            pendingCommits[commitID] = true;
+        } else {
+            branchCommits[_commit.parentBranchId].push(commitID);
+            branchHeads[_commit.parentBranchId] = commitID;
+            EmitCommitCreated(commitID);
         }
 
-        // Return that commit
-        return i;
+        return commitID;
+    }
+
+
+    // An Internal function to announce a commit once it is visible on its branch
+    function EmitCommitCreated(uint commitID) internal {
+        Commit storage commit = commits[commitID];
+        emit CommitCreated(commitID, commit.parentBranchId, commit.author, commit.previous, commit.multi_parent, commit.previous2, commit.creation_time, commit.comment);
     }
 
-    // Function that returns a list of IDs of files given the id of a commit
-    function GetFilesForCommit(uint _commitID) internal view returns(File[] memory) {
-        require(_commitID < commits.length, "Incorrect Commit ID - GetFilesForCommit");
 
+    // An Internal function for adding a list of new files to a given commit
+    function AddFiles(string[] memory file_paths, string[] memory ipfs_hashes, uint commitID) internal {
+        require(file_paths.length == ipfs_hashes.length);
+
+        uint start = files.length;
+
+        for(uint i = 0; i < file_paths.length; i++){
+            files.push(File(file_paths[i], ipfs_hashes[i], commitID));
+        }
+
+        RecordFileRange(commitID, start);
+    }
 
-        uint fileCount = GetFilesCount(_commitID);
 
-        File[] memory _files = new File[](fileCount);
+    // An Internal function for adding a list of new files to a given commit from the packed format. Each file is a 2 byte big endian length,
+    // followed by that many bytes of file path, followed by the 32 byte sha2-256 digest of its ipfs hash
+    function AddFilesPacked(bytes calldata files_data, uint commitID) internal {
+        uint start = files.length;
 
-        uint j = 0;
-        for(uint i = 0; i < files.length; i++){
-            if(files[i].parentCommit == _commitID) {
-                _files[j++] = files[i];
+        uint it = 0;
+        while(it < files_data.length){
+            require(it + 2 <= files_data.length, "Incomplete file entry");
+            uint pathLength = uint(uint8(files_data[it])) << 8 | uint(uint8(files_data[it+1]));
+            it += 2;
+
+            require(it + pathLength + 32 <= files_data.length, "Incomplete file entry");
+            bytes memory filePath = files_data[it:it+pathLength];
+            it += pathLength;
+
+            bytes32 digest;
+            assembly {
+                digest := calldataload(add(files_data.offset, it))
             }
+            it += 32;
+
+            files.push(File(string(filePath), "", commitID));
+            fileDigests[files.length-1] = digest;
         }
 
-        return _files;
+        RecordFileRange(commitID, start);
     }
 
 
-    // An Internal function for adding a new file to a given commit
-    function AddFile(string memory file_path, string memory ipfs_hash, uint commitID) internal {
-        files.push(File(file_path, ipfs_hash, commitID));
+    // An Internal function that records the files pushed since start as belonging to the given commit
+    function RecordFileRange(uint commitID, uint start) internal {
+        FileRange[] storage ranges = commitFileRanges[commitID];
+
+        if (ranges.length > 0 && ranges[ranges.length-1].end == start) {
+            // Carries straight on from the previous batch of files
+            ranges[ranges.length-1].end = files.length;
+        } else if (files.length > start) {
+            ranges.push(FileRange(start, files.length));
+        }
     }
 
 
@@ -246,27 +330,19 @@ contract Repository {
 
         require(previous_commit == MostRecentCommitID(_branchID), "Unable to add commit, previous commit is not the most recent commit made on this branch");
 
-        string[] memory file_paths = splitString(file_paths_string);
-        string[] memory ipfs_hashes = splitString(ipfs_hashes_string);
-
-        require(file_paths.length == ipfs_hashes.length);
-
-        commits.push(Commit(msg.sender, _branchID, _comment, block.timestamp, previous_commit, false, 0));
+        uint commitID = PushCommit(Commit(msg.sender, _branchID, _comment, block.timestamp, previous_commit, false, 0), false);
 
-        for(uint i = 0; i < file_paths.length; i++){
-            AddFile(file_paths[i], ipfs_hashes[i], uint(commits.length-1));
-        }
+        AddFiles(splitString(file_paths_string), splitString(ipfs_hashes_string), commitID);
     }
 
 
-    // An Internal function to create a new commit similar to the function above, this is used by the ForkNewBranch function to clone a commit onto a new branch
-    function MakeCommitInternal(uint _branchID, uint previous_commit, string memory _comment, File[] memory _files) internal CheckBranchAccess(_branchID) {
+    // An Internal function to create a new commit similar to the function above, this is used by the ForkNewBranch function to clone a commit onto a new branch.
+    // The new commit shares the files of the source commit so the cost does not depend on how many files there are
+    function MakeCommitInternal(uint _branchID, uint previous_commit, string memory _comment, uint source_commit) internal CheckBranchAccess(_branchID) {
 
-        commits.push(Commit(msg.sender, _branchID, _comment, block.timestamp, previous_commit, false, 0));
+        uint commitID = PushCommit(Commit(msg.sender, _branchID, _comment, block.timestamp, previous_commit, false, 0), false);
 
-        for(uint i = 0; i < _files.length; i++){
-            AddFile(_files[i].filePath, _files[i].ipfsHash, uint(commits.length-1));
-        }
+        fileSetSource[commitID] = GetFileSetCommit(source_commit);
     }
 
 
@@ -279,15 +355,16 @@ contract Repository {
         Branch memory newBranch = Branch(owner, _name, new address[](0));
 
         branches.push(newBranch);
+        branchHeads.push(0);
         
         // Add the owner of the branch as an editor
         branches[branches.length-1].editors.push(owner);
 
-        uint commitID = MostRecentCommitID(_sourceBranch);
+        emit BranchForked(branches.length-1, _sourceBranch, owner, _name);
 
-        File[] memory _files = GetFilesForCommit(commitID);
+        uint commitID = MostRecentCommitID(_sourceBranch);
 
-        MakeCommitInternal(uint(branches.length-1), commitID, commits[commitID].comment, _files);
+        MakeCommitInternal(uint(branches.length-1), commitID, commits[commitID].comment, commitID);
     }
 
     // An External function used to create a squash merge between parent branch and child branch, a single commit is created in the parent branch that has all the changes from the child branch in it
@@ -296,10 +373,8 @@ contract Repository {
         // Get the most recent commit on the child branch
         uint commitID = MostRecentCommitID(child_branch);
 
-        // Get a copy of all the files for that commit
-        File[] memory _files = GetFilesForCommit(commitID);
-
-        MakeCommitInternal(parent_branch, commitID, _comment, _files);
+        // The squash commit has exactly the files of that commit
+        MakeCommitInternal(parent_branch, commitID, _comment, commitID);
     }
 
     // An External function to be used in a transaction to create a new commit with 2 parents
@@ -307,16 +382,67 @@ contract Repository {
 
         require(previous_commit == MostRecentCommitID(parent_branch), "Unable to add commit, previous commit is not the most recent commit made on this branch");
 
-        string[] memory file_paths = splitString(file_paths_string);
-        string[] memory ipfs_hashes = splitString(ipfs_hashes_string);
+        uint commitID = PushCommit(Commit(msg.sender, parent_branch, _comment, block.timestamp, previous_commit, true, previous2_commit), false);
 
-        require(file_paths.length == ipfs_hashes.length);
+        AddFiles(splitString(file_paths_string), splitString(ipfs_hashes_string), commitID);
+    }
 
-        commits.push(Commit(msg.sender, parent_branch, _comment, block.timestamp, previous_commit, true, previous2_commit));
 
-        for(uint i = 0; i < file_paths.length; i++){
-            AddFile(file_paths[i], ipfs_hashes[i], uint(commits.length-1));
-        }
+    // An External function to create a new commit with either 1 or 2 parents, taking the files in the packed format described by AddFilesPacked.
+    // This is cheaper than splitting strings and allows file paths to contain any character
+    function MakeCommitPacked(uint _branchID, uint previous_commit, bool multi_parent, uint previous2_commit, string calldata _comment, bytes calldata files_data) external CheckBranchAccess(_branchID) {
+
+        require(previous_commit == MostRecentCommitID(_branchID), "Unable to add commit, previous commit is not the most recent commit made on this branch");
+
+        uint commitID = PushCommit(Commit(msg.sender, _branchID, _comment, block.timestamp, previous_commit, multi_parent, previous2_commit), false);
+
+        AddFilesPacked(files_data, commitID);
+    }
+
+
+    // An External function to start a commit whose files are too many to fit in a single transaction, the files are then added with AddFilesToCommit and the commit is made visible with FinalizeCommit
+    function BeginCommit(uint _branchID, uint previous_commit, bool multi_parent, uint previous2_commit, string calldata _comment) external CheckBranchAccess(_branchID) {
+
+        require(previous_commit == MostRecentCommitID(_branchID), "Unable to add commit, previous commit is not the most recent commit made on this branch");
+
+        uint commitID = PushCommit(Commit(msg.sender, _branchID, _comment, block.timestamp, previous_commit, multi_parent, previous2_commit), true);
+
+        emit CommitStarted(commitID, msg.sender);
+    }
+
+
+    // An External function to add a batch of files to a commit started with BeginCommit
+    function AddFilesToCommit(uint _commitID, string calldata file_paths_string, string calldata ipfs_hashes_string) external CheckCommitAccess(_commitID) {
+
+        require(pendingCommits[_commitID], "Unable to add files, the commit has already been finalized");
+
+        AddFiles(splitString(file_paths_string), splitString(ipfs_hashes_string), _commitID);
+    }
+
+
+    // An External function to add a batch of files to a commit started with BeginCommit, in the same format as MakeCommitPacked
+    function AddFilesToCommitPacked(uint _commitID, bytes calldata files_data) external CheckCommitAccess(_commitID) {
+
+        require(pendingCommits[_commitID], "Unable to add files, the commit has already been finalized");
+
+        AddFilesPacked(files_data, _commitID);
+    }
+
+
+    // An External function to finish a commit started with BeginCommit, making it the most recent commit on its branch
+    function FinalizeCommit(uint _commitID) external CheckCommitAccess(_commitID) {
+
+        require(pendingCommits[_commitID], "Unable to finalize commit, the commit has already been finalized");
+
+        Commit storage commit = commits[_commitID];
+
+        require(commit.previous == MostRecentCommitID(commit.parentBranchId), "Unable to finalize commit, previous commit is not the most recent commit made on this branch");
+
+        pendingCommits[_commitID] = false;
+        branchCommits[commit.parentBranchId].push(_commitID);
+        branchHeads[commit.parentBranchId] = _commitID;
+
+        EmitCommitCreated(_commitID);
     }
 
 
@@ -333,6 +459,8 @@ contract Repository {
 
         // append the editor to the list of approved branch editors
         branches[_branchID].editors.push(new_editor);
+
+        emit EditorChanged(_branchID, new_editor, true);
     }
 
     // Extern function to remove an editor from a branch
@@ -356,6 +484,8 @@ contract Repository {
 
         // delete the last element
         delete branches[_branchID].editors[branches[_branchID].editors.length-1];
+
+        emit EditorChanged(_branchID, editor, false);
     }
 
     function GetBranchEditors(uint _branchID) view external returns(address[] memory) {
@@ -1,7 +1,14 @@
 #!/bin/sh
 
+# Stop at the first failure rather than leaving a half written build behind
+set -e
+cd "$(dirname "$0")"
+
 # Delete any previous builds
 rm -rf ./target/
 
 # Compile the Smart Contract
 solc --abi --bin ./VCS.sol -o target
+
+# The client refuses to deploy a .bin that is missing functions of the .abi, check the pair now
+python3 ../Client/eth_wrapper.py